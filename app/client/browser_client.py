@@ -1,31 +1,177 @@
 import asyncio
 import json
 import os
-from typing import Optional
-
+import re
+import time
+from typing import Callable, Optional
+
+from client.page_scripts import (
+    ASSISTANT_MESSAGE_SELECTOR,
+    COMPOSER_READY_SCRIPT,
+    COMPOSER_TEXT_SCRIPT,
+    EVENT_BINDING,
+    NETWORK_TAP_SCRIPT,
+    PAGE_SNAPSHOT_SCRIPT,
+    PASTE_TEXT_SCRIPT,
+    POPUP_BUTTON_TEXTS,
+    POPUP_CONTAINER_SELECTOR,
+    POPUP_MARK_ATTRIBUTE,
+    POPUP_SCAN_SCRIPT,
+    RATE_LIMIT_PATTERNS,
+    RATE_LIMIT_SCRIPT,
+    RESPONSE_OBSERVER_SCRIPT,
+    RESPONSE_STARTED_SCRIPT,
+    TYPING_SELECTORS,
+    USER_MESSAGE_SELECTOR,
+    USER_TURN_SCRIPT,
+)
+from client.selector_registry import selector_registry
+from client.stream_parser import ConversationStreamParser, DeltaRelay
+from services.metrics import (
+    BLOCKED_REQUESTS_TOTAL,
+    GENERATION_SECONDS,
+    PAGE_LOAD_SECONDS,
+    PAGE_SNAPSHOT_SECONDS,
+    PROMPT_INPUT_SECONDS,
+    RECONNECT_ATTEMPTS_TOTAL,
+    RENDERER_JS_HEAP_BYTES,
+    RENDERER_TASK_SECONDS,
+    TIME_TO_FIRST_TOKEN_SECONDS,
+)
 from dotenv import load_dotenv
-from playwright.async_api import Page, async_playwright
+from playwright.async_api import Browser, Page, async_playwright
 
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
-CHATGPT_URL = "https://chatgpt.com/"
+# Адрес ChatGPT (для нагрузочных тестов - локальная заглушка bench/fake_chatgpt.py)
+CHATGPT_URL = os.getenv("CHATGPT_URL", "https://chatgpt.com/")
 WAIT_TIMEOUT = 45000  # 45 секунд в миллисекундах для Playwright
 
 # Определяем абсолютный путь к корневой папке проекта через pyproject.toml
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 COOKIES_PATH = os.path.join(PROJECT_ROOT, "cookies.json")
 
+# Максимальное время ожидания ответа в секундах
+RESPONSE_MAX_WAIT = 300
+# Если от observer нет событий дольше этого времени, состояние страницы
+# проверяется напрямую (страховка на случай пропущенного события)
+RESPONSE_IDLE_CHECK = 5.0
+# Сколько ждать конца сетевого потока после того, как DOM сообщил о конце
+# генерации: перехваченная копия потока может отставать от самой страницы
+STREAM_END_GRACE = 3.0
+# Источник ответа: "network" - SSE-поток /backend-api/conversation
+# (DOM используется как запасной вариант), "dom" - только DOM страницы
+ANSWER_CAPTURE_MODE = os.getenv("ANSWER_CAPTURE_MODE", "network").lower()
+
+# Ожидание готовности страницы вместо фиксированных пауз (мс)
+PROMPT_ACCEPT_TIMEOUT = 15000  # Появление сообщения пользователя в ленте
+RESPONSE_START_TIMEOUT = 60000  # Начало ответа ассистента
+COMPOSER_READY_TIMEOUT = 10000  # Разблокировка поля ввода после ответа
+POPUP_CLICK_TIMEOUT = 3000  # Клик по кнопке найденного всплывающего окна
+PAGE_READY_TIMEOUT = 5000  # Появление интерфейса чата после загрузки страницы
+INPUT_FIND_TIMEOUT = 7000  # Появление поля ввода сообщения
+# Сколько всплывающих окон подряд закрывается за один проход
+POPUP_MAX_CLICKS = 3
+# Имя кнопки всплывающего окна для обработчика page.add_locator_handler
+POPUP_BUTTON_PATTERN = re.compile(
+    r"^\s*(" + "|".join(re.escape(text) for text in POPUP_BUTTON_TEXTS) + r")(\s|$)",
+    re.IGNORECASE,
+)
+STOP_CLICK_TIMEOUT = 3000  # Нажатие кнопки остановки при отмене запроса
+SEND_CONFIRM_TIMEOUT = 2000  # Появление запроса в ленте после нажатия Enter
+SEND_CLICK_TIMEOUT = 3000  # Нажатие кнопки отправки, если Enter не сработал
+
+# Профиль запуска браузера: headed (окно, по умолчанию), headless
+# или low_resource (headless без GPU, расширений и фоновой сети,
+# с блокировкой тяжелых ресурсов страницы)
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "headed").lower()
+
+# Аргументы Chromium, общие для всех профилей
+BASE_BROWSER_ARGS = [
+    "--disable-blink-features=AutomationControlled",
+    "--disable-features=VizDisplayCompositor",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+
+LAUNCH_PROFILES = {
+    "headed": {"headless": False, "args": [], "block_resources": False},
+    "headless": {
+        "headless": True,
+        "args": ["--headless=new"],
+        "block_resources": False,
+    },
+    "low_resource": {
+        "headless": True,
+        "args": [
+            "--headless=new",
+            "--disable-gpu",
+            "--disable-extensions",
+            "--disable-background-networking",
+            "--disable-component-update",
+            "--disable-default-apps",
+            "--disable-sync",
+            "--disable-dev-shm-usage",
+            "--mute-audio",
+            "--no-first-run",
+        ],
+        "block_resources": True,
+    },
+}
+
+# Блокировку ресурсов можно включить или выключить независимо от профиля
+BLOCK_RESOURCES = os.getenv("BLOCK_RESOURCES")
+
+# Типы запросов, не нужные для работы с чатом
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+# Аналитика и телеметрия страницы
+BLOCKED_URL_PATTERNS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "segment.io",
+    "cdn.segment.com",
+    "browser-intake-datadoghq.com",
+    "sentry.io",
+    "intercom.io",
+    "chatgpt.com/ces/",
+)
+
 
 class BrowserClient:
-    def __init__(self):
+    def __init__(
+        self,
+        browser: Browser | None = None,
+        email: Optional[str] = None,
+        password: Optional[str] = None,
+        cookies_path: str = COOKIES_PATH,
+    ):
         self.playwright = None
-        self.browser = None
+        # Если браузер передан извне, клиент работает как дополнительная вкладка
+        # в собственном контексте и не управляет жизненным циклом браузера
+        self.browser = browser
+        self._owns_browser = browser is None
+        # Перезапускать ли браузер самостоятельно, если вкладку не удалось пересоздать
+        self.restart_browser_on_failure = True
+        # Тред ChatGPT, в котором продолжается диалог (None - обычный режим).
+        # При пересоздании вкладки открывается он, а не новый чат
+        self.thread_url: Optional[str] = None
         self.page: Page | None = None
         self.context = None
+        # События от скриптов в странице для текущего запроса
+        self._events: asyncio.Queue | None = None
+        # Получатель приращений ответа текущего запроса и уже отданный текст
+        self._on_delta: Optional[Callable[[str], None]] = None
+        self._emitted = ""
+        # Момент отправки промпта, пока не получен первый фрагмент ответа
+        self._sent_at: Optional[float] = None
+        # Файл сессии аккаунта (cookies и статус авторизации)
+        self.cookies_path = cookies_path
         self.auth_data = {
-            "email": os.getenv("EMAIL_ADDRESS", ""),
-            "password": os.getenv("PASSWORD", ""),
+            "email": os.getenv("EMAIL_ADDRESS", "") if email is None else email,
+            "password": os.getenv("PASSWORD", "") if password is None else password,
             "verification_code": "",
         }
         self.auth_status = {
@@ -38,17 +184,14 @@ class BrowserClient:
 
     async def initialize(self):
         """Инициализация браузера"""
-        self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(
-            headless=False,  # Показываем браузер для отладки
-            args=[
-                "--disable-blink-features=AutomationControlled",
-                "--disable-features=VizDisplayCompositor",
-                "--disable-background-timer-throttling",
-                "--disable-backgrounding-occluded-windows",
-                "--disable-renderer-backgrounding",
-            ],
-        )
+        profile = self._launch_profile()
+        if self.browser is None:
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(
+                headless=profile["headless"],
+                args=BASE_BROWSER_ARGS + profile["args"],
+            )
+            print(f"🌐 Браузер запущен с профилем {BROWSER_PROFILE}")
 
         # Создаем контекст с пользовательским агентом
         self.context = await self.browser.new_context(
@@ -56,7 +199,19 @@ class BrowserClient:
             user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
         )
 
+        # Картинки, шрифты, медиа и аналитика не нужны для работы с чатом
+        if self._blocks_resources(profile):
+            await self.context.route("**/*", self._route_request)
+
+        # Канал событий из страницы (observer ответа, перехват сетевого потока)
+        await self.context.expose_binding(EVENT_BINDING, self._on_page_event)
+        if ANSWER_CAPTURE_MODE == "network":
+            await self.context.add_init_script(
+                f"({NETWORK_TAP_SCRIPT})({json.dumps(EVENT_BINDING)})"
+            )
+
         self.page = await self.context.new_page()
+        await self._register_popup_handler()
 
         # Отключаем обнаружение автоматизации
         await self.page.add_init_script("""
@@ -67,12 +222,64 @@ class BrowserClient:
 
         self.auth_status["browser_initialized"] = True
 
+    @staticmethod
+    def _launch_profile() -> dict:
+        if BROWSER_PROFILE not in LAUNCH_PROFILES:
+            print(f"⚠️ Неизвестный BROWSER_PROFILE={BROWSER_PROFILE}, используется headed")
+        return LAUNCH_PROFILES.get(BROWSER_PROFILE, LAUNCH_PROFILES["headed"])
+
+    @staticmethod
+    def _blocks_resources(profile: dict) -> bool:
+        if BLOCK_RESOURCES is not None:
+            return BLOCK_RESOURCES.lower() in ("1", "true", "yes")
+        return profile["block_resources"]
+
+    async def _route_request(self, route):
+        """Отклоняет запросы тяжелых ресурсов и аналитики, остальные пропускает"""
+        request = route.request
+        if request.resource_type in BLOCKED_RESOURCE_TYPES:
+            BLOCKED_REQUESTS_TOTAL.inc(request.resource_type)
+            await route.abort()
+        elif any(pattern in request.url for pattern in BLOCKED_URL_PATTERNS):
+            BLOCKED_REQUESTS_TOTAL.inc("analytics")
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _record_page_load(self, elapsed: float):
+        """Фиксирует время загрузки и нагрузку рендерера (CDP Performance)"""
+        PAGE_LOAD_SECONDS.observe(elapsed, BROWSER_PROFILE)
+        task_seconds = heap_mb = None
+        try:
+            session = await self.context.new_cdp_session(self.page)
+            await session.send("Performance.enable")
+            result = await session.send("Performance.getMetrics")
+            await session.detach()
+            values = {item["name"]: item["value"] for item in result.get("metrics", [])}
+            task_seconds = values.get("TaskDuration")
+            heap_bytes = values.get("JSHeapUsedSize")
+            if task_seconds is not None:
+                RENDERER_TASK_SECONDS.set(task_seconds, BROWSER_PROFILE)
+            if heap_bytes is not None:
+                RENDERER_JS_HEAP_BYTES.set(heap_bytes, BROWSER_PROFILE)
+                heap_mb = heap_bytes / 1024 / 1024
+        except Exception as e:
+            print(f"⚠️ Не удалось получить метрики производительности страницы: {e}")
+
+        details = f"профиль {BROWSER_PROFILE}"
+        if task_seconds is not None:
+            details += f", CPU рендерера {task_seconds:.2f} с"
+        if heap_mb is not None:
+            details += f", JS heap {heap_mb:.1f} МБ"
+        print(f"⏱️ ChatGPT загружен за {elapsed:.2f} с ({details})")
+
     async def open_chatgpt(self):
         """Открывает ChatGPT и ждет загрузки"""
         if not self.page:
             raise RuntimeError("Browser page is not initialized")
 
-        await self.page.goto(CHATGPT_URL, wait_until="networkidle")
+        start_time = time.perf_counter()
+        await self.page.goto(self.thread_url or CHATGPT_URL, wait_until="networkidle")
 
         # Ждем загрузки страницы
         await self.page.wait_for_load_state("networkidle")
@@ -80,23 +287,13 @@ class BrowserClient:
         # Обрабатываем все возможные всплывающие окна
         await self._handle_popups()
 
-        # Пробуем разные селекторы для поля ввода
-        selectors = [
-            "textarea",
-            "[data-testid='send-button']",
-            "[placeholder*='Ask']",
-            "[placeholder*='Message']",
-            "[contenteditable='true']",
-            ".prose",
-        ]
-
-        for selector in selectors:
-            try:
-                await self.page.wait_for_selector(selector, timeout=900)
-                print(f"Найден элемент с селектором: {selector}")
-                break
-            except Exception:
-                continue
+        # Ждем элементы интерфейса чата: сначала последний сработавший
+        # селектор, при промахе - все кандидаты параллельно
+        selector, element = await selector_registry.resolve(
+            self.page, "page_ready", timeout=PAGE_READY_TIMEOUT
+        )
+        if element:
+            print(f"Найден элемент с селектором: {selector}")
         else:
             # Если не нашли стандартные селекторы, попробуем найти любой интерактивный элемент
             try:
@@ -110,92 +307,83 @@ class BrowserClient:
                 await self.page.screenshot(path="chatgpt_debug.png")
                 raise
 
+        await self._record_page_load(time.perf_counter() - start_time)
         print("ChatGPT успешно загружен")
 
-    async def _handle_popups(self):
-        """Обрабатывает только настоящие всплывающие окна (cookie, согласия, активации)"""
+    async def open_thread(self, url: Optional[str]):
+        """Переходит в тред ChatGPT по URL или в новый чат (url=None)"""
         if not self.page:
-            return
-
-        print("Проверяем наличие всплывающих окон...")
-
-        # Список селекторов только для настоящих всплывающих окон
-        # Убраны селекторы, которые могут закрывать элементы интерфейса
-        popup_selectors = [
-            # Cookie и согласия (высший приоритет)
-            "button:has-text('Accept all')",
-            "button:has-text('Принять все')",
-            "button:has-text('Accept cookies')",
-            "button:has-text('Принять cookies')",
-            "button:has-text('I agree')",
-            "button:has-text('Я согласен')",
-            # Кнопки Enable и активации
-            "button:has-text('Enable')",
-            "button:has-text('Включить')",
-            "button:has-text('Activate')",
-            "button:has-text('Активировать')",
-            "button:has-text('Allow')",
-            "button:has-text('Разрешить')",
-            "button:has-text('Accept')",
-            "button:has-text('Принять')",
-            "button:has-text('Agree')",
-            "button:has-text('Согласиться')",
-            # Другие кнопки (только для настоящих всплывающих окон)
-            "button:has-text('Got it')",
-            "button:has-text('Понятно')",
-            "button:has-text('OK')",
-            "button:has-text('ОК')",
-            "button:has-text('Dismiss')",
-            "button:has-text('Отклонить')",
-            "button:has-text('Not now')",
-            "button:has-text('Не сейчас')",
-            "button:has-text('Later')",
-            "button:has-text('Позже')",
-        ]
-
-        handled_popups = 0
-        max_attempts = 1  # Только одна попытка для восстановленных сессий
-
-        for attempt in range(max_attempts):
-            popup_found = False
-
-            for selector in popup_selectors:
-                try:
-                    # Ищем элемент с очень коротким таймаутом
-                    element = await self.page.wait_for_selector(selector, timeout=300)
-
-                    if element:
-                        is_visible = await element.is_visible()
-                        is_enabled = await element.is_enabled()
-
-                        if is_visible and is_enabled:
-                            print(f"Найдено всплывающее окно с селектором: {selector}")
+            raise RuntimeError("Browser page is not initialized")
 
-                            # Кликаем на элемент
-                            await element.click()
-                            print(f"Нажата кнопка: {selector}")
-                            handled_popups += 1
-                            popup_found = True
+        self.thread_url = url
+        target = url or CHATGPT_URL
+        if self.page.url.rstrip("/") == target.rstrip("/"):
+            # Вкладка уже в этом треде (или в пустом новом чате)
+            return
 
-                            # Короткая пауза после клика
-                            await asyncio.sleep(0.3)
+        print(f"🧵 Переходим в {'тред ' + url if url else 'новый чат'}")
+        await self.page.goto(target, wait_until="domcontentloaded")
+        selector, element = await selector_registry.resolve(
+            self.page, "composer", timeout=PAGE_READY_TIMEOUT
+        )
+        if not element:
+            raise RuntimeError(f"Поле ввода не появилось после перехода в {target}")
 
-                            # Прерываем цикл по селекторам и начинаем заново
-                            break
+    async def _handle_popups(self):
+        """Закрывает настоящие всплывающие окна (cookie, согласия, активации).
 
-                except Exception:
-                    # Игнорируем ошибки поиска элементов
-                    continue
+        Все кнопки-кандидаты проверяются одним page.evaluate, поэтому
+        отсутствие всплывающих окон стоит один вызов, а не ожидание
+        каждого селектора по очереди.
+        """
+        if not self.page:
+            return
 
-            # Если в этой попытке не нашли поп-апов, выходим
-            if not popup_found:
-                break
+        print("Проверяем наличие всплывающих окон...")
+        handled_popups = await self._dismiss_popups()
 
         if handled_popups > 0:
             print(f"✅ Обработано всплывающих окон: {handled_popups}")
         else:
             print("ℹ️ Всплывающие окна не найдены")
 
+    async def _dismiss_popups(self) -> int:
+        """Нажимает кнопки всплывающих окон, пока они находятся, и возвращает их число"""
+        handled_popups = 0
+        for _ in range(POPUP_MAX_CLICKS):
+            try:
+                text = await self.page.evaluate(
+                    POPUP_SCAN_SCRIPT,
+                    {"texts": POPUP_BUTTON_TEXTS, "mark": POPUP_MARK_ATTRIBUTE},
+                )
+                if not text:
+                    break
+                print(f"Найдено всплывающее окно с кнопкой: {text}")
+                await self.page.click(
+                    f"[{POPUP_MARK_ATTRIBUTE}]", timeout=POPUP_CLICK_TIMEOUT
+                )
+                print(f"Нажата кнопка: {text}")
+                handled_popups += 1
+            except Exception as e:
+                print(f"⚠️ Не удалось закрыть всплывающее окно: {e}")
+                break
+        return handled_popups
+
+    async def _register_popup_handler(self):
+        """Закрывает всплывающие окна при их появлении во время действий со страницей"""
+        popup = self.page.locator(POPUP_CONTAINER_SELECTOR).filter(
+            has=self.page.get_by_role("button", name=POPUP_BUTTON_PATTERN)
+        )
+
+        async def dismiss(_locator):
+            if await self._dismiss_popups():
+                print("✅ Всплывающее окно закрыто обработчиком")
+
+        try:
+            await self.page.add_locator_handler(popup, dismiss, no_wait_after=True)
+        except Exception as e:
+            print(f"⚠️ Не удалось зарегистрировать обработчик всплывающих окон: {e}")
+
     async def _provide_email(self):
         if not self.page:
             raise RuntimeError("Browser page is not initialized")
@@ -578,11 +766,21 @@ class BrowserClient:
             print(f"ℹ️ Ошибка при проверке кода подтверждения: {e}")
             return False
 
-    async def send_and_get_answer(self, prompt: str) -> str:
-        """Отправляет запрос и получает ответ"""
+    async def send_and_get_answer(
+        self, prompt: str, on_delta: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Отправляет запрос и получает ответ.
+
+        Если передан on_delta, он вызывается с каждым новым фрагментом
+        ответа по мере генерации.
+        """
         if not self.page:
             return "Ошибка: браузер не инициализирован"
 
+        self._on_delta = on_delta
+        self._emitted = ""
+        self._sent_at = None
+
         try:
             # Очищаем предыдущий ответ перед отправкой нового запроса
             await self._clear_previous_response()
@@ -592,26 +790,238 @@ class BrowserClient:
             if not input_element:
                 return "Ошибка: не найдено поле ввода"
 
-            # Быстрая очистка и ввод
-            await input_element.click()
-            await input_element.fill("")
-            await input_element.type(prompt, delay=10)  # Минимальная задержка
+            # Запоминаем состояние ленты, чтобы отличить новый ответ от старого
+            snapshot = await self._get_page_snapshot()
+            user_baseline = snapshot.get("userCount", 0)
+            assistant_baseline = snapshot.get("assistantCount", 0)
+
+            # Подписываемся на изменения ответа до отправки запроса
+            self._events = asyncio.Queue()
+            observer_ready = await self._install_response_observer(assistant_baseline)
+            if not observer_ready and ANSWER_CAPTURE_MODE != "network":
+                self._events = None
+
+            # Ввод всего текста одной операцией
+            if not await self._input_prompt(input_element, prompt):
+                return "Ошибка: не удалось ввести запрос в поле ввода"
 
             # Отправка
-            await input_element.press("Enter")
+            sent_at = self._sent_at = time.perf_counter()
+            await self._submit_prompt(input_element, user_baseline)
             print("Запрос отправлен, ожидаем ответ...")
 
-            # ДОБАВЛЯЕМ ЗАДЕРЖКУ 5 СЕКУНД после отправки запроса
-            print("Ждем 5 секунд перед началом проверки ответа...")
-            await asyncio.sleep(5)
+            # Ждем, пока запрос появится в ленте и ассистент начнет отвечать
+            await self._wait_for_generation_start(user_baseline, assistant_baseline)
 
             # Ждем завершения генерации
             answer = await self._wait_for_response_complete()
+            GENERATION_SECONDS.observe(time.perf_counter() - sent_at)
+
+            # Следующий запрос можно вводить сразу после разблокировки поля
+            await self._wait_for_composer_ready()
             return answer
 
+        except asyncio.CancelledError:
+            # Клиент отказался от ответа или истек срок запроса:
+            # останавливаем генерацию, чтобы вкладка освободилась
+            await self._stop_generation()
+            raise
         except Exception as e:
             print(f"Ошибка при отправке запроса: {e}")
             return f"Ошибка: {str(e)}"
+        finally:
+            self._events = None
+            self._on_delta = None
+            self._sent_at = None
+
+    async def _input_prompt(self, input_element, prompt: str) -> bool:
+        """Вводит промпт целиком, не печатая его посимвольно.
+
+        Способы пробуются по очереди, после каждого проверяется, что поле
+        содержит весь текст. Время ввода не зависит от длины промпта.
+        """
+        if not self.page:
+            return False
+
+        start_time = time.perf_counter()
+        await input_element.click()
+
+        async def fill():
+            await input_element.fill(prompt)
+
+        async def insert_text():
+            await input_element.fill("")
+            await self.page.keyboard.insert_text(prompt)
+
+        async def paste():
+            await input_element.fill("")
+            await input_element.evaluate(PASTE_TEXT_SCRIPT, prompt)
+
+        async def type_text():
+            # Самый медленный способ - только если остальные не сработали
+            await input_element.fill("")
+            await input_element.type(prompt)
+
+        for name, method in (
+            ("fill", fill),
+            ("insert_text", insert_text),
+            ("paste", paste),
+            ("type", type_text),
+        ):
+            try:
+                await method()
+                if await self._composer_contains(input_element, prompt):
+                    elapsed = time.perf_counter() - start_time
+                    PROMPT_INPUT_SECONDS.observe(elapsed)
+                    print(
+                        f"Промпт введен ({len(prompt)} символов, {name}) за {elapsed:.2f} с"
+                    )
+                    return True
+                print(f"⚠️ Способ ввода {name} ввел текст не полностью")
+            except Exception as e:
+                print(f"⚠️ Способ ввода {name} не сработал: {e}")
+
+        return False
+
+    async def _composer_contains(self, input_element, prompt: str) -> bool:
+        """Проверяет, что поле ввода содержит весь промпт"""
+        text = await input_element.evaluate(COMPOSER_TEXT_SCRIPT)
+        # Редакторы по-разному представляют переносы строк и пробелы
+        return " ".join(str(text).split()) == " ".join(prompt.split())
+
+    def _emit_progress(self, text: str):
+        """Передает получателю новую часть ответа, если текст дописался.
+
+        Через этот метод проходит любой текст ответа, поэтому здесь же
+        фиксируется время до первого фрагмента.
+        """
+        if text and self._sent_at is not None:
+            TIME_TO_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - self._sent_at)
+            self._sent_at = None
+        if not self._on_delta or not text.startswith(self._emitted):
+            return
+        delta = text[len(self._emitted):]
+        if not delta:
+            return
+        self._emitted = text
+        try:
+            self._on_delta(delta)
+        except Exception as e:
+            print(f"⚠️ Ошибка в обработчике фрагмента ответа: {e}")
+
+    def _on_page_event(self, source, event):
+        """Принимает события от скриптов, внедренных в страницу"""
+        if self._events is not None and isinstance(event, dict):
+            self._events.put_nowait(event)
+
+    async def _submit_prompt(self, input_element, user_baseline: int):
+        """Отправляет введенный промпт клавишей Enter, при неудаче - кнопкой отправки"""
+        await input_element.press("Enter")
+        try:
+            await self.page.wait_for_function(
+                USER_TURN_SCRIPT,
+                arg={**selector_registry.snapshot_selectors(), "userBaseline": user_baseline},
+                timeout=SEND_CONFIRM_TIMEOUT,
+            )
+            return
+        except Exception:
+            pass
+
+        # Enter мог не сработать (например, поле требует отправки кнопкой)
+        selector, send_button = await selector_registry.resolve(
+            self.page, "send_button", timeout=0
+        )
+        if not send_button:
+            return
+        print("⚠️ Enter не отправил запрос, нажимаем кнопку отправки")
+        try:
+            await send_button.click(timeout=SEND_CLICK_TIMEOUT)
+        except Exception as e:
+            print(f"⚠️ Не удалось нажать кнопку отправки: {e}")
+
+    async def _wait_for_generation_start(
+        self, user_baseline: int, assistant_baseline: int
+    ) -> bool:
+        """Ждет появления запроса в ленте и начала ответа ассистента"""
+        if not self.page:
+            return False
+
+        arg = {
+            **selector_registry.snapshot_selectors(),
+            "userBaseline": user_baseline,
+            "assistantBaseline": assistant_baseline,
+        }
+
+        try:
+            await self.page.wait_for_function(
+                USER_TURN_SCRIPT,
+                arg=arg,
+                timeout=PROMPT_ACCEPT_TIMEOUT,
+            )
+        except Exception:
+            print("⚠️ Сообщение пользователя не появилось в ленте")
+            return False
+
+        try:
+            await self.page.wait_for_function(
+                RESPONSE_STARTED_SCRIPT,
+                arg=arg,
+                timeout=RESPONSE_START_TIMEOUT,
+            )
+            return True
+        except Exception:
+            print("⚠️ Ассистент не начал отвечать за отведенное время")
+            return False
+
+    async def _stop_generation(self):
+        """Нажимает кнопку остановки генерации и ждет разблокировки поля ввода"""
+        if not self.page:
+            return
+
+        try:
+            stop_button = await selector_registry.query(self.page, "stop_button")
+            if stop_button:
+                await stop_button.click(timeout=STOP_CLICK_TIMEOUT)
+                print("⏹️ Генерация ответа остановлена")
+            await self._wait_for_composer_ready()
+        except Exception as e:
+            print(f"⚠️ Не удалось остановить генерацию: {e}")
+
+    async def _wait_for_composer_ready(self) -> bool:
+        """Ждет окончания генерации и разблокировки поля ввода"""
+        if not self.page:
+            return False
+
+        try:
+            await self.page.wait_for_function(
+                COMPOSER_READY_SCRIPT,
+                arg=selector_registry.snapshot_selectors(),
+                timeout=COMPOSER_READY_TIMEOUT,
+            )
+            return True
+        except Exception:
+            print("⚠️ Поле ввода не разблокировалось после ответа")
+            return False
+
+    async def _install_response_observer(self, baseline: int) -> bool:
+        """Внедряет MutationObserver, который сообщает об изменениях ответа"""
+        if not self.page:
+            return False
+
+        try:
+            installed = await self.page.evaluate(
+                RESPONSE_OBSERVER_SCRIPT,
+                {
+                    "baseline": baseline,
+                    "assistantSelector": ASSISTANT_MESSAGE_SELECTOR,
+                    "typingSelectors": TYPING_SELECTORS,
+                    "binding": EVENT_BINDING,
+                },
+            )
+            return bool(installed)
+        except Exception as e:
+            print(f"⚠️ Не удалось установить observer ответа: {e}")
+            return False
 
     async def _clear_previous_response(self):
         """Очищает область с предыдущим ответом для надежности"""
@@ -627,35 +1037,122 @@ class BrowserClient:
 
     async def _find_input_element(self):
         """Находит поле ввода сообщения"""
-        input_selectors = [
-            "textarea",
-            "[contenteditable='true']",
-            "[placeholder*='Ask']",
-            "[placeholder*='Message']",
-            "input[type='text']",
-        ]
-
         if not self.page:
             print("❌ Page object is not initialized")
             return False
 
-        for selector in input_selectors:
-            try:
-                element = await self.page.wait_for_selector(selector, timeout=7000)
-                print(f"Найдено поле ввода с селектором: {selector}")
-                return element
-            except Exception:
-                continue
-        return None
+        selector, element = await selector_registry.resolve(
+            self.page, "composer", timeout=INPUT_FIND_TIMEOUT
+        )
+        if element:
+            print(f"Найдено поле ввода с селектором: {selector}")
+        return element
 
     async def _wait_for_response_complete(self):
         """Ждет окончания генерации ответа и возвращает текст"""
-        import time
+        if self._events is not None:
+            return await self._wait_for_observer_events()
+        return await self._poll_for_response_complete()
+
+    async def _wait_for_observer_events(self):
+        """Ждет завершения ответа по событиям из страницы.
+
+        Ответ из сетевого потока имеет приоритет: он приходит раньше и
+        сохраняет форматирование. События observer DOM используются,
+        если поток не удалось перехватить.
+        """
+        if not self.page or self._events is None:
+            return "Ошибка: браузер не инициализирован"
+
+        start_time = time.time()
+        last_answer = ""
+        stream_answer = ""
+        stream_seen = False
+        stream_broken = False
+        parsers: dict[str, ConversationStreamParser] = {}
+        # Текст страницы после события done, пока дожидаемся конца потока
+        dom_answer: Optional[str] = None
+        grace_until = 0.0
+
+        print("Ожидаем завершения генерации ответа (события страницы)...")
+
+        while time.time() - start_time < RESPONSE_MAX_WAIT:
+            timeout = RESPONSE_IDLE_CHECK
+            if dom_answer is not None:
+                timeout = grace_until - time.time()
+                if timeout <= 0:
+                    print("⚠️ Сетевой поток не завершился, берем текст страницы")
+                    return dom_answer or stream_answer
+            try:
+                event = await asyncio.wait_for(self._events.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if dom_answer is not None:
+                    continue
+                # Событий давно не было - проверяем страницу напрямую
+                snapshot = await self._get_page_snapshot()
+                if snapshot.get("typing"):
+                    continue
+                if stream_answer:
+                    return stream_answer
+                current_answer = self._snapshot_answer(snapshot)
+                if current_answer and (last_answer or time.time() - start_time > 15):
+                    print("Observer молчит, typing отсутствует - ответ готов!")
+                    return current_answer
+                continue
+
+            event_type = event.get("type")
+
+            if event_type in ("sse_start", "sse", "sse_end", "sse_error"):
+                stream_seen = True
+                parser = parsers.setdefault(
+                    str(event.get("stream", "")), ConversationStreamParser()
+                )
+                if event_type == "sse":
+                    parser.feed(str(event.get("chunk", "")))
+                elif event_type == "sse_end":
+                    parser.finish()
+                elif event_type == "sse_error":
+                    print(f"⚠️ Ошибка чтения сетевого потока: {event.get('error')}")
+                    stream_broken = True
+
+                if parser.text:
+                    stream_answer = parser.text.strip()
+                    self._emit_progress(stream_answer)
+                if parser.done and stream_answer:
+                    print("Ответ получен из сетевого потока!")
+                    return stream_answer
+                if stream_broken and dom_answer is not None:
+                    return dom_answer or stream_answer
+                continue
 
+            text = " ".join(str(event.get("text", "")).strip().split())
+            if event_type == "delta":
+                if text:
+                    last_answer = text
+                    # Пока сетевой поток не перехвачен, фрагменты берем из DOM
+                    if not stream_seen:
+                        self._emit_progress(text)
+            elif event_type == "done":
+                if dom_answer is not None:
+                    continue
+                print("Генерация ответа завершена!")
+                stream_finished = any(parser.done for parser in parsers.values())
+                if stream_seen and not stream_finished and not stream_broken:
+                    # Поток еще дочитывается - ответ из него может быть обрезан
+                    dom_answer = text or last_answer
+                    grace_until = time.time() + STREAM_END_GRACE
+                    continue
+                return stream_answer or text or last_answer
+
+        print(f"⚠️ Достигнут таймаут ожидания ответа ({RESPONSE_MAX_WAIT} секунд)")
+        return last_answer if last_answer else "Таймаут ожидания ответа"
+
+    async def _poll_for_response_complete(self):
+        """Опрашивает страницу до окончания генерации ответа и возвращает текст"""
         if not self.page:
             return "Ошибка: браузер не инициализирован"
 
-        max_wait_time = 300  # Увеличил до 5 минут для длинных ответов
+        max_wait_time = RESPONSE_MAX_WAIT
         start_time = time.time()
         last_answer = ""
         stable_count = 0  # Счетчик стабильных проверок
@@ -667,14 +1164,16 @@ class BrowserClient:
 
         while time.time() - start_time < max_wait_time:
             try:
-                # Получаем текущий текст ответа
-                current_answer = await self._get_latest_assistant_message()
+                # Текст ответа и индикатор typing - одним снимком страницы
+                snapshot = await self._get_page_snapshot()
+                current_answer = self._snapshot_answer(snapshot)
 
                 if current_answer and current_answer != last_answer:
                     # Текст изменился - генерация продолжается
                     last_answer = current_answer
                     stable_count = 0
                     last_change_time = time.time()
+                    self._emit_progress(current_answer)
                     print(f"Получена часть ответа ({len(current_answer)} символов)")
                 elif current_answer and current_answer == last_answer:
                     # Текст стабилен - увеличиваем счетчик
@@ -690,7 +1189,7 @@ class BrowserClient:
                     stable_count = 0
 
                 # Проверяем индикаторы typing как дополнительный сигнал
-                is_typing = await self._is_chatgpt_typing()
+                is_typing = bool(snapshot.get("typing"))
                 if not is_typing and current_answer:
                     # Нет индикатора typing + есть ответ
                     current_time = time.time()
@@ -730,104 +1229,46 @@ class BrowserClient:
         print(f"⚠️ Достигнут таймаут ожидания ответа ({max_wait_time} секунд)")
         return last_answer if last_answer else "Таймаут ожидания ответа"
 
-    async def _get_latest_assistant_message(self):
-        """Получает последнее сообщение ассистента"""
+    async def _get_page_snapshot(self) -> dict:
+        """Возвращает состояние страницы за один вызов page.evaluate"""
         if not self.page:
-            return ""
+            return {}
 
+        started = time.perf_counter()
         try:
-            # Более надежные селекторы для сообщений ассистента
-            assistant_selectors = [
-                '[data-message-author-role="assistant"]',
-                '[data-testid*="conversation-turn"]:last-child [data-message-author-role="assistant"]',
-                '.group:has([data-message-author-role="assistant"])',
-                '[data-testid*="conversation-turn"]:last-child',
-                '.markdown',
-                '.prose',
-            ]
+            snapshot = await self.page.evaluate(
+                PAGE_SNAPSHOT_SCRIPT, selector_registry.snapshot_selectors()
+            )
+            matched = snapshot.get("matched") or {}
+            for role in ("assistant", "composer"):
+                selector_registry.record(role, matched.get(role))
+            return snapshot
+        except Exception as e:
+            print(f"Ошибка при получении снимка страницы: {e}")
+            return {}
+        finally:
+            PAGE_SNAPSHOT_SECONDS.observe(time.perf_counter() - started)
 
-            for selector in assistant_selectors:
-                try:
-                    messages = await self.page.query_selector_all(selector)
-                    if messages:
-                        last_message = messages[-1]
-                        
-                        # Пробуем несколько способов извлечения текста
-                        text_content = await last_message.text_content()
-                        if text_content and text_content.strip():
-                            # Очищаем текст от лишних пробелов и переносов
-                            cleaned_text = ' '.join(text_content.strip().split())
-                            return cleaned_text
-                        
-                        # Если text_content не работает, пробуем innerText
-                        inner_text = await last_message.evaluate('element => element.innerText')
-                        if inner_text and inner_text.strip():
-                            cleaned_text = ' '.join(inner_text.strip().split())
-                            return cleaned_text
-                            
-                except Exception:
-                    continue
+    @staticmethod
+    def _snapshot_answer(snapshot: dict) -> str:
+        """Извлекает из снимка текст ответа без лишних пробелов и переносов"""
+        return " ".join(str(snapshot.get("text", "")).strip().split())
 
-            # Если стандартные методы не работают, пробуем получить весь контент страницы
-            try:
-                # Ищем любой контент, который может быть ответом
-                content_selectors = [
-                    '.markdown',
-                    '.prose',
-                    '[class*="message"]',
-                    '[class*="content"]',
-                    '[class*="response"]',
-                ]
-                
-                for selector in content_selectors:
-                    elements = await self.page.query_selector_all(selector)
-                    if elements:
-                        # Берем последний элемент, который скорее всего содержит ответ
-                        last_element = elements[-1]
-                        text_content = await last_element.text_content()
-                        if text_content and len(text_content) > 100:  # Минимум 100 символов
-                            cleaned_text = ' '.join(text_content.strip().split())
-                            return cleaned_text
-            except Exception:
-                pass
-
-            return ""
-        except Exception as e:
-            print(f"Ошибка при получении сообщения ассистента: {e}")
-            return ""
+    async def _get_latest_assistant_message(self):
+        """Получает последнее сообщение ассистента"""
+        return self._snapshot_answer(await self._get_page_snapshot())
 
     async def _is_chatgpt_typing(self):
         """Проверяет, показывает ли ChatGPT индикатор набора текста"""
-        if not self.page:
-            return False
-
-        try:
-            # Селекторы индикаторов typing
-            typing_selectors = [
-                '[data-testid*="typing"]',
-                ".typing-indicator",
-                '[class*="typing"]',
-                '[aria-label*="typing"]',
-                '[data-testid*="stop-button"]',  # Кнопка остановки генерации
-            ]
-
-            for selector in typing_selectors:
-                elements = await self.page.query_selector_all(selector)
-                # Проверяем видимость элементов
-                for element in elements:
-                    if await element.is_visible():
-                        return True
-
-            return False
-        except Exception:
-            return False
+        snapshot = await self._get_page_snapshot()
+        return bool(snapshot.get("typing"))
 
     async def get_auth_status(self):
         """Возвращает статус аутентификации"""
         return self.auth_status
 
     async def save_session_cookies(self) -> bool:
-        """Сохраняет cookies и состояние браузера в файл cookies.json"""
+        """Сохраняет cookies и состояние браузера в файл сессии аккаунта"""
         if not self.context:
             print("❌ Контекст браузера не инициализирован")
             return False
@@ -850,10 +1291,13 @@ class BrowserClient:
                 "timestamp": asyncio.get_event_loop().time()
             }
             
-            with open(COOKIES_PATH, "w", encoding="utf-8") as f:
+            session_dir = os.path.dirname(self.cookies_path)
+            if session_dir:
+                os.makedirs(session_dir, exist_ok=True)
+            with open(self.cookies_path, "w", encoding="utf-8") as f:
                 json.dump(session_data, f, indent=2, ensure_ascii=False)
             
-            print(f"✅ Сессия успешно сохранена в {COOKIES_PATH}")
+            print(f"✅ Сессия успешно сохранена в {self.cookies_path}")
             return True
             
         except Exception as e:
@@ -861,15 +1305,15 @@ class BrowserClient:
             return False
 
     async def load_session_cookies(self) -> bool:
-        """Загружает cookies и состояние браузера из файла cookies.json"""
+        """Загружает cookies и состояние браузера из файла сессии аккаунта"""
         try:
             # Проверяем существование файла
-            if not os.path.exists(COOKIES_PATH):
-                print(f"ℹ️ Файл {COOKIES_PATH} не найден")
+            if not os.path.exists(self.cookies_path):
+                print(f"ℹ️ Файл {self.cookies_path} не найден")
                 return False
             
             # Загружаем данные из файла
-            with open(COOKIES_PATH, "r", encoding="utf-8") as f:
+            with open(self.cookies_path, "r", encoding="utf-8") as f:
                 session_data = json.load(f)
             
             # Восстанавливаем статус аутентификации
@@ -885,7 +1329,7 @@ class BrowserClient:
                     await self.context.add_cookies(cookies)
                     print(f"✅ Загружено {len(cookies)} cookies")
             
-            print(f"✅ Сессия успешно загружена из {COOKIES_PATH}")
+            print(f"✅ Сессия успешно загружена из {self.cookies_path}")
             return True
             
         except Exception as e:
@@ -895,11 +1339,11 @@ class BrowserClient:
     async def is_session_valid(self) -> bool:
         """Проверяет валидность сохраненной сессии"""
         try:
-            if not os.path.exists(COOKIES_PATH):
+            if not os.path.exists(self.cookies_path):
                 return False
             
             # Загружаем данные сессии
-            with open(COOKIES_PATH, "r", encoding="utf-8") as f:
+            with open(self.cookies_path, "r", encoding="utf-8") as f:
                 session_data = json.load(f)
             
             # Проверяем наличие необходимых данных
@@ -950,14 +1394,25 @@ class BrowserClient:
             await self.open_chatgpt()
             return False
 
-    async def send_and_get_answer_with_reconnect(self, prompt: str, max_retries: int = 3) -> str:
+    async def send_and_get_answer_with_reconnect(
+        self,
+        prompt: str,
+        max_retries: int = 3,
+        on_delta: Optional[Callable[[str], None]] = None,
+    ) -> str:
         """Отправляет запрос с автоматическим переподключением при ошибках"""
+        # Повторная попытка досылает получателю фрагментов только то,
+        # что выходит за пределы уже отправленного текста
+        relay = DeltaRelay(on_delta) if on_delta else None
+
         for attempt in range(max_retries):
             try:
                 print(f"🔄 Попытка {attempt + 1}/{max_retries}")
                 
                 # Пытаемся отправить запрос
-                result = await self.send_and_get_answer(prompt)
+                result = await self.send_and_get_answer(
+                    prompt, on_delta=relay.attempt() if relay else None
+                )
                 
                 # Проверяем результат на ошибки
                 if "Ошибка" not in result and "Таймаут" not in result:
@@ -969,17 +1424,91 @@ class BrowserClient:
             except Exception as e:
                 print(f"❌ Исключение при отправке запроса: {e}")
             
-            # Если это не последняя попытка, перезапускаем браузер
+            # Если это не последняя попытка, пересоздаем вкладку
             if attempt < max_retries - 1:
-                print("🔄 Перезапускаем браузер...")
-                await self.close()
-                await self.initialize_with_session()
+                RECONNECT_ATTEMPTS_TOTAL.inc()
+                try:
+                    await self.recycle_context()
+                except Exception as e:
+                    print(f"⚠️ Не удалось пересоздать вкладку: {e}")
+                    if not self._owns_browser or not self.restart_browser_on_failure:
+                        raise
+                    print("🔄 Перезапускаем браузер...")
+                    await self.close()
+                    await self.initialize_with_session()
                 await asyncio.sleep(2)  # Пауза перед следующей попыткой
         
         return "❌ Не удалось выполнить запрос после всех попыток"
 
+    async def spawn_worker(self) -> "BrowserClient":
+        """Создает дополнительную вкладку в отдельном контексте того же браузера.
+
+        Новый контекст получает cookies из файла сессии, поэтому вкладка
+        сразу работает в авторизованной сессии.
+        """
+        if not self.browser:
+            raise RuntimeError("Browser is not initialized")
+
+        worker = BrowserClient(
+            browser=self.browser,
+            email=self.auth_data["email"],
+            password=self.auth_data["password"],
+            cookies_path=self.cookies_path,
+        )
+        await worker.initialize_with_session()
+        return worker
+
+    async def recycle_context(self):
+        """Пересоздает контекст и вкладку без перезапуска браузера"""
+        if not self.browser or not self.browser.is_connected():
+            raise RuntimeError("Browser is not connected")
+
+        print("🔄 Пересоздаем вкладку...")
+        if self.context:
+            try:
+                await self.context.close()
+            except Exception as e:
+                print(f"⚠️ Ошибка при закрытии контекста: {e}")
+        self.context = None
+        self.page = None
+
+        await self.initialize_with_session()
+
+    async def detect_rate_limit(self) -> Optional[str]:
+        """Возвращает фразу баннера о лимите запросов аккаунта или None.
+
+        Лимит определяется только по уведомлениям и сообщению об ошибке
+        на странице: текст ответа может сам упоминать "rate limit".
+        """
+        if not self.page or self.page.is_closed():
+            return None
+        try:
+            return await self.page.evaluate(
+                RATE_LIMIT_SCRIPT,
+                {"patterns": RATE_LIMIT_PATTERNS, "userSelector": USER_MESSAGE_SELECTOR},
+            )
+        except Exception as e:
+            print(f"⚠️ Не удалось проверить баннер лимита запросов: {e}")
+            return None
+
+    def is_browser_alive(self) -> bool:
+        """Проверяет, что процесс браузера доступен"""
+        return bool(self.browser and self.browser.is_connected())
+
     async def close(self):
         """Закрывает браузер и сохраняет сессию"""
+        if not self._owns_browser:
+            # Дополнительная вкладка закрывает только свой контекст,
+            # сессию сохраняет основной клиент
+            if self.context:
+                try:
+                    await self.context.close()
+                except Exception as e:
+                    print(f"⚠️ Ошибка при закрытии контекста: {e}")
+            self.context = None
+            self.page = None
+            return
+
         try:
             # Сохраняем сессию перед закрытием
             await self.save_session_cookies()
@@ -990,3 +1519,7 @@ class BrowserClient:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
+        self.browser = None
+        self.playwright = None
+        self.context = None
+        self.page = None
@@ -0,0 +1,187 @@
+import asyncio
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from client.browser_client import BrowserClient
+from services.metrics import PAGE_RECYCLES_TOTAL
+
+# Количество вкладок, обрабатывающих запросы параллельно
+PAGE_POOL_SIZE = int(os.getenv("PAGE_POOL_SIZE", "1"))
+# Сколько ошибок подряд допускается до пересоздания вкладки
+PAGE_MAX_FAILURES = int(os.getenv("PAGE_MAX_FAILURES", "2"))
+
+
+@dataclass
+class PageWorker:
+    id: int
+    client: BrowserClient
+    generation: int
+    busy: bool = False
+    failures: int = 0  # Ошибки подряд
+    total_requests: int = 0
+    total_failures: int = 0
+    recycles: int = 0
+    last_error: str = ""
+
+
+class PagePool:
+    """Пул вкладок браузера для параллельной обработки запросов.
+
+    Нулевой воркер - основной клиент, через который проходит авторизация.
+    Остальные вкладки создаются в отдельных контекстах того же браузера
+    после завершения авторизации и получают cookies из cookies.json.
+    """
+
+    def __init__(self, primary: BrowserClient, size: int = PAGE_POOL_SIZE):
+        self.size = max(1, size)
+        self.primary = primary
+        self._generation = 0
+        self._idle: asyncio.Queue[PageWorker] = asyncio.Queue()
+        self._spawn_lock = asyncio.Lock()
+        self.workers: list[PageWorker] = []
+        self._add_worker(primary)
+
+    def _add_worker(self, client: BrowserClient) -> PageWorker:
+        worker = PageWorker(
+            id=len(self.workers), client=client, generation=self._generation
+        )
+        self.workers.append(worker)
+        self._idle.put_nowait(worker)
+        return worker
+
+    async def ensure_workers(self):
+        """Досоздает недостающие вкладки, если основная сессия авторизована"""
+        if len(self.workers) >= self.size:
+            return
+        if self.primary.auth_status.get("status") != "completed":
+            return
+
+        async with self._spawn_lock:
+            while len(self.workers) < self.size:
+                try:
+                    client = await self.primary.spawn_worker()
+                except Exception as e:
+                    print(f"⚠️ Не удалось создать дополнительную вкладку: {e}")
+                    return
+                worker = self._add_worker(client)
+                print(f"✅ Вкладка #{worker.id} добавлена в пул")
+
+    async def acquire(self, prefer: Optional[int] = None) -> PageWorker:
+        """Возвращает свободную вкладку, ожидая освобождения при необходимости.
+
+        prefer - id вкладки, которую лучше взять, если она свободна
+        (например, она уже открыта в нужном треде диалога).
+        """
+        await self.ensure_workers()
+
+        worker = self._take_idle(prefer) if prefer is not None else None
+        while worker is None:
+            candidate = await self._idle.get()
+            if candidate.generation == self._generation:
+                worker = candidate
+
+        if not self._is_healthy(worker):
+            await self._recycle(worker, "Вкладка закрыта")
+
+        worker.busy = True
+        return worker
+
+    def _take_idle(self, worker_id: int) -> Optional[PageWorker]:
+        """Забирает из свободных вкладку с данным id, остальные остаются в очереди"""
+        found = None
+        others = []
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if found is None and worker.id == worker_id and worker.generation == self._generation:
+                found = worker
+            else:
+                others.append(worker)
+        for worker in others:
+            self._idle.put_nowait(worker)
+        return found
+
+    async def release(self, worker: PageWorker, ok: Optional[bool], error: str = ""):
+        """Возвращает вкладку в пул и обновляет статистику ее здоровья.
+
+        ok=None - запрос прерван (клиент отключился или истек срок):
+        о здоровье вкладки это ничего не говорит, счетчик ошибок не меняется.
+        """
+        worker.busy = False
+        worker.total_requests += 1
+
+        if worker.generation != self._generation:
+            # Вкладка принадлежит браузеру, который уже перезапущен,
+            # основной клиент старого браузера закрыт сервисом
+            if worker.id != 0:
+                await worker.client.close()
+            return
+
+        if ok is None:
+            pass
+        elif ok:
+            worker.failures = 0
+        else:
+            worker.failures += 1
+            worker.total_failures += 1
+            worker.last_error = error
+            if worker.failures >= PAGE_MAX_FAILURES:
+                await self._recycle(worker, error)
+
+        self._idle.put_nowait(worker)
+
+    def _is_healthy(self, worker: PageWorker) -> bool:
+        page = worker.client.page
+        return bool(page and not page.is_closed() and worker.client.is_browser_alive())
+
+    async def _recycle(self, worker: PageWorker, reason: str):
+        """Пересоздает одну вкладку, не трогая остальные и сам браузер"""
+        print(f"🔄 Пересоздаем вкладку #{worker.id}: {reason}")
+        try:
+            if worker.client is self.primary:
+                await self.primary.recycle_context()
+            else:
+                await worker.client.close()
+                worker.client = await self.primary.spawn_worker()
+            worker.failures = 0
+            worker.recycles += 1
+            PAGE_RECYCLES_TOTAL.inc()
+        except Exception as e:
+            print(f"❌ Не удалось пересоздать вкладку #{worker.id}: {e}")
+
+    async def reset(self, primary: BrowserClient):
+        """Привязывает пул к новому основному клиенту после перезапуска браузера"""
+        self._generation += 1
+
+        # Свободные вкладки старого браузера закрываем сразу,
+        # занятые закроются при возврате в пул
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker.client is not self.primary:
+                await worker.client.close()
+
+        self.primary = primary
+        self.workers = []
+        self._add_worker(primary)
+
+    async def close(self):
+        """Закрывает дополнительные вкладки (основной клиент закрывается сервисом)"""
+        for worker in self.workers:
+            if worker.client is not self.primary:
+                await worker.client.close()
+
+    def get_status(self) -> list[dict]:
+        """Возвращает состояние вкладок пула"""
+        return [
+            {
+                "id": worker.id,
+                "busy": worker.busy,
+                "healthy": self._is_healthy(worker),
+                "failures": worker.failures,
+                "total_requests": worker.total_requests,
+                "total_failures": worker.total_failures,
+                "recycles": worker.recycles,
+                "last_error": worker.last_error,
+            }
+            for worker in self.workers
+        ]
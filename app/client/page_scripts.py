@@ -0,0 +1,468 @@
+"""JavaScript, внедряемый в страницу ChatGPT.
+
+Скрипты общаются с Python через binding EVENT_BINDING, который
+BrowserClient регистрирует на уровне контекста браузера.
+"""
+
+# Имя функции, через которую страница отправляет события в Python
+EVENT_BINDING = "__bridgeEmit"
+
+# Сообщения ассистента
+ASSISTANT_MESSAGE_SELECTOR = '[data-message-author-role="assistant"]'
+
+# Сообщения пользователя
+USER_MESSAGE_SELECTOR = '[data-message-author-role="user"]'
+
+# Поле ввода сообщения
+COMPOSER_SELECTORS = [
+    "textarea",
+    "[contenteditable='true']",
+    "[placeholder*='Ask']",
+    "[placeholder*='Message']",
+    "input[type='text']",
+]
+
+# Селекторы последнего ответа ассистента в порядке приоритета
+ASSISTANT_SELECTORS = [
+    ASSISTANT_MESSAGE_SELECTOR,
+    '[data-testid*="conversation-turn"]:last-child [data-message-author-role="assistant"]',
+    '.group:has([data-message-author-role="assistant"])',
+    '[data-testid*="conversation-turn"]:last-child',
+    ".markdown",
+    ".prose",
+]
+
+# Запасные селекторы: любой крупный блок, который может быть ответом
+ANSWER_FALLBACK_SELECTORS = [
+    ".markdown",
+    ".prose",
+    '[class*="message"]',
+    '[class*="content"]',
+    '[class*="response"]',
+]
+
+# Селекторы индикаторов typing
+TYPING_SELECTORS = [
+    '[data-testid*="typing"]',
+    ".typing-indicator",
+    '[class*="typing"]',
+    '[aria-label*="typing"]',
+    '[data-testid*="stop-button"]',  # Кнопка остановки генерации
+]
+
+# Кнопка остановки генерации ответа
+STOP_BUTTON_SELECTORS = [
+    '[data-testid="stop-button"]',
+    'button[aria-label*="Stop"]',
+    'button[aria-label*="Остановить"]',
+]
+
+# Кнопка отправки запроса (если Enter не отправил промпт)
+SEND_BUTTON_SELECTORS = [
+    '[data-testid="send-button"]',
+    'button[aria-label*="Send"]',
+    'button[aria-label*="Отправить"]',
+]
+
+# Элементы, появление которых означает, что интерфейс чата загрузился
+PAGE_READY_SELECTORS = [
+    "textarea",
+    "[data-testid='send-button']",
+    "[placeholder*='Ask']",
+    "[placeholder*='Message']",
+    "[contenteditable='true']",
+    ".prose",
+]
+
+# Текст кнопок настоящих всплывающих окон (cookie, согласия, активации)
+# в порядке приоритета. Кнопки интерфейса чата сюда не входят
+POPUP_BUTTON_TEXTS = [
+    # Cookie и согласия (высший приоритет)
+    "Accept all",
+    "Принять все",
+    "Accept cookies",
+    "Принять cookies",
+    "I agree",
+    "Я согласен",
+    # Кнопки Enable и активации
+    "Enable",
+    "Включить",
+    "Activate",
+    "Активировать",
+    "Allow",
+    "Разрешить",
+    "Accept",
+    "Принять",
+    "Agree",
+    "Согласиться",
+    # Другие кнопки (только для настоящих всплывающих окон)
+    "Got it",
+    "Понятно",
+    "OK",
+    "ОК",
+    "Dismiss",
+    "Отклонить",
+    "Not now",
+    "Не сейчас",
+    "Later",
+    "Позже",
+]
+
+# Контейнеры всплывающих окон, на появление которых реагирует locator handler
+POPUP_CONTAINER_SELECTOR = (
+    '[role="dialog"], [role="alertdialog"], [id*="cookie" i], [class*="cookie" i]'
+)
+
+# Фразы баннеров, которыми ChatGPT сообщает о лимите запросов аккаунта
+RATE_LIMIT_PATTERNS = [
+    "too many requests",
+    "you've reached our limit",
+    "you’ve reached our limit",
+    "you've hit your limit",
+    "you’ve hit your limit",
+    "usage cap",
+    "rate limit",
+    "слишком много запросов",
+    "достигли лимита",
+    "превышен лимит",
+]
+
+# Ищет баннер лимита запросов в уведомлениях и в сообщении об ошибке
+# после последнего запроса пользователя (старые ошибки в ленте
+# не учитываются). Возвращает найденную фразу или null
+RATE_LIMIT_SCRIPT = """
+({ patterns, userSelector }) => {
+    const match = (el) => {
+        const text = (el.innerText || el.textContent || "").toLowerCase();
+        return text ? patterns.find((pattern) => text.includes(pattern)) || null : null;
+    };
+
+    const notices = document.querySelectorAll(
+        '[role="alert"], [class*="toast"], [data-testid*="toast"], [class*="banner"]'
+    );
+    for (const el of notices) {
+        const found = match(el);
+        if (found) {
+            return found;
+        }
+    }
+
+    const errors = document.querySelectorAll(".text-token-text-error, [class*='text-red']");
+    const lastError = errors[errors.length - 1];
+    if (!lastError) {
+        return null;
+    }
+    const users = document.querySelectorAll(userSelector);
+    const lastUser = users[users.length - 1];
+    if (
+        lastUser &&
+        !(lastUser.compareDocumentPosition(lastError) & Node.DOCUMENT_POSITION_FOLLOWING)
+    ) {
+        return null;
+    }
+    return match(lastError);
+}
+"""
+
+# Атрибут, которым скрипт помечает найденную кнопку для клика из Python
+POPUP_MARK_ATTRIBUTE = "data-bridge-popup"
+
+# За один проход находит видимую активную кнопку всплывающего окна с
+# наибольшим приоритетом, помечает ее атрибутом и возвращает ее текст
+# (или null). Текст кнопки сравнивается без учета регистра: совпадение
+# целиком или как начало ("Accept all cookies" для "Accept all")
+POPUP_SCAN_SCRIPT = """
+({ texts, mark }) => {
+    document.querySelectorAll(`[${mark}]`).forEach((el) => el.removeAttribute(mark));
+
+    const wanted = texts.map((text) => text.toLowerCase());
+    let best = null;
+    let bestRank = wanted.length;
+
+    for (const button of document.querySelectorAll("button, [role='button']")) {
+        if (button.disabled || button.getAttribute("aria-disabled") === "true") {
+            continue;
+        }
+        const rect = button.getBoundingClientRect();
+        if (!rect.width || !rect.height) {
+            continue;
+        }
+        const style = getComputedStyle(button);
+        if (style.visibility === "hidden" || style.display === "none") {
+            continue;
+        }
+
+        const label = (button.innerText || button.textContent || "")
+            .replace(/\s+/g, " ")
+            .trim()
+            .toLowerCase();
+        if (!label) {
+            continue;
+        }
+        const rank = wanted.findIndex(
+            (text) => label === text || label.startsWith(text + " ")
+        );
+        if (rank !== -1 && rank < bestRank) {
+            best = button;
+            bestRank = rank;
+        }
+    }
+
+    if (!best) {
+        return null;
+    }
+    best.setAttribute(mark, "1");
+    return texts[bestRank];
+}
+"""
+
+# Аргумент PAGE_SNAPSHOT_SCRIPT и построенных на нем проверок
+SNAPSHOT_SELECTORS = {
+    "assistantSelectors": ASSISTANT_SELECTORS,
+    "fallbackSelectors": ANSWER_FALLBACK_SELECTORS,
+    "assistantSelector": ASSISTANT_MESSAGE_SELECTOR,
+    "userSelector": USER_MESSAGE_SELECTOR,
+    "typingSelectors": TYPING_SELECTORS,
+    "composerSelectors": COMPOSER_SELECTORS,
+}
+
+# Следит за последним сообщением ассистента и индикаторами генерации.
+# Отправляет событие "delta" при каждом изменении текста ответа и "done",
+# как только индикатор генерации (кнопка остановки) исчезает.
+RESPONSE_OBSERVER_SCRIPT = """
+({ baseline, assistantSelector, typingSelectors, binding }) => {
+    if (window.__bridgeObserver) {
+        window.__bridgeObserver.disconnect();
+    }
+
+    const emit = window[binding];
+    if (typeof emit !== "function") {
+        return false;
+    }
+
+    let lastText = null;
+    let sawTyping = false;
+    let finished = false;
+
+    const isVisible = (el) =>
+        !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+
+    const isTyping = () =>
+        typingSelectors.some((selector) =>
+            Array.from(document.querySelectorAll(selector)).some(isVisible)
+        );
+
+    const check = () => {
+        if (finished) {
+            return;
+        }
+
+        const typing = isTyping();
+        if (typing) {
+            sawTyping = true;
+        }
+
+        const messages = document.querySelectorAll(assistantSelector);
+        if (messages.length <= baseline) {
+            return;
+        }
+
+        const text = messages[messages.length - 1].innerText || "";
+        if (text !== lastText) {
+            lastText = text;
+            emit({ type: "delta", text });
+        }
+
+        if (sawTyping && !typing && text.trim()) {
+            finished = true;
+            observer.disconnect();
+            window.__bridgeObserver = null;
+            emit({ type: "done", text });
+        }
+    };
+
+    const observer = new MutationObserver(check);
+    observer.observe(document.body, {
+        childList: true,
+        subtree: true,
+        characterData: true,
+        attributes: true,
+        attributeFilter: ["class", "style", "hidden", "aria-label", "data-testid"],
+    });
+    window.__bridgeObserver = observer;
+    return true;
+}
+"""
+
+# Снимок состояния страницы за один вызов page.evaluate: последний ответ
+# ассистента (текст и HTML), количество сообщений, индикатор генерации
+# и состояние поля ввода. Аргумент - словарь SNAPSHOT_SELECTORS
+PAGE_SNAPSHOT_SCRIPT = """
+({ assistantSelectors, fallbackSelectors, assistantSelector, userSelector, typingSelectors, composerSelectors }) => {
+    const isVisible = (el) =>
+        !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+    const queryAll = (selector) => {
+        try {
+            return document.querySelectorAll(selector);
+        } catch (e) {
+            return [];
+        }
+    };
+    const textOf = (el) => {
+        const text = el.textContent || "";
+        return text.trim() ? text : el.innerText || "";
+    };
+
+    const snapshot = {
+        assistantCount: queryAll(assistantSelector).length,
+        userCount: queryAll(userSelector).length,
+        text: "",
+        html: "",
+        typing: typingSelectors.some((selector) =>
+            Array.from(queryAll(selector)).some(isVisible)
+        ),
+        composer: { present: false, enabled: false, textLength: 0 },
+        // Сработавшие селекторы для реестра селекторов в Python
+        matched: { assistant: null, composer: null },
+    };
+
+    for (const selector of assistantSelectors) {
+        const elements = queryAll(selector);
+        if (!elements.length) {
+            continue;
+        }
+        const last = elements[elements.length - 1];
+        const text = textOf(last);
+        if (text.trim()) {
+            snapshot.text = text;
+            snapshot.html = last.innerHTML;
+            snapshot.matched.assistant = selector;
+            break;
+        }
+    }
+
+    if (!snapshot.text) {
+        // Запасной вариант: любой крупный блок контента
+        for (const selector of fallbackSelectors) {
+            const elements = queryAll(selector);
+            if (!elements.length) {
+                continue;
+            }
+            const last = elements[elements.length - 1];
+            const text = last.textContent || "";
+            if (text.length > 100) {
+                snapshot.text = text;
+                snapshot.html = last.innerHTML;
+                break;
+            }
+        }
+    }
+
+    for (const selector of composerSelectors) {
+        const el = Array.from(queryAll(selector)).find(isVisible);
+        if (el) {
+            const value = typeof el.value === "string" ? el.value : el.innerText || "";
+            snapshot.composer = {
+                present: true,
+                enabled: !el.disabled && el.getAttribute("aria-disabled") !== "true",
+                textLength: value.length,
+            };
+            snapshot.matched.composer = selector;
+            break;
+        }
+    }
+
+    return snapshot;
+}
+"""
+
+# Сообщение пользователя появилось в ленте
+USER_TURN_SCRIPT = (
+    "(arg) => (" + PAGE_SNAPSHOT_SCRIPT + ")(arg).userCount > arg.userBaseline"
+)
+
+# Ассистент начал отвечать: появилось новое сообщение или индикатор генерации
+RESPONSE_STARTED_SCRIPT = (
+    "(arg) => { const snapshot = (" + PAGE_SNAPSHOT_SCRIPT + ")(arg); "
+    "return snapshot.assistantCount > arg.assistantBaseline || snapshot.typing; }"
+)
+
+# Генерация закончилась и поле ввода снова доступно
+COMPOSER_READY_SCRIPT = (
+    "(arg) => { const snapshot = (" + PAGE_SNAPSHOT_SCRIPT + ")(arg); "
+    "return !snapshot.typing && snapshot.composer.present && snapshot.composer.enabled; }"
+)
+
+# Возвращает текущий текст поля ввода (textarea или contenteditable)
+COMPOSER_TEXT_SCRIPT = """
+(el) => (typeof el.value === "string" ? el.value : el.innerText || "")
+"""
+
+# Вставляет текст в поле ввода синтетическим событием paste.
+# Редакторы на contenteditable (ProseMirror) обрабатывают его
+# так же, как вставку из буфера обмена
+PASTE_TEXT_SCRIPT = """
+(el, text) => {
+    el.focus();
+    const data = new DataTransfer();
+    data.setData("text/plain", text);
+    el.dispatchEvent(
+        new ClipboardEvent("paste", { clipboardData: data, bubbles: true, cancelable: true })
+    );
+}
+"""
+
+# Перехватывает fetch-запросы к /backend-api/conversation и пересылает
+# SSE-поток ответа в Python по мере поступления байтов. Исходный ответ
+# страница получает без изменений (читается клон тела).
+NETWORK_TAP_SCRIPT = """
+(binding) => {
+    if (window.__bridgeTapInstalled) {
+        return;
+    }
+    window.__bridgeTapInstalled = true;
+
+    const pattern = /\\/backend-(api|anon)\\/(f\\/)?conversation(\\?|$)/;
+    const originalFetch = window.fetch;
+
+    const emit = (payload) => {
+        const fn = window[binding];
+        if (typeof fn === "function") {
+            Promise.resolve(fn(payload)).catch(() => {});
+        }
+    };
+
+    const pump = async (reader, stream) => {
+        const decoder = new TextDecoder();
+        try {
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) {
+                    break;
+                }
+                emit({ type: "sse", stream, chunk: decoder.decode(value, { stream: true }) });
+            }
+        } catch (e) {
+            emit({ type: "sse_error", stream, error: String(e) });
+        }
+        emit({ type: "sse_end", stream });
+    };
+
+    window.fetch = async function (...args) {
+        const response = await originalFetch.apply(this, args);
+        try {
+            const input = args[0];
+            const url = input instanceof Request ? input.url : String(input || "");
+            const contentType = response.headers.get("content-type") || "";
+            if (pattern.test(url) && contentType.includes("text/event-stream") && response.body) {
+                const stream = Math.random().toString(36).slice(2);
+                emit({ type: "sse_start", stream, url });
+                pump(response.clone().body.getReader(), stream);
+            }
+        } catch (e) {
+            // Перехват не должен ломать работу страницы
+        }
+        return response;
+    };
+}
+"""
@@ -0,0 +1,156 @@
+import asyncio
+from collections import defaultdict
+from typing import Optional
+
+from client.page_scripts import (
+    ASSISTANT_SELECTORS,
+    COMPOSER_SELECTORS,
+    PAGE_READY_SELECTORS,
+    SEND_BUTTON_SELECTORS,
+    SNAPSHOT_SELECTORS,
+    STOP_BUTTON_SELECTORS,
+)
+from services.metrics import SELECTOR_LOOKUPS_TOTAL
+
+# Роли элементов страницы и их селекторы в порядке приоритета
+SELECTOR_ROLES = {
+    "composer": COMPOSER_SELECTORS,
+    "assistant": ASSISTANT_SELECTORS,
+    "stop_button": STOP_BUTTON_SELECTORS,
+    "send_button": SEND_BUTTON_SELECTORS,
+    "page_ready": PAGE_READY_SELECTORS,
+}
+
+
+class SelectorRegistry:
+    """Запоминает, какой селектор последним сработал для каждой роли.
+
+    Запомненный селектор проверяется первым одним запросом к странице.
+    Только при промахе остальные кандидаты проверяются параллельно,
+    и победитель становится новым запомненным селектором. Интерфейс
+    ChatGPT одинаков во всех вкладках, поэтому реестр общий.
+    """
+
+    def __init__(self, roles: dict[str, list[str]]):
+        self.roles = {role: list(selectors) for role, selectors in roles.items()}
+        self._winners: dict[str, str] = {}
+        self._wins: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self._misses: dict[str, int] = defaultdict(int)
+        self._snapshot_selectors: Optional[dict] = None
+
+    def winner(self, role: str) -> Optional[str]:
+        return self._winners.get(role)
+
+    def ordered(self, role: str) -> list[str]:
+        """Кандидаты роли: последний сработавший первым, остальные по приоритету"""
+        selectors = self.roles[role]
+        winner = self._winners.get(role)
+        if not winner:
+            return selectors
+        return [winner] + [selector for selector in selectors if selector != winner]
+
+    def record(self, role: str, selector: Optional[str]):
+        """Отмечает, что селектор нашел элемент роли"""
+        if not selector:
+            return
+        self._wins[role][selector] += 1
+        if self._winners.get(role) != selector:
+            self._winners[role] = selector
+            self._snapshot_selectors = None
+
+    def forget(self, role: str):
+        """Сбрасывает запомненный селектор после промаха"""
+        self._misses[role] += 1
+        if self._winners.pop(role, None):
+            self._snapshot_selectors = None
+
+    def snapshot_selectors(self) -> dict:
+        """Аргумент PAGE_SNAPSHOT_SCRIPT с запомненными селекторами впереди"""
+        if self._snapshot_selectors is None:
+            self._snapshot_selectors = {
+                **SNAPSHOT_SELECTORS,
+                "assistantSelectors": self.ordered("assistant"),
+                "composerSelectors": self.ordered("composer"),
+            }
+        return self._snapshot_selectors
+
+    async def query(self, page, role: str):
+        """Возвращает видимый элемент роли без ожидания или None"""
+        selector, element = await self.resolve(page, role, timeout=0)
+        return element
+
+    async def resolve(self, page, role: str, timeout: float):
+        """Находит видимый элемент роли и возвращает (селектор, элемент).
+
+        timeout (мс) ограничивает параллельное ожидание кандидатов при
+        промахе; 0 - только проверка текущего состояния страницы.
+        """
+        winner = self._winners.get(role)
+        if winner:
+            try:
+                element = await page.query_selector(f"{winner} >> visible=true")
+            except Exception:
+                element = None
+            if element:
+                self.record(role, winner)
+                SELECTOR_LOOKUPS_TOTAL.inc(role, "hit")
+                return winner, element
+            self.forget(role)
+
+        SELECTOR_LOOKUPS_TOTAL.inc(role, "miss")
+        selector, element = await self._probe(page, role, timeout)
+        if element:
+            self.record(role, selector)
+        return selector, element
+
+    async def _probe(self, page, role: str, timeout: float):
+        """Проверяет всех кандидатов роли параллельно, при равенстве - по приоритету"""
+        selectors = self.roles[role]
+        if not timeout:
+            elements = await asyncio.gather(
+                *(page.query_selector(f"{selector} >> visible=true") for selector in selectors),
+                return_exceptions=True,
+            )
+            for selector, element in zip(selectors, elements):
+                if element and not isinstance(element, BaseException):
+                    return selector, element
+            return None, None
+
+        tasks = {
+            asyncio.create_task(page.wait_for_selector(selector, timeout=timeout)): index
+            for index, selector in enumerate(selectors)
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                found = [
+                    (tasks[task], task.result())
+                    for task in done
+                    if task.exception() is None and task.result()
+                ]
+                if found:
+                    index, element = min(found, key=lambda item: item[0])
+                    return selectors[index], element
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        return None, None
+
+    def get_stats(self) -> dict:
+        """Запомненные селекторы, число побед каждого кандидата и промахи"""
+        return {
+            role: {
+                "winner": self._winners.get(role),
+                "wins": dict(self._wins.get(role, {})),
+                "misses": self._misses.get(role, 0),
+            }
+            for role in self.roles
+        }
+
+
+# Синглтон экземпляр
+selector_registry = SelectorRegistry(SELECTOR_ROLES)
@@ -0,0 +1,192 @@
+import json
+from typing import Any, Callable, Optional
+
+
+class ConversationStreamParser:
+    """Инкрементальный разбор SSE-потока ответа ChatGPT (/backend-api/conversation).
+
+    Поддерживает оба формата сервера:
+    - полный снимок сообщения в каждом событии (message.content.parts);
+    - delta encoding v1, где приходят операции add/append/replace/patch.
+
+    Текст накапливается только для сообщений ассистента с текстовым контентом,
+    несколько таких сообщений в одном ответе разделяются пустой строкой.
+    """
+
+    def __init__(self):
+        self.done = False
+        self.conversation_id: Optional[str] = None
+        self.error: Optional[str] = None
+        self._buffer = ""
+        self._completed = ""  # Текст уже завершенных сообщений ассистента
+        self._current = ""  # Текст текущего сообщения
+        self._current_id: Any = None
+        self._current_is_answer = False
+        # Путь и операция последнего delta-события (сокращенная запись {"v": ...})
+        self._last_path: Optional[str] = None
+        self._last_op: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """Накопленный текст ответа"""
+        return "\n\n".join(part for part in (self._completed, self._current) if part)
+
+    def feed(self, chunk: str) -> str:
+        """Принимает очередной кусок потока и возвращает добавленный текст ответа"""
+        before = self.text
+        self._buffer += chunk.replace("\r\n", "\n")
+
+        while "\n\n" in self._buffer:
+            raw_event, self._buffer = self._buffer.split("\n\n", 1)
+            self._handle_event(raw_event)
+
+        return self._delta(before)
+
+    def finish(self) -> str:
+        """Обрабатывает остаток буфера после закрытия потока"""
+        before = self.text
+        if self._buffer.strip():
+            self._handle_event(self._buffer)
+        self._buffer = ""
+        self.done = True
+        return self._delta(before)
+
+    def _delta(self, before: str) -> str:
+        after = self.text
+        # Если текст был заменен целиком, досылать нечего
+        return after[len(before):] if after.startswith(before) else ""
+
+    def _handle_event(self, raw_event: str):
+        data_lines = [
+            line[5:].lstrip(" ")
+            for line in raw_event.split("\n")
+            if line.startswith("data:")
+        ]
+        if not data_lines:
+            return
+
+        data = "\n".join(data_lines)
+        if data.strip() == "[DONE]":
+            self.done = True
+            return
+
+        try:
+            payload = json.loads(data)
+        except json.JSONDecodeError:
+            return
+
+        if isinstance(payload, dict):
+            self._handle_payload(payload)
+
+    def _handle_payload(self, payload: dict):
+        if payload.get("type") == "message_stream_complete":
+            self.done = True
+            return
+
+        if payload.get("conversation_id"):
+            self.conversation_id = payload["conversation_id"]
+        if payload.get("error"):
+            self.error = str(payload["error"])
+
+        if isinstance(payload.get("message"), dict):
+            # Формат с полным снимком сообщения
+            self._handle_snapshot(payload["message"])
+        elif "v" in payload:
+            self._handle_delta(payload)
+
+    def _handle_snapshot(self, message: dict):
+        if not self._is_answer_message(message):
+            return
+
+        message_id = message.get("id")
+        if message_id != self._current_id:
+            self._start_message(message_id, is_answer=True)
+
+        parts = (message.get("content") or {}).get("parts") or []
+        self._current = "".join(part for part in parts if isinstance(part, str))
+
+        if message.get("status") == "finished_successfully" and message.get("end_turn"):
+            self.done = True
+
+    def _handle_delta(self, payload: dict):
+        if "p" in payload:
+            self._last_path = payload["p"]
+            self._last_op = payload.get("o")
+        path, op, value = self._last_path, self._last_op, payload["v"]
+
+        if path == "" and op == "add" and isinstance(value, dict):
+            # Начало нового сообщения
+            if value.get("conversation_id"):
+                self.conversation_id = value["conversation_id"]
+            message = value.get("message")
+            is_answer = self._is_answer_message(message)
+            self._start_message(
+                message.get("id") if isinstance(message, dict) else None, is_answer
+            )
+            if is_answer:
+                self._handle_snapshot(message)
+        elif path == "" and op == "patch" and isinstance(value, list):
+            for operation in value:
+                if isinstance(operation, dict):
+                    self._apply_operation(
+                        operation.get("p"), operation.get("o"), operation.get("v")
+                    )
+        else:
+            self._apply_operation(path, op, value)
+
+    def _apply_operation(self, path: Optional[str], op: Optional[str], value: Any):
+        if not self._current_is_answer:
+            return
+
+        if path == "/message/content/parts/0" and isinstance(value, str):
+            if op == "append":
+                self._current += value
+            elif op == "replace":
+                self._current = value
+        elif path == "/message/end_turn" and value is True:
+            self.done = True
+
+    def _start_message(self, message_id: Any, is_answer: bool):
+        if self._current:
+            self._completed = self.text
+        self._current = ""
+        self._current_id = message_id
+        self._current_is_answer = is_answer
+
+    @staticmethod
+    def _is_answer_message(message: Any) -> bool:
+        if not isinstance(message, dict):
+            return False
+        author = message.get("author") or {}
+        content = message.get("content") or {}
+        return (
+            author.get("role") == "assistant"
+            and content.get("content_type", "text") == "text"
+        )
+
+
+class DeltaRelay:
+    """Пересылает фрагменты ответа получателю без повторов между попытками.
+
+    Каждая попытка (повтор запроса, другая вкладка или аккаунт) получает
+    свой обработчик из attempt() и начинает ответ заново. Получателю
+    уходит только текст, выходящий за пределы уже отправленного; если
+    новая попытка отвечает иначе, ее фрагменты не пересылаются.
+    """
+
+    def __init__(self, on_delta: Callable[[str], None]):
+        self.on_delta = on_delta
+        self.relayed = ""
+
+    def attempt(self) -> Callable[[str], None]:
+        text = ""
+
+        def relay(delta: str):
+            nonlocal text
+            text += delta
+            if len(text) > len(self.relayed) and text.startswith(self.relayed):
+                new_text = text[len(self.relayed):]
+                self.relayed = text
+                self.on_delta(new_text)
+
+        return relay
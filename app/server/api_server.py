@@ -1,28 +1,237 @@
 import asyncio
+import hashlib
+import json
 import time
 import uuid
 
+import aiohttp
 import uvicorn
-from fastapi import APIRouter, Body, FastAPI, Request
-from fastapi.responses import JSONResponse
+from client.selector_registry import selector_registry
+from fastapi import APIRouter, Body, FastAPI, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from services.request_queue import request_queue
+from services.fair_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    normalize_priority,
+)
+from services import metrics
+from services.conversation_store import conversation_store
+from services.request_queue import (
+    STATUS_CANCELLED,
+    STATUS_EXPIRED,
+    request_queue,
+)
+from services.response_cache import is_error_answer, response_cache
 
+# Повторные попытки доставки уведомления о завершении задачи
+WEBHOOK_MAX_RETRIES = 3
+WEBHOOK_TIMEOUT = 10
+# Как часто проверять, не отключился ли клиент, ожидающий ответ (секунды)
+DISCONNECT_CHECK_INTERVAL = 1.0
 
-def start_api_server(
+
+async def deliver_webhook(url: str, payload: dict):
+    """Отправляет результат задачи на callback URL с повторными попытками"""
+    timeout = aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        for attempt in range(WEBHOOK_MAX_RETRIES):
+            try:
+                async with session.post(url, json=payload) as response:
+                    if response.status < 400:
+                        print(f"✅ Webhook доставлен: {url}")
+                        return True
+                    print(f"⚠️ Webhook {url} вернул {response.status}")
+            except Exception as e:
+                print(f"⚠️ Ошибка доставки webhook {url}: {e}")
+            await asyncio.sleep(2**attempt)
+
+    print(f"❌ Не удалось доставить webhook: {url}")
+    return False
+
+
+def client_scheduling(
+    request: Request, data: dict | None = None, default_priority: str = PRIORITY_INTERACTIVE
+) -> dict:
+    """Параметры планирования из заголовков: класс приоритета, клиент и его лимит.
+
+    X-Priority (или поле priority) - interactive, batch или background;
+    клиент определяется по X-Client-Id, затем по API-ключу, затем по IP;
+    X-Max-Concurrency ограничивает число одновременных запросов клиента.
+    """
+    priority = request.headers.get("X-Priority") or (data or {}).get("priority")
+
+    client_id = request.headers.get("X-Client-Id")
+    if not client_id:
+        api_key = request.headers.get("X-API-Key") or ""
+        authorization = request.headers.get("Authorization", "")
+        if not api_key and authorization.lower().startswith("bearer "):
+            api_key = authorization[7:].strip()
+        if api_key:
+            # Сам ключ не попадает в логи и журнал очереди
+            client_id = "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+        elif request.client:
+            client_id = request.client.host
+
+    try:
+        max_concurrency = int(request.headers.get("X-Max-Concurrency", 0)) or None
+    except ValueError:
+        max_concurrency = None
+
+    return {
+        "priority": normalize_priority(priority) or default_priority,
+        "client_id": client_id,
+        "max_concurrency": max_concurrency if max_concurrency and max_concurrency > 0 else None,
+    }
+
+
+def request_timeout(request: Request, data: dict | None = None) -> float | None:
+    """Срок ожидания ответа (сек) из заголовка X-Request-Timeout или поля timeout"""
+    value = request.headers.get("X-Request-Timeout") or (data or {}).get("timeout")
+    try:
+        timeout = float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+    return timeout if timeout and timeout > 0 else None
+
+
+async def wait_for_answer(
+    request: Request, future: asyncio.Future, request_id: str
+) -> str | None:
+    """Ждет результат запроса, пока клиент на связи.
+
+    Если клиент разорвал соединение, он отписывается от запроса (и запрос
+    отменяется, если его больше никто не ждет); возвращается None.
+    """
+    try:
+        while True:
+            done, _ = await asyncio.wait({future}, timeout=DISCONNECT_CHECK_INTERVAL)
+            if done:
+                return future.result()
+            if await request.is_disconnected():
+                print(f"🔌 Клиент отключился, не дождавшись ответа: {request_id}")
+                request_queue.unsubscribe(request_id)
+                return None
+    except asyncio.CancelledError:
+        request_queue.unsubscribe(request_id)
+        raise
+
+
+def failure_response(request_id: str) -> JSONResponse | None:
+    """Ответ для просроченного или отмененного запроса"""
+    queued = request_queue.get_request(request_id)
+    if queued and queued.status == STATUS_EXPIRED:
+        return JSONResponse(status_code=504, content={"error": queued.result})
+    if queued and queued.status == STATUS_CANCELLED:
+        return JSONResponse(status_code=499, content={"error": queued.result})
+    return None
+
+
+def stream_failed(request_id: str | None, result: str) -> bool:
+    """Потоковый ответ не удался: запрос просрочен, отменен или вернул ошибку"""
+    queued = request_queue.get_request(request_id) if request_id else None
+    if queued and queued.status in (STATUS_EXPIRED, STATUS_CANCELLED):
+        return True
+    return is_error_answer(result)
+
+
+def cache_policy(request: Request) -> tuple[bool, bool]:
+    """Можно ли взять ответ из кэша и сохранить новый (заголовок Cache-Control).
+
+    no-cache (или max-age=0) - запрос идет в браузер, ответ обновляет кэш;
+    no-store - кэш не используется совсем.
+    """
+    directives = {
+        directive.strip().lower()
+        for directive in request.headers.get("Cache-Control", "").split(",")
+    }
+    if "no-store" in directives:
+        return False, False
+    if "no-cache" in directives or "max-age=0" in directives:
+        return False, True
+    return True, True
+
+
+def caching_callback(key: str, store: bool, callback):
+    """Оборачивает обработчик результата, сохраняя ответ в кэш"""
+
+    def on_result(result: str):
+        if store:
+            response_cache.set(key, result)
+        callback(result)
+
+    return on_result
+
+
+def job_view(request_id: str) -> dict | None:
+    """Представление запроса очереди как задачи /jobs"""
+    request = request_queue.get_request(request_id)
+    if not request:
+        return None
+
+    eta = request_queue.estimate_wait(request_id)
+    return {
+        "id": request.id,
+        "status": request.status,
+        "position": request_queue.get_position(request_id),
+        "priority": request.priority,
+        "eta_seconds": round(eta, 1) if eta is not None else None,
+        "created_at": request.created_at,
+        "started_at": request.started_at,
+        "finished_at": request.finished_at,
+        "result": request.result,
+    }
+
+
+def create_app(
     handle_request_func,
     get_auth_status_func=None,
     provide_verification_code_func=None,
-):
+    concurrency: int = 1,
+) -> FastAPI:
+    """Собирает приложение API и подключает обработчик запросов к очереди"""
     app = FastAPI(title="GPT Bridge API", version="1.0.0")
 
     # Устанавливаем функцию обработки запросов в очереди
-    request_queue.set_handle_request_func(handle_request_func)
+    request_queue.set_handle_request_func(handle_request_func, concurrency)
+
+    # Ссылки на фоновые задачи (доставка webhook), чтобы их не собрал GC
+    background_tasks: set[asyncio.Task] = set()
+
+    def job_callback(job_id: str, callback_url: str | None):
+        """Обработчик завершения задачи: результат хранится в Request, webhook уходит в фоне"""
+
+        def on_complete(result: str):
+            view = job_view(job_id)
+            if callback_url and view:
+                task = asyncio.create_task(deliver_webhook(callback_url, view))
+                background_tasks.add(task)
+                task.add_done_callback(background_tasks.discard)
+
+        return on_complete
+
+    def idempotency_key(request: Request, data: dict | None = None) -> str | None:
+        """Ключ идемпотентности из заголовка Idempotency-Key или поля тела запроса"""
+        key = request.headers.get("Idempotency-Key")
+        if not key and data:
+            key = data.get("idempotency_key")
+        return str(key) if key else None
+
+    # Запросы, не завершенные до перезапуска, снова ставятся в очередь
+    asyncio.create_task(
+        request_queue.restore(
+            lambda request: job_callback(request.id, request.callback_url)
+        )
+    )
 
     @app.post("/ask")
-    async def ask_question(request: Request):
+    async def ask_question(request: Request, response: Response):
         try:
             data = await request.json()
+            if not isinstance(data, dict):
+                return JSONResponse(
+                    status_code=400, content={"error": "JSON body must be an object"}
+                )
             prompt = data.get("prompt", "")
 
             if not prompt:
@@ -30,24 +239,98 @@ def start_api_server(
                     status_code=400, content={"error": "Prompt is required"}
                 )
 
+            # Повторяющиеся промпты отдаются из кэша без обращения к браузеру
+            cache_key = response_cache.key(prompt)
+            use_cache, store = cache_policy(request)
+            cached = await response_cache.get(cache_key) if use_cache else None
+            response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+            if cached is not None:
+                return {"answer": cached}
+
             # Создаем Future для получения результата
             future = asyncio.Future()
 
             # Добавляем запрос в очередь
-            await request_queue.add_request(
-                prompt, lambda result: future.set_result(result)
+            request_id = await request_queue.add_request(
+                prompt,
+                caching_callback(cache_key, store, future.set_result),
+                idempotency_key=idempotency_key(request, data),
+                timeout=request_timeout(request, data),
+                **client_scheduling(request, data),
             )
 
-            # Ждем результат из очереди
-            answer = await future
+            # Ждем результат из очереди, пока клиент на связи
+            answer = await wait_for_answer(request, future, request_id)
+            if answer is None:
+                return JSONResponse(
+                    status_code=499, content={"error": "Client disconnected"}
+                )
 
-            return {"answer": answer}
+            return failure_response(request_id) or {"answer": answer}
 
         except Exception as e:
             return JSONResponse(
                 status_code=500, content={"error": f"Internal server error: {str(e)}"}
             )
 
+    @app.post("/jobs", status_code=202)
+    async def create_job(request: Request):
+        """Ставит запрос в очередь и сразу возвращает ID задачи"""
+        try:
+            data = await request.json()
+        except Exception:
+            return JSONResponse(status_code=400, content={"error": "Invalid JSON"})
+        if not isinstance(data, dict):
+            return JSONResponse(
+                status_code=400, content={"error": "JSON body must be an object"}
+            )
+
+        prompt = data.get("prompt", "")
+        callback_url = data.get("callback_url")
+
+        if not prompt:
+            return JSONResponse(status_code=400, content={"error": "Prompt is required"})
+        if callback_url and not str(callback_url).startswith(("http://", "https://")):
+            return JSONResponse(
+                status_code=400, content={"error": "callback_url must be http(s)"}
+            )
+
+        job_id = ""
+
+        def on_complete(result: str):
+            job_callback(job_id, callback_url)(result)
+
+        job_id = await request_queue.add_request(
+            prompt,
+            on_complete,
+            callback_url=callback_url,
+            idempotency_key=idempotency_key(request, data),
+            timeout=request_timeout(request, data),
+            # Задачи по умолчанию не вытесняют интерактивные запросы
+            **client_scheduling(request, data, default_priority=PRIORITY_BATCH),
+        )
+
+        return job_view(job_id)
+
+    @app.get("/jobs/{job_id}")
+    async def get_job(job_id: str):
+        """Возвращает статус, позицию в очереди и результат задачи"""
+        view = job_view(job_id)
+        if not view:
+            return JSONResponse(status_code=404, content={"error": "Job not found"})
+        return view
+
+    @app.delete("/jobs/{job_id}")
+    async def cancel_job(job_id: str):
+        """Отменяет задачу: убирает из очереди или прерывает генерацию"""
+        if not request_queue.get_request(job_id):
+            return JSONResponse(status_code=404, content={"error": "Job not found"})
+        if not request_queue.cancel(job_id):
+            return JSONResponse(
+                status_code=409, content={"error": "Job is already finished"}
+            )
+        return job_view(job_id)
+
     @app.get("/auth/status")
     async def auth_status():
         """Эндпоинт для проверки статуса аутентификации"""
@@ -83,7 +366,13 @@ def start_api_server(
                     status_code=400, content={"error": "Verification code is required"}
                 )
 
-            success = await provide_verification_code_func(code)
+            # Для нескольких аккаунтов можно указать, чей это код;
+            # по умолчанию код получает аккаунт, ожидающий подтверждения
+            account = data.get("account")
+            if account:
+                success = await provide_verification_code_func(code, account)
+            else:
+                success = await provide_verification_code_func(code)
 
             if success:
                 return {
@@ -111,8 +400,25 @@ def start_api_server(
             "service": "GPT Bridge API",
             "queue_size": queue_size,
             "processing": is_processing,
+            "queue_depths": request_queue.get_queue_depths(),
+            "in_flight": len(request_queue.get_current_requests()),
+            "coalescing": request_queue.get_coalescing_stats(),
+            "cache": response_cache.get_stats(),
+            "conversations": conversation_store.get_stats(),
+            "selectors": selector_registry.get_stats(),
+            "concurrency": request_queue.concurrency,
         }
 
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        """Метрики в текстовом формате Prometheus"""
+        for priority, depth in request_queue.get_queue_depths().items():
+            metrics.QUEUE_DEPTH.set(depth, priority)
+        metrics.IN_FLIGHT.set(len(request_queue.get_current_requests()))
+        return PlainTextResponse(
+            metrics.render(), media_type="text/plain; version=0.0.4"
+        )
+
     class ChatMessage(BaseModel):
         role: str
         content: str
@@ -124,11 +430,15 @@ def start_api_server(
         top_p: float = 1.0
         n: int = 1
         stream: bool = False
+        # Срок ожидания ответа в секундах (также заголовок X-Request-Timeout)
+        timeout: float | None = None
 
     router = APIRouter()
 
     @router.post("/v1/chat/completions")
-    async def openai_chat_completions(req: OpenAIChatRequest = Body(...)):
+    async def openai_chat_completions(
+        request: Request, response: Response, req: OpenAIChatRequest = Body(...)
+    ):
         # Извлекаем system + user сообщение
         system_prompt = next(
             (m.content for m in req.messages if m.role == "system"), ""
@@ -139,11 +449,58 @@ def start_api_server(
         full_prompt = (
             f"{system_prompt}\n{user_message}" if system_prompt else user_message
         )
+        cache_text = user_message
+
+        # Продолжение диалога: в известный тред уходит только новое сообщение,
+        # иначе вся история отправляется в новый тред
+        conversation = None
+        if request_queue.supports_conversations:
+            conversation = conversation_store.prepare(
+                [(m.role, m.content) for m in req.messages]
+            )
+        if conversation:
+            full_prompt = conversation.prompt
+            cache_text = conversation.full_prompt
 
-        # Отправляем запрос в твою очередь
-        future = asyncio.Future()
-        await request_queue.add_request(full_prompt, lambda r: future.set_result(r))
-        answer = await future
+        options = {
+            "idempotency_key": idempotency_key(request),
+            "timeout": request_timeout(request, {"timeout": req.timeout}),
+            "conversation": conversation,
+            **client_scheduling(request),
+        }
+
+        # Ключ кэша учитывает всю историю диалога, а не только последнее сообщение
+        cache_key = response_cache.key(cache_text, system_prompt)
+        use_cache, store = cache_policy(request)
+        cached = await response_cache.get(cache_key) if use_cache else None
+        if cached is not None and conversation:
+            # Тред не получил этот ход - следующий ход начнет новый тред
+            conversation.release()
+
+        if req.stream:
+            return await _stream_chat_completion(
+                req.model, full_prompt, options, cache_key, store, cached
+            )
+
+        response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+        if cached is not None:
+            answer = cached
+        else:
+            # Отправляем запрос в твою очередь
+            future = asyncio.Future()
+            request_id = await request_queue.add_request(
+                full_prompt,
+                caching_callback(cache_key, store, future.set_result),
+                **options,
+            )
+            answer = await wait_for_answer(request, future, request_id)
+            if answer is None:
+                return JSONResponse(
+                    status_code=499, content={"error": "Client disconnected"}
+                )
+            failure = failure_response(request_id)
+            if failure:
+                return failure
 
         # Рассчитываем usage
         prompt_tokens = len(full_prompt.split())
@@ -168,7 +525,116 @@ def start_api_server(
             },
         }
 
+    async def _stream_chat_completion(
+        model: str,
+        prompt: str,
+        options: dict,
+        cache_key: str,
+        store: bool,
+        cached: str | None = None,
+    ) -> StreamingResponse:
+        """Отдает ответ в формате SSE (chat.completion.chunk) по мере генерации"""
+        events: asyncio.Queue = asyncio.Queue()
+        request_id = None
+        if cached is not None:
+            # Ответ из кэша уходит одним фрагментом
+            events.put_nowait(("done", cached))
+        else:
+            request_id = await request_queue.add_request(
+                prompt,
+                caching_callback(
+                    cache_key,
+                    store,
+                    lambda result: events.put_nowait(("done", result)),
+                ),
+                on_delta=lambda delta: events.put_nowait(("delta", delta)),
+                **options,
+            )
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:8]}"
+        created = int(time.time())
+
+        def chunk(delta: dict, finish_reason=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        def error_chunk(message: str) -> str:
+            payload = {"error": {"message": message, "type": "bridge_error"}}
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        async def event_stream():
+            finished = False
+            try:
+                # Первый чанк уходит сразу, не дожидаясь начала генерации
+                yield chunk({"role": "assistant", "content": ""})
+
+                streamed = ""
+                while True:
+                    kind, text = await events.get()
+                    if kind == "delta":
+                        if text:
+                            streamed += text
+                            yield chunk({"content": text})
+                        continue
+
+                    finished = True
+                    if stream_failed(request_id, text):
+                        # Ошибка после части ответа или просроченный/отмененный
+                        # запрос: клиент не должен принять обрывок за полный ответ
+                        yield error_chunk(text)
+                        yield "data: [DONE]\n\n"
+                        return
+
+                    # Итоговый ответ: досылаем то, что не пришло фрагментами.
+                    # Фрагменты и итог могут прийти из разных источников (текст
+                    # страницы и markdown из сетевого потока) - тогда итог не
+                    # продолжает отправленное и досылать нечего
+                    if text.startswith(streamed) and len(text) > len(streamed):
+                        yield chunk({"content": text[len(streamed):]})
+                    break
+
+                yield chunk({}, finish_reason="stop")
+                yield "data: [DONE]\n\n"
+            finally:
+                # Поток закрыт до получения ответа - клиент отключился
+                if not finished and request_id:
+                    print(f"🔌 Клиент отключился от потока: {request_id}")
+                    request_queue.unsubscribe(request_id)
+
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+                "X-Cache": "HIT" if cached is not None else "MISS",
+            },
+        )
+
     app.include_router(router)
+    return app
+
+
+def start_api_server(
+    handle_request_func,
+    get_auth_status_func=None,
+    provide_verification_code_func=None,
+    concurrency: int = 1,
+):
+    app = create_app(
+        handle_request_func,
+        get_auth_status_func,
+        provide_verification_code_func,
+        concurrency,
+    )
 
     # Запускаем сервер
     config = uvicorn.Config(app, host="0.0.0.0", port=8010, log_level="info")
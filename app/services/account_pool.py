@@ -0,0 +1,243 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from client.browser_client import COOKIES_PATH, PROJECT_ROOT, BrowserClient
+from client.page_pool import PagePool
+from services.metrics import ACCOUNT_RATE_LIMITS_TOTAL, ACCOUNT_REQUESTS_TOTAL
+
+# JSON-файл со списком аккаунтов: [{"name": ..., "email": ..., "password": ...}]
+# Если не задан, используется один аккаунт из EMAIL_ADDRESS / PASSWORD
+ACCOUNTS_FILE = os.getenv("ACCOUNTS_FILE", "")
+# Каталог файлов сессий аккаунтов из ACCOUNTS_FILE
+SESSIONS_DIR = os.getenv("SESSIONS_DIR", os.path.join(PROJECT_ROOT, "sessions"))
+# Пауза для аккаунта, упершегося в лимит запросов (секунды)
+ACCOUNT_COOLDOWN = float(os.getenv("ACCOUNT_COOLDOWN", "900"))
+
+# Имя аккаунта по умолчанию (EMAIL_ADDRESS / PASSWORD и cookies.json)
+DEFAULT_ACCOUNT = "default"
+
+
+@dataclass
+class AccountConfig:
+    name: str
+    email: str
+    password: str
+    cookies_path: str
+
+
+def load_account_configs(path: str = ACCOUNTS_FILE) -> list[AccountConfig]:
+    """Читает список аккаунтов из ACCOUNTS_FILE или из переменных окружения"""
+    if not path:
+        return [
+            AccountConfig(
+                name=DEFAULT_ACCOUNT,
+                email=os.getenv("EMAIL_ADDRESS", ""),
+                password=os.getenv("PASSWORD", ""),
+                cookies_path=COOKIES_PATH,
+            )
+        ]
+
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    configs = []
+    for index, item in enumerate(items, start=1):
+        name = str(item.get("name") or f"account{index}")
+        if any(config.name == name for config in configs):
+            raise ValueError(f"Повторяющееся имя аккаунта в {path}: {name}")
+        configs.append(
+            AccountConfig(
+                name=name,
+                email=item.get("email", ""),
+                password=item.get("password", ""),
+                cookies_path=item.get("cookies_path")
+                or os.path.join(SESSIONS_DIR, f"{name}.json"),
+            )
+        )
+    if not configs:
+        raise ValueError(f"В {path} не указано ни одного аккаунта")
+    return configs
+
+
+@dataclass
+class Account:
+    """Аккаунт ChatGPT со своим браузером, пулом вкладок и файлом сессии"""
+
+    config: AccountConfig
+    browser: BrowserClient
+    pool: PagePool
+    # Запасной браузер аккаунта (WARM_STANDBY) и задача его подготовки
+    standby: Optional[BrowserClient] = None
+    standby_task: Optional[asyncio.Task] = None
+    in_flight: int = 0
+    cooldown_until: float = 0.0
+    total_requests: int = 0
+    rate_limits: int = 0
+    last_rate_limit: str = ""
+    restart_count: int = 0
+    last_restart_time: float = 0.0
+    # Порядок аккаунта для round-robin среди одинаково загруженных
+    order: int = 0
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def is_authenticated(self) -> bool:
+        return self.browser.auth_status.get("status") == "completed"
+
+    def is_cooling_down(self, now: Optional[float] = None) -> bool:
+        return (now or time.time()) < self.cooldown_until
+
+    def load(self) -> float:
+        """Доля занятых вкладок аккаунта"""
+        return self.in_flight / self.pool.size
+
+
+class AccountPool:
+    """Распределяет запросы между аккаунтами ChatGPT.
+
+    Выбирается наименее загруженный авторизованный аккаунт, среди
+    одинаково загруженных - по кругу. Аккаунт, показавший баннер лимита
+    запросов, исключается из выбора на ACCOUNT_COOLDOWN секунд.
+    """
+
+    def __init__(self, accounts: list[Account], cooldown: float = ACCOUNT_COOLDOWN):
+        if not accounts:
+            raise ValueError("Нужен хотя бы один аккаунт")
+        for order, account in enumerate(accounts):
+            account.order = order
+        self.accounts = accounts
+        self.cooldown = cooldown
+        self._next = 0
+
+    @property
+    def primary(self) -> Account:
+        return self.accounts[0]
+
+    def get(self, name: Optional[str]) -> Optional[Account]:
+        for account in self.accounts:
+            if account.name == name:
+                return account
+        return None
+
+    def capacity(self) -> int:
+        """Сколько запросов аккаунты могут обрабатывать одновременно"""
+        return sum(account.pool.size for account in self.accounts)
+
+    def _pick(self, exclude: set[str]) -> Optional[Account]:
+        now = time.time()
+        candidates = [
+            account
+            for account in self.accounts
+            if account.name not in exclude
+            and account.is_authenticated()
+            and not account.is_cooling_down(now)
+        ]
+        if not candidates:
+            return None
+
+        total = len(self.accounts)
+        account = min(
+            candidates,
+            key=lambda item: (item.load(), (item.order - self._next) % total),
+        )
+        self._next = (account.order + 1) % total
+        return account
+
+    async def acquire(
+        self,
+        exclude: Optional[set[str]] = None,
+        prefer: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Optional[Account]:
+        """Выбирает аккаунт для запроса.
+
+        prefer - имя аккаунта, которому принадлежит тред диалога: он
+        выбирается независимо от загрузки, если доступен.
+
+        Если все неисключенные аккаунты на паузе после лимита, ждет
+        окончания ближайшей паузы, но не дольше deadline (time.time()
+        срока запроса). Возвращает None, если пауза кончится позже срока
+        или ждать нечего (все аккаунты уже пробовали для этого запроса).
+        Если ни один аккаунт не авторизован, возвращает основной - запрос
+        получит ту же ошибку, что и без пула аккаунтов.
+        """
+        exclude = exclude or set()
+        preferred = self.get(prefer)
+        if (
+            preferred
+            and preferred.name not in exclude
+            and preferred.is_authenticated()
+            and not preferred.is_cooling_down()
+        ):
+            return self._take(preferred)
+
+        while True:
+            account = self._pick(exclude)
+            if account:
+                return self._take(account)
+
+            cooling = [
+                account
+                for account in self.accounts
+                if account.name not in exclude
+                and account.is_authenticated()
+                and account.is_cooling_down()
+            ]
+            if cooling:
+                resume_at = min(account.cooldown_until for account in cooling)
+                if deadline is not None and resume_at > deadline:
+                    print("⏳ Пауза аккаунтов закончится позже срока запроса")
+                    return None
+                wait = resume_at - time.time()
+                print(f"⏳ Все аккаунты на паузе после лимита, ждем {wait:.0f} с")
+                await asyncio.sleep(max(wait, 0.1))
+                continue
+
+            if exclude:
+                return None
+            return self._take(self.primary)
+
+    @staticmethod
+    def _take(account: Account) -> Account:
+        account.in_flight += 1
+        account.total_requests += 1
+        ACCOUNT_REQUESTS_TOTAL.inc(account.name)
+        return account
+
+    def release(self, account: Account):
+        account.in_flight = max(0, account.in_flight - 1)
+
+    def cool_down(self, account: Account, reason: str):
+        """Исключает аккаунт из выбора после баннера лимита запросов"""
+        account.cooldown_until = time.time() + self.cooldown
+        account.rate_limits += 1
+        account.last_rate_limit = reason
+        ACCOUNT_RATE_LIMITS_TOTAL.inc(account.name)
+        print(
+            f"⛔ Аккаунт {account.name} уперся в лимит запросов ({reason}), "
+            f"пауза {self.cooldown:.0f} с"
+        )
+
+    def get_status(self) -> list[dict]:
+        """Состояние аккаунтов для /auth/status"""
+        now = time.time()
+        return [
+            {
+                "name": account.name,
+                "email": account.config.email,
+                "status": account.browser.auth_status.get("status"),
+                "in_flight": account.in_flight,
+                "tabs": account.pool.size,
+                "total_requests": account.total_requests,
+                "rate_limits": account.rate_limits,
+                "cooldown_remaining": max(0, round(account.cooldown_until - now)),
+                "standby_ready": account.standby is not None,
+            }
+            for account in self.accounts
+        ]
@@ -1,73 +1,261 @@
 import asyncio
 import os
 import time
-from typing import Optional
+from typing import Callable, Optional
 
-from client.browser_client import BrowserClient
+from client.browser_client import CHATGPT_URL, BrowserClient
+from client.page_pool import PagePool, PageWorker
+from client.stream_parser import DeltaRelay
 from server.api_server import start_api_server
+from services.account_pool import Account, AccountConfig, AccountPool, load_account_configs
+from services.conversation_store import ConversationTurn, conversation_store
+from services.metrics import BROWSER_RESTARTS_TOTAL
+from services.request_queue import request_queue
+from services.response_cache import is_error_answer, response_cache
+
+# Держать запасной браузер с той же сессией для быстрого переключения
+WARM_STANDBY = os.getenv("WARM_STANDBY", "0").lower() in ("1", "true", "yes")
+# Интервал проверки запасного браузера (секунды)
+WARM_STANDBY_CHECK_INTERVAL = float(os.getenv("WARM_STANDBY_CHECK_INTERVAL", "30"))
+
+# Ответ, если аккаунт уперся в лимит запросов, а другого свободного аккаунта нет
+RATE_LIMIT_ERROR = "Ошибка: аккаунт ChatGPT достиг лимита запросов"
 
 
 class ChatGPTBridgeService:
     def __init__(self):
-        self.browser = BrowserClient()
+        self.accounts = AccountPool(
+            [self._new_account(config) for config in load_account_configs()]
+        )
+        self._background: set[asyncio.Task] = set()
         self._initialized = False
-        self._restart_count = 0
         self._max_restarts = 3
-        self._last_restart_time = 0
         self._restart_cooldown = 60  # 60 секунд между перезапусками
 
+    @property
+    def browser(self) -> BrowserClient:
+        """Браузер основного аккаунта"""
+        return self.accounts.primary.browser
+
+    @property
+    def pool(self) -> PagePool:
+        """Пул вкладок основного аккаунта"""
+        return self.accounts.primary.pool
+
+    @staticmethod
+    def _new_client(config: AccountConfig) -> BrowserClient:
+        client = BrowserClient(
+            email=config.email,
+            password=config.password,
+            cookies_path=config.cookies_path,
+        )
+        # С запасным браузером клиент не перезапускает браузер сам:
+        # ошибка доходит до сервиса, который переключается на запасной
+        client.restart_browser_on_failure = not WARM_STANDBY
+        return client
+
+    def _new_account(self, config: AccountConfig) -> Account:
+        browser = self._new_client(config)
+        return Account(config=config, browser=browser, pool=PagePool(browser))
+
     async def initialize(self):
-        """Асинхронная инициализация браузера"""
+        """Асинхронная инициализация браузеров всех аккаунтов"""
         if not self._initialized:
-            # Пытаемся восстановить сессию
-            session_restored = await self.browser.initialize_with_session()
-            
-            if session_restored:
-                print("✅ Сессия успешно восстановлена")
-                self._initialized = True
-            else:
-                # Если сессия не восстановлена, выполняем полную инициализацию
-                # Браузер уже инициализирован в initialize_with_session()
-                self._initialized = True
+            # Пытаемся восстановить сессии, браузеры аккаунтов поднимаются параллельно.
+            # Если сессия не восстановлена, браузер уже инициализирован
+            # в initialize_with_session()
+            results = await asyncio.gather(
+                *(account.browser.initialize_with_session() for account in self.accounts.accounts)
+            )
+            for account, session_restored in zip(self.accounts.accounts, results):
+                if session_restored:
+                    print(f"✅ Сессия аккаунта {account.name} успешно восстановлена")
+            self._initialized = True
+
+    async def handle_request(
+        self,
+        prompt: str,
+        on_delta: Optional[Callable[[str], None]] = None,
+        conversation: Optional[ConversationTurn] = None,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """Обрабатывает запрос на наименее загруженном аккаунте.
 
-    async def handle_request(self, prompt: str) -> str:
-        """Обрабатывает запрос и возвращает ответ с автоматическим перезапуском при ошибках"""
+        Если аккаунт уперся в лимит запросов, он уходит на паузу, а запрос
+        повторяется на другом аккаунте; если все на паузе - ждет ближайшей
+        до deadline. Ход диалога выполняется на аккаунте
+        и, по возможности, во вкладке, где открыт его тред. Повторы не
+        пересылают получателю фрагментов уже отправленный текст.
+        """
         if not self._initialized:
             await self.initialize()
 
+        relay = DeltaRelay(on_delta) if on_delta else None
+
+        tried: set[str] = set()
         try:
-            # Используем метод с переподключением
-            result = await self.browser.send_and_get_answer_with_reconnect(prompt)
-            
-            # Проверяем результат на ошибки, требующие перезапуска
+            while True:
+                thread = conversation.thread if conversation else None
+                account = await self.accounts.acquire(
+                    exclude=tried,
+                    prefer=thread.account if thread else None,
+                    deadline=deadline,
+                )
+                if account is None:
+                    return RATE_LIMIT_ERROR
+                if thread and account.name != thread.account:
+                    # Тред доступен только своему аккаунту - начинаем новый
+                    print(f"🧵 Аккаунт треда {thread.account} недоступен, история уйдет в новый тред")
+                    conversation.thread = None
+                try:
+                    result = await self._handle_on_account(
+                        account, prompt, relay, conversation
+                    )
+                finally:
+                    self.accounts.release(account)
+
+                if result != RATE_LIMIT_ERROR:
+                    return result
+                tried.add(account.name)
+        finally:
+            if conversation:
+                conversation.release()
+
+    async def _handle_on_account(
+        self,
+        account: Account,
+        prompt: str,
+        relay: Optional[DeltaRelay] = None,
+        conversation: Optional[ConversationTurn] = None,
+    ) -> str:
+        """Выполняет запрос на аккаунте с автоматическим перезапуском при ошибках"""
+        try:
+            # Используем свободную вкладку пула
+            result = await self._run_on_worker(account, prompt, relay, conversation)
+
+            # Проверяем результат на ошибки, требующие перезапуска.
+            # Сломанную вкладку пул пересоздает сам, весь браузер
+            # перезапускается только если он недоступен
             if self._should_restart(result):
-                await self._restart_service("Ошибка в ответе браузера")
-                # Повторяем запрос после перезапуска
-                result = await self.browser.send_and_get_answer_with_reconnect(prompt)
-            
+                if not account.browser.is_browser_alive():
+                    await self._restart_service("Ошибка в ответе браузера", account)
+                # Повторяем запрос
+                result = await self._run_on_worker(account, prompt, relay, conversation)
+
             return result
-            
+
         except Exception as e:
             print(f"❌ Критическая ошибка при обработке запроса: {e}")
-            await self._restart_service(f"Исключение: {str(e)}")
-            
+            await self._restart_service(f"Исключение: {str(e)}", account)
+
             # Повторяем запрос после перезапуска
-            return await self.browser.send_and_get_answer_with_reconnect(prompt)
+            return await self._run_on_worker(account, prompt, relay, conversation)
+
+    async def _run_on_worker(
+        self,
+        account: Account,
+        prompt: str,
+        relay: Optional[DeltaRelay] = None,
+        conversation: Optional[ConversationTurn] = None,
+    ) -> str:
+        """Выполняет запрос на свободной вкладке и сообщает пулу о ее состоянии"""
+        thread = conversation.thread if conversation else None
+        worker: PageWorker = await account.pool.acquire(
+            prefer=thread.worker_id if thread else None
+        )
+        ok: Optional[bool] = False
+        error = ""
+        try:
+            if conversation:
+                # Известный тред получает только новое сообщение,
+                # вся история уходит в новый чат
+                try:
+                    await worker.client.open_thread(thread.url if thread else None)
+                except Exception as e:
+                    if not thread:
+                        raise
+                    print(f"⚠️ Не удалось открыть тред {thread.url}: {e}")
+                    conversation.thread = None
+                    await worker.client.open_thread(None)
+                prompt = conversation.prompt
+            elif worker.client.thread_url:
+                # Посторонний запрос не должен попасть в тред диалога
+                await worker.client.open_thread(None)
+
+            result = await worker.client.send_and_get_answer_with_reconnect(
+                prompt, on_delta=relay.attempt() if relay else None
+            )
+            banner = await worker.client.detect_rate_limit()
+            if banner:
+                self.accounts.cool_down(account, banner)
+                result = RATE_LIMIT_ERROR
+            ok = not self._should_restart(result)
+            if not ok:
+                error = result
+            elif conversation and not is_error_answer(result):
+                self._remember_thread(account, worker, conversation, result)
+            return result
+        except asyncio.CancelledError:
+            # Отмену запроса не засчитываем вкладке как ошибку
+            ok = None
+            raise
+        except Exception as e:
+            error = str(e)
+            raise
+        finally:
+            await account.pool.release(worker, ok, error)
+
+    @staticmethod
+    def _remember_thread(
+        account: Account, worker: PageWorker, conversation: ConversationTurn, answer: str
+    ):
+        """Связывает продолженную историю диалога с тредом, открытым во вкладке"""
+        url = worker.client.page.url if worker.client.page else ""
+        if not url or url.rstrip("/") == CHATGPT_URL.rstrip("/"):
+            # Ответ не получил собственного URL треда - продолжить его нельзя
+            return
+        conversation_store.commit(conversation, answer, url, account.name, worker.id)
+        worker.client.thread_url = url
 
     async def get_auth_status(self):
-        """Возвращает статус аутентификации"""
-        return await self.browser.get_auth_status()
+        """Возвращает статус аутентификации.
+
+        Поля верхнего уровня описывают основной аккаунт; статус "completed",
+        если авторизован хотя бы один аккаунт. Список accounts - все аккаунты.
+        """
+        status = dict(await self.browser.get_auth_status())
+        if any(account.is_authenticated() for account in self.accounts.accounts):
+            status["status"] = "completed"
+        status["accounts"] = self.accounts.get_status()
+        return status
 
-    async def provide_verification_code(self, code: str) -> bool:
+    def _account_for_code(self, name: Optional[str]) -> Account:
+        """Аккаунт, которому предназначен код подтверждения"""
+        if name:
+            account = self.accounts.get(name)
+            if not account:
+                raise ValueError(f"Неизвестный аккаунт: {name}")
+            return account
+        for account in self.accounts.accounts:
+            if account.browser.auth_status.get("status") == "waiting_code":
+                return account
+        return self.accounts.primary
+
+    async def provide_verification_code(
+        self, code: str, account_name: Optional[str] = None
+    ) -> bool:
         """Предоставляет код подтверждения для пошаговой аутентификации"""
         if not self._initialized:
             await self.initialize()
 
-        await self.browser.set_verification_code(code)
-        success = await self.browser._handle_verification_code()
+        account = self._account_for_code(account_name)
+        await account.browser.set_verification_code(code)
+        success = await account.browser._handle_verification_code()
         # Проверяем статус авторизации после ввода кода
-        auth_status = await self.browser.get_auth_status()
+        auth_status = await account.browser.get_auth_status()
         if auth_status.get("status") == "completed":
+            # Сессия сохранена - теперь можно подготовить запасной браузер
+            self._schedule_standby(account)
             return True
         return success
 
@@ -76,42 +264,50 @@ class ChatGPTBridgeService:
         await self.initialize()
         print("✅ ChatGPT Bridge Service запущен и готов к работе")
 
-        # Проверяем статус аутентификации
-        auth_status = await self.get_auth_status()
-        
-        # Запускаем авторизацию только если сессия не восстановлена
-        if auth_status.get("status") != "completed":
-            await self.start_authentication()
+        # Запускаем авторизацию только для аккаунтов без восстановленной сессии
+        pending = []
+        for account in self.accounts.accounts:
+            if account.is_authenticated():
+                self._schedule_standby(account)
+            else:
+                pending.append(self.start_authentication(account))
+        if pending:
+            await asyncio.gather(*pending)
+
+        if WARM_STANDBY:
+            self._spawn(self._standby_watchdog())
 
         # Запускаем API сервер, который вызывает handle_request
         start_api_server(
             self.handle_request,
             self.get_auth_status,
             self.provide_verification_code,
+            concurrency=self.accounts.capacity(),
         )
 
         # Бесконечный цикл для поддержания работы сервиса
         while True:
             await asyncio.sleep(1)
 
-    async def start_authentication(self):
+    async def start_authentication(self, account: Optional[Account] = None):
         """Начинает процесс авторизации и останавливается на этапе кода подтверждения"""
-        print("🔄 Начинаю процесс авторизации...")
+        account = account or self.accounts.primary
+        print(f"🔄 Начинаю процесс авторизации аккаунта {account.name}...")
 
-        email = os.getenv("EMAIL_ADDRESS", "")
-        password = os.getenv("PASSWORD", "")
+        email = account.config.email
+        password = account.config.password
 
         if not email or not password:
-            print("❌ Email или пароль не установлены в переменных окружения")
+            print(f"❌ Email или пароль аккаунта {account.name} не установлены")
             return False
 
         print(f"🔄 Выполняю авторизацию для: {email}")
 
         # Устанавливаем данные для аутентификации
-        await self.browser.set_auth_data(email=email, password=password)
+        await account.browser.set_auth_data(email=email, password=password)
 
         # Выполняем авторизацию до этапа кода подтверждения
-        success = await self.browser.start_authentication_until_code()
+        success = await account.browser.start_authentication_until_code()
 
         if success:
             print(
@@ -131,48 +327,143 @@ class ChatGPTBridgeService:
             "Ошибка обработки запроса",
             "❌ Не удалось выполнить запрос после всех попыток"
         ]
-        
+
         return any(error in result for error in critical_errors)
 
-    async def _restart_service(self, reason: str):
-        """Перезапускает сервис с проверкой лимитов"""
+    async def _restart_service(self, reason: str, account: Optional[Account] = None):
+        """Перезапускает браузер аккаунта с проверкой лимитов"""
+        account = account or self.accounts.primary
         current_time = time.time()
-        
+
         # Проверяем кулдаун между перезапусками
-        if current_time - self._last_restart_time < self._restart_cooldown:
+        if current_time - account.last_restart_time < self._restart_cooldown:
             print(f"⚠️ Слишком частый перезапуск, пропускаем (кулдаун: {self._restart_cooldown}с)")
             return
-        
+
         # Проверяем максимальное количество перезапусков
-        if self._restart_count >= self._max_restarts:
+        if account.restart_count >= self._max_restarts:
             print(f"❌ Достигнут лимит перезапусков ({self._max_restarts}). Сервис остановлен.")
             raise RuntimeError(f"Достигнут лимит перезапусков: {reason}")
-        
-        self._restart_count += 1
-        self._last_restart_time = current_time
-        
-        print(f"🔄 Перезапуск сервиса ({self._restart_count}/{self._max_restarts}) по причине: {reason}")
-        
+
+        account.restart_count += 1
+        account.last_restart_time = current_time
+        BROWSER_RESTARTS_TOTAL.inc()
+
+        print(
+            f"🔄 Перезапуск аккаунта {account.name} "
+            f"({account.restart_count}/{self._max_restarts}) по причине: {reason}"
+        )
+
+        if await self._swap_to_standby(account):
+            print("✅ Сервис переключен на запасной браузер")
+            return
+
         # Закрываем текущий браузер
-        await self.browser.close()
-        
-        # Сбрасываем состояние
-        self._initialized = False
-        self.browser = BrowserClient()
-        
-        # Переинициализируем
-        await self.initialize()
-        
+        await account.browser.close()
+
+        # Поднимаем новый браузер аккаунта
+        account.browser = self._new_client(account.config)
+        await account.pool.reset(account.browser)
+        await account.browser.initialize_with_session()
+
         # Если требуется авторизация, запускаем её
-        auth_status = await self.browser.get_auth_status()
+        auth_status = await account.browser.get_auth_status()
         if auth_status.get("status") != "completed":
-            await self.start_authentication()
-        
+            await self.start_authentication(account)
+        else:
+            self._schedule_standby(account)
+
         print("✅ Сервис успешно перезапущен")
 
+    def _spawn(self, coro) -> asyncio.Task:
+        """Запускает фоновую задачу и держит ссылку на нее до завершения"""
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return task
+
+    def _schedule_standby(self, account: Account):
+        """Запускает подготовку запасного браузера, если она еще не идет"""
+        if not WARM_STANDBY or account.standby:
+            return
+        if account.standby_task and not account.standby_task.done():
+            return
+        account.standby_task = self._spawn(self._build_standby(account))
+
+    async def _build_standby(self, account: Account):
+        """Поднимает запасной браузер с сохраненной сессией вне пути запросов"""
+        print(f"🔄 Подготавливаем запасной браузер аккаунта {account.name}...")
+        client = self._new_client(account.config)
+        try:
+            session_restored = await client.initialize_with_session()
+        except Exception as e:
+            print(f"⚠️ Не удалось подготовить запасной браузер: {e}")
+            session_restored = False
+
+        if not session_restored or not client.is_browser_alive():
+            # Без авторизованной сессии запасной браузер бесполезен
+            print("⚠️ Запасной браузер не получил сессию, повторим позже")
+            await self._teardown(client)
+            return
+
+        account.standby = client
+        print(f"✅ Запасной браузер аккаунта {account.name} готов")
+
+    async def _swap_to_standby(self, account: Account) -> bool:
+        """Атомарно переключает аккаунт на запасной браузер.
+
+        Старый браузер закрывается в фоне, новый запасной поднимается
+        тоже в фоне, поэтому очередь простаивает только на время
+        переключения ссылок.
+        """
+        standby = account.standby
+        if not standby or not standby.is_browser_alive():
+            return False
+
+        account.standby = None
+        # Cookies могли обновиться после подготовки запасного браузера
+        await standby.load_session_cookies()
+
+        failed = account.browser
+        account.browser = standby
+        await account.pool.reset(standby)
+
+        self._spawn(self._teardown(failed))
+        self._schedule_standby(account)
+        return True
+
+    @staticmethod
+    async def _teardown(client: BrowserClient):
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"⚠️ Ошибка при закрытии браузера: {e}")
+
+    async def _standby_watchdog(self):
+        """Пересоздает запасной браузер, если его процесс завершился"""
+        while True:
+            await asyncio.sleep(WARM_STANDBY_CHECK_INTERVAL)
+            for account in self.accounts.accounts:
+                standby = account.standby
+                if standby and not standby.is_browser_alive():
+                    print(f"⚠️ Запасной браузер аккаунта {account.name} недоступен, пересоздаем")
+                    account.standby = None
+                    self._spawn(self._teardown(standby))
+                if account.is_authenticated():
+                    self._schedule_standby(account)
+
     async def close(self):
-        """Закрывает браузер"""
-        await self.browser.close()
+        """Закрывает браузеры аккаунтов и сбрасывает журнал очереди на диск"""
+        for task in list(self._background):
+            task.cancel()
+        await request_queue.close()
+        await response_cache.close()
+        for account in self.accounts.accounts:
+            await account.pool.close()
+            await account.browser.close()
+            if account.standby:
+                await account.standby.close()
+                account.standby = None
 
 
 async def main():
@@ -0,0 +1,190 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from services.request_queue import normalize_prompt
+
+# Продолжать многошаговые диалоги /v1/chat/completions в том же треде ChatGPT
+CONVERSATION_AFFINITY = os.getenv("CONVERSATION_AFFINITY", "1") != "0"
+# Сколько тредов помнить (самые давно не используемые забываются первыми)
+CONVERSATION_MAX_THREADS = int(os.getenv("CONVERSATION_MAX_THREADS", "200"))
+# Через сколько секунд простоя тред забывается
+CONVERSATION_IDLE_TTL = float(os.getenv("CONVERSATION_IDLE_TTL", "3600"))
+
+# Подписи ролей при отправке всей истории диалога одним сообщением
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+
+def conversation_key(messages: list[tuple[str, str]]) -> str:
+    """Хэш истории диалога (роли и нормализованный текст сообщений)"""
+    digest = hashlib.sha256()
+    for role, content in messages:
+        digest.update(role.encode("utf-8"))
+        digest.update(b"\x00")
+        digest.update(normalize_prompt(content).encode("utf-8"))
+        digest.update(b"\x01")
+    return digest.hexdigest()
+
+
+def flatten_dialog(messages: list[tuple[str, str]]) -> str:
+    """Вся история диалога одним сообщением для нового треда"""
+    system = "\n".join(content for role, content in messages if role == "system")
+    turns = [
+        f"{ROLE_LABELS.get(role, role.capitalize())}: {content}"
+        for role, content in messages
+        if role != "system"
+    ]
+    dialog = "\n\n".join(turns)
+    return f"{system}\n\n{dialog}" if system else dialog
+
+
+@dataclass
+class Thread:
+    """Тред ChatGPT, в котором продолжается диалог клиента"""
+
+    url: str
+    account: str
+    worker_id: int
+    last_used: float
+    turns: int = 0
+
+
+@dataclass
+class ConversationTurn:
+    """Очередной ход многошагового диалога.
+
+    thread - известный тред, куда достаточно отправить только новое
+    сообщение; без него вся история отправляется в новый тред.
+    """
+
+    key: str
+    history: list[tuple[str, str]]
+    message: str
+    thread: Optional[Thread] = None
+    full_prompt: str = field(default="", repr=False)
+    # Ответ получен и тред зарегистрирован под новым ключом
+    answered: bool = False
+    # Тред хода без ответа уже возвращен в хранилище
+    released: bool = False
+    store: Optional["ConversationStore"] = field(default=None, repr=False)
+
+    @property
+    def prompt(self) -> str:
+        """Текст, который нужно ввести в ChatGPT"""
+        return self.message if self.thread else self.full_prompt
+
+    @property
+    def coalesce_key(self) -> str:
+        """Ключ объединения совпадающих запросов с учетом истории диалога"""
+        return f"{self.key}\x00{normalize_prompt(self.message)}"
+
+    def release(self):
+        """Возвращает тред, если ход не получил ответа (повторный вызов ничего не делает)"""
+        if self.store:
+            self.store.release(self)
+
+
+class ConversationStore:
+    """Соответствие истории диалога и треда ChatGPT.
+
+    Ключ - хэш всех сообщений до нового сообщения пользователя. Ход
+    забирает тред из таблицы на время выполнения, поэтому два ответвления
+    одного диалога не пишут в один тред одновременно; после ответа тред
+    регистрируется под ключом истории, дополненной вопросом и ответом.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = CONVERSATION_MAX_THREADS,
+        idle_ttl: float = CONVERSATION_IDLE_TTL,
+        enabled: bool = CONVERSATION_AFFINITY,
+    ):
+        self.max_threads = max(1, max_threads)
+        self.idle_ttl = idle_ttl
+        self.enabled = enabled
+        self._threads: OrderedDict[str, Thread] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, messages: list[tuple[str, str]]) -> Optional[ConversationTurn]:
+        """Готовит ход диалога или возвращает None для одиночного запроса"""
+        if not self.enabled or not messages or messages[-1][0] != "user":
+            return None
+
+        history = messages[:-1]
+        if not any(role == "assistant" for role, _ in history):
+            # Первый ход: продолжения может не быть, отдельный тред не нужен
+            return None
+
+        key = conversation_key(history)
+        self._evict_idle()
+        thread = self._threads.pop(key, None)
+        if thread:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return ConversationTurn(
+            key=key,
+            history=history,
+            message=messages[-1][1],
+            thread=thread,
+            full_prompt=flatten_dialog(messages),
+            store=self,
+        )
+
+    def commit(
+        self, turn: ConversationTurn, answer: str, url: str, account: str, worker_id: int
+    ):
+        """Запоминает тред после ответа под ключом продолженной истории"""
+        thread = turn.thread or Thread(
+            url=url, account=account, worker_id=worker_id, last_used=0.0
+        )
+        thread.url = url
+        thread.account = account
+        thread.worker_id = worker_id
+        thread.last_used = time.time()
+        thread.turns += 1
+        turn.thread = thread
+        turn.answered = True
+
+        key = conversation_key(
+            turn.history + [("user", turn.message), ("assistant", answer)]
+        )
+        self._threads[key] = thread
+        self._threads.move_to_end(key)
+        while len(self._threads) > self.max_threads:
+            self._threads.popitem(last=False)
+
+    def release(self, turn: ConversationTurn):
+        """Возвращает тред хода, который не получил ответа"""
+        if turn.answered or turn.released:
+            return
+        turn.released = True
+        if turn.thread:
+            turn.thread.last_used = time.time()
+            self._threads[turn.key] = turn.thread
+
+    def _evict_idle(self):
+        threshold = time.time() - self.idle_ttl
+        while self._threads:
+            key, thread = next(iter(self._threads.items()))
+            if thread.last_used >= threshold:
+                break
+            del self._threads[key]
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "threads": len(self._threads),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+# Синглтон экземпляр
+conversation_store = ConversationStore()
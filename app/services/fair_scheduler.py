@@ -0,0 +1,181 @@
+import asyncio
+import os
+from collections import defaultdict, deque
+from typing import Optional
+
+# Классы приоритета запросов
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BATCH = "batch"
+PRIORITY_BACKGROUND = "background"
+
+# Вес класса: доля обработчиков, которую класс получает при общей нагрузке
+PRIORITY_WEIGHTS = {
+    PRIORITY_INTERACTIVE: 16.0,
+    PRIORITY_BATCH: 4.0,
+    PRIORITY_BACKGROUND: 1.0,
+}
+
+# Клиент по умолчанию, если запрос не содержит идентификатора
+DEFAULT_CLIENT = "anonymous"
+
+# Максимум одновременно обрабатываемых запросов одного клиента (0 - без ограничения)
+CLIENT_MAX_CONCURRENCY = int(os.getenv("CLIENT_MAX_CONCURRENCY", "0"))
+
+
+def _parse_client_weights(value: str) -> dict[str, float]:
+    """Разбирает CLIENT_WEIGHTS вида "telegram-bot:4,importer:0.5" """
+    weights = {}
+    for item in value.split(","):
+        client, _, weight = item.strip().rpartition(":")
+        try:
+            if client and float(weight) > 0:
+                weights[client] = float(weight)
+        except ValueError:
+            print(f"⚠️ Некорректный вес клиента в CLIENT_WEIGHTS: {item}")
+    return weights
+
+
+# Веса отдельных клиентов внутри класса (по умолчанию 1)
+CLIENT_WEIGHTS = _parse_client_weights(os.getenv("CLIENT_WEIGHTS", ""))
+
+
+def normalize_priority(value: Optional[str]) -> Optional[str]:
+    """Возвращает класс приоритета или None, если значение не распознано"""
+    value = (value or "").strip().lower()
+    return value if value in PRIORITY_WEIGHTS else None
+
+
+class FairScheduler:
+    """Очередь с классами приоритета и взвешенным справедливым обслуживанием.
+
+    Каждая пара (класс, клиент) - отдельный поток со своей FIFO-очередью.
+    Запросу при постановке назначается виртуальное время завершения
+    (start-time fair queuing): чем больше вес потока, тем меньше шаг.
+    Следующим выдается запрос с наименьшей меткой среди клиентов, не
+    достигших лимита одновременных запросов, поэтому 500 пакетных промптов
+    одного клиента не задерживают интерактивные запросы других.
+    """
+
+    def __init__(self):
+        self._flows: dict[tuple[str, str], deque] = {}
+        self._last_finish: dict[tuple[str, str], float] = {}
+        self._tags: dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._in_flight: dict[str, int] = defaultdict(int)
+        # Клиент -> лимиты одновременных запросов (ID запроса -> лимит)
+        # его ожидающих и выполняемых запросов; действует наименьший
+        self._limits: dict[str, dict[str, int]] = {}
+        self._wakeup = asyncio.Event()
+
+    def put(self, request):
+        """Ставит запрос в очередь его класса и клиента"""
+        flow = (request.priority, request.client_id)
+        weight = PRIORITY_WEIGHTS[request.priority] * CLIENT_WEIGHTS.get(
+            request.client_id, 1.0
+        )
+        tag = max(self._virtual_time, self._last_finish.get(flow, 0.0)) + 1.0 / weight
+        self._last_finish[flow] = tag
+        self._tags[request.id] = tag
+        self._flows.setdefault(flow, deque()).append(request)
+
+        if request.max_concurrency:
+            self._limits.setdefault(request.client_id, {})[request.id] = (
+                request.max_concurrency
+            )
+
+        self._wakeup.set()
+
+    async def get(self):
+        """Ждет и возвращает следующий запрос, который можно начать обрабатывать"""
+        while True:
+            request = self._pop()
+            if request:
+                return request
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def release(self, request):
+        """Отмечает завершение обработки запроса клиента"""
+        client = request.client_id
+        self._in_flight[client] -= 1
+        if self._in_flight[client] <= 0:
+            del self._in_flight[client]
+        self._forget_limit(request)
+        self._wakeup.set()
+
+    def remove(self, request_id: str) -> bool:
+        """Убирает ожидающий запрос из очереди (отмена до начала обработки)"""
+        if self._tags.pop(request_id, None) is None:
+            return False
+        for flow, requests in self._flows.items():
+            for request in requests:
+                if request.id == request_id:
+                    requests.remove(request)
+                    if not requests:
+                        del self._flows[flow]
+                        del self._last_finish[flow]
+                    self._forget_limit(request)
+                    return True
+        return False
+
+    def _forget_limit(self, request):
+        """Лимит запроса перестает действовать, когда запрос покинул планировщик"""
+        limits = self._limits.get(request.client_id)
+        if limits is not None:
+            limits.pop(request.id, None)
+            if not limits:
+                del self._limits[request.client_id]
+
+    def _limit(self, client: str) -> int:
+        # Запрос с большим лимитом не ослабляет лимит других запросов клиента
+        limit = min(self._limits.get(client, {}).values(), default=0)
+        if CLIENT_MAX_CONCURRENCY and (not limit or limit > CLIENT_MAX_CONCURRENCY):
+            # Заголовок может только снизить общий лимит
+            return CLIENT_MAX_CONCURRENCY
+        return limit
+
+    def _pop(self):
+        best_flow = None
+        best_tag = None
+        for flow, requests in self._flows.items():
+            client = flow[1]
+            limit = self._limit(client)
+            if limit and self._in_flight.get(client, 0) >= limit:
+                continue
+            tag = self._tags[requests[0].id]
+            if best_tag is None or tag < best_tag:
+                best_flow, best_tag = flow, tag
+
+        if best_flow is None:
+            return None
+
+        requests = self._flows[best_flow]
+        request = requests.popleft()
+        if not requests:
+            # Последняя метка потока не больше виртуального времени - она не нужна
+            del self._flows[best_flow]
+            del self._last_finish[best_flow]
+        del self._tags[request.id]
+        self._virtual_time = best_tag
+        self._in_flight[request.client_id] += 1
+        return request
+
+    def qsize(self) -> int:
+        return len(self._tags)
+
+    def position(self, request_id: str) -> Optional[int]:
+        """Сколько запросов будет выдано раньше данного (без учета лимитов клиентов)"""
+        tag = self._tags.get(request_id)
+        if tag is None:
+            return None
+        return sum(1 for other in self._tags.values() if other < tag)
+
+    def depths(self) -> dict[str, int]:
+        """Количество ожидающих запросов по классам приоритета"""
+        depths = {priority: 0 for priority in PRIORITY_WEIGHTS}
+        for (priority, _), requests in self._flows.items():
+            depths[priority] += len(requests)
+        return depths
+
+    def in_flight(self, client: str) -> int:
+        return self._in_flight.get(client, 0)
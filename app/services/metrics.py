@@ -0,0 +1,221 @@
+"""Метрики сервиса в текстовом формате Prometheus (/metrics).
+
+Без внешних зависимостей: счетчики и гистограммы обновляются из одного
+event loop, поэтому наблюдение стоит одного bisect и пары сложений и
+может оставаться включенным в продакшене.
+"""
+
+from bisect import bisect_left
+from typing import Iterator
+
+# Границы корзин гистограмм длительности (секунды)
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+# Корзины для быстрых операций со страницей (page.evaluate, ввод текста)
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+INF_BUCKET = 'le="+Inf"'
+
+_registry: list["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        _registry.append(self)
+
+    def _labels(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> Iterator[str]:
+        return iter(())
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        if not labelnames:
+            self._values[()] = 0.0
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._labels(labels)} {value:g}"
+
+
+class Gauge(_Metric):
+    """Текущее значение (выставляется перед выдачей метрик)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels: str):
+        self._values[labels] = value
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._labels(labels)} {value:g}"
+
+
+class Histogram(_Metric):
+    """Распределение длительностей по фиксированным корзинам"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [счетчики по корзинам (+Inf последней), сумма, количество]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def count(self, *labels: str) -> int:
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def samples(self) -> Iterator[str]:
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = self._labels(labels, f'le="{bound:g}"')
+                yield f"{self.name}_bucket{le} {cumulative}"
+            yield f"{self.name}_bucket{self._labels(labels, INF_BUCKET)} {count}"
+            yield f"{self.name}_sum{self._labels(labels)} {total:g}"
+            yield f"{self.name}_count{self._labels(labels)} {count}"
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# Очередь запросов
+QUEUE_WAIT_SECONDS = Histogram(
+    "bridge_queue_wait_seconds",
+    "Time a request spent in the queue before processing started",
+    ("priority",),
+)
+REQUESTS_TOTAL = Counter(
+    "bridge_requests_total", "Finished requests by final status", ("status",)
+)
+QUEUE_DEPTH = Gauge(
+    "bridge_queue_depth", "Requests waiting in the queue by priority class", ("priority",)
+)
+IN_FLIGHT = Gauge("bridge_in_flight_requests", "Requests currently being processed")
+COALESCED_TOTAL = Counter(
+    "bridge_coalesce_total",
+    "Identical-prompt coalescing lookups (hit - joined a running request)",
+    ("result",),
+)
+CACHE_LOOKUPS_TOTAL = Counter(
+    "bridge_cache_lookups_total", "Response cache lookups", ("result",)
+)
+
+# Аккаунты ChatGPT
+ACCOUNT_REQUESTS_TOTAL = Counter(
+    "bridge_account_requests_total", "Requests routed to each ChatGPT account", ("account",)
+)
+ACCOUNT_RATE_LIMITS_TOTAL = Counter(
+    "bridge_account_rate_limits_total",
+    "Rate-limit banners that put an account on cooldown",
+    ("account",),
+)
+
+# Браузер
+SELECTOR_LOOKUPS_TOTAL = Counter(
+    "bridge_selector_lookups_total",
+    "Selector registry lookups by role (hit - remembered selector still matched)",
+    ("role", "result"),
+)
+PROMPT_INPUT_SECONDS = Histogram(
+    "bridge_prompt_input_seconds",
+    "Time to put the prompt into the composer",
+    buckets=FAST_BUCKETS,
+)
+TIME_TO_FIRST_TOKEN_SECONDS = Histogram(
+    "bridge_time_to_first_token_seconds",
+    "Time from sending the prompt to the first answer text",
+)
+GENERATION_SECONDS = Histogram(
+    "bridge_generation_seconds",
+    "Time from sending the prompt to the complete answer",
+)
+PAGE_SNAPSHOT_SECONDS = Histogram(
+    "bridge_page_snapshot_seconds",
+    "Duration of one page state scrape while waiting for the answer",
+    buckets=FAST_BUCKETS,
+)
+RECONNECT_ATTEMPTS_TOTAL = Counter(
+    "bridge_reconnect_attempts_total",
+    "Retries made by send_and_get_answer_with_reconnect",
+)
+PAGE_RECYCLES_TOTAL = Counter(
+    "bridge_page_recycles_total", "Browser tabs (contexts) recreated by the page pool"
+)
+BROWSER_RESTARTS_TOTAL = Counter(
+    "bridge_browser_restarts_total", "Full browser restarts by the service"
+)
+PAGE_LOAD_SECONDS = Histogram(
+    "bridge_page_load_seconds",
+    "Time for open_chatgpt to load the ChatGPT page",
+    ("profile",),
+)
+BLOCKED_REQUESTS_TOTAL = Counter(
+    "bridge_blocked_requests_total",
+    "Page requests aborted by the launch profile",
+    ("resource_type",),
+)
+RENDERER_TASK_SECONDS = Gauge(
+    "bridge_renderer_task_seconds",
+    "Renderer main-thread CPU time spent loading the page (last load)",
+    ("profile",),
+)
+RENDERER_JS_HEAP_BYTES = Gauge(
+    "bridge_renderer_js_heap_bytes",
+    "JS heap used by the ChatGPT page after load (last load)",
+    ("profile",),
+)
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+from typing import Optional
+
+# Корень проекта (рядом с cookies.json)
+PROJECT_ROOT = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+QUEUE_JOURNAL_PATH = os.getenv(
+    "QUEUE_JOURNAL_PATH", os.path.join(PROJECT_ROOT, "queue_journal.jsonl")
+)
+# Журнал можно отключить: QUEUE_JOURNAL=0
+QUEUE_JOURNAL_ENABLED = os.getenv("QUEUE_JOURNAL", "1") != "0"
+# Окно группового коммита: записи, пришедшие за это время, пишутся одним fsync
+JOURNAL_FLUSH_INTERVAL = 0.005
+# После стольких записей журнал переписывается только с актуальными данными
+JOURNAL_COMPACT_EVERY = 10000
+
+
+class QueueJournal:
+    """Журнал упреждающей записи (append-only JSONL) для очереди запросов.
+
+    append() только кладет запись в буфер и возвращается сразу; фоновая
+    задача сбрасывает накопленные записи на диск одной операцией с fsync.
+    commit() дополнительно дожидается fsync пачки с записью: так очередь
+    подтверждает прием запроса только после того, как он на диске.
+    Записи о завершении пишутся через append(): при падении в окне
+    JOURNAL_FLUSH_INTERVAL запрос просто будет выполнен повторно.
+    При запуске журнал воспроизводится: незавершенные запросы снова
+    ставятся в очередь (доставка at-least-once), завершенные восстанавливают
+    результаты для /jobs и ключей идемпотентности.
+    """
+
+    def __init__(self, path: str = QUEUE_JOURNAL_PATH):
+        self.path = path
+        self._pending: list[str] = []
+        # Завершается, когда текущий буфер записан (создается по запросу commit)
+        self._batch: Optional[asyncio.Future] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        # Запись пачки и перезапись файла при сжатии не должны пересекаться
+        self._lock = asyncio.Lock()
+        self._records_since_compact = 0
+        # После close() новые записи не принимаются
+        self._closed = False
+
+    def append(self, record: dict):
+        """Добавляет запись в буфер группового коммита"""
+        if self._closed:
+            print(f"⚠️ Журнал очереди закрыт, запись не сохранена: {record.get('id')}")
+            return
+        self._pending.append(json.dumps(record, ensure_ascii=False))
+        self._records_since_compact += 1
+        self._ensure_writer()
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def commit(self, record: dict):
+        """Добавляет запись и ждет, пока ее пачка будет записана с fsync"""
+        if self._closed:
+            raise RuntimeError("журнал очереди закрыт")
+        self.append(record)
+        if self._batch is None:
+            self._batch = asyncio.get_running_loop().create_future()
+        # Отключение одного клиента не должно отменять ожидание всей пачки
+        await asyncio.shield(self._batch)
+
+    def needs_compaction(self) -> bool:
+        return self._records_since_compact >= JOURNAL_COMPACT_EVERY
+
+    def _ensure_writer(self):
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._write_loop())
+
+    async def _write_loop(self):
+        """Сбрасывает буфер на диск пачками"""
+        while not self._closed:
+            await self._wakeup.wait()
+            if not self._closed:
+                # Даем накопиться записям из одновременных запросов
+                await asyncio.sleep(JOURNAL_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает буфер в файл и дожидается fsync"""
+        if not self._pending:
+            return
+        async with self._lock:
+            if not self._pending:
+                return
+            lines, self._pending = self._pending, []
+            batch, self._batch = self._batch, None
+            try:
+                await asyncio.to_thread(self._write_lines, lines)
+            except Exception as e:
+                # Записи возвращаются в буфер и будут записаны при следующем сбросе
+                print(f"❌ Ошибка записи журнала очереди: {e}")
+                self._pending = lines + self._pending
+                if batch:
+                    batch.set_exception(e)
+                return
+            if batch:
+                batch.set_result(None)
+
+    def _write_lines(self, lines: list[str]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay(self) -> list[dict]:
+        """Читает журнал и возвращает итоговое состояние запросов по порядку постановки"""
+        if not os.path.exists(self.path):
+            return []
+
+        state: dict[str, dict] = {}
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная запись при аварийном завершении
+                    continue
+                request_id = record.get("id")
+                if not request_id:
+                    continue
+                if record.get("op") == "enqueue":
+                    state.setdefault(request_id, {}).update(record)
+                elif record.get("op") == "done" and request_id in state:
+                    state[request_id].update(record)
+
+        return sorted(state.values(), key=lambda record: record.get("created_at", 0))
+
+    async def compact(self, records: list[dict]):
+        """Переписывает журнал, оставляя только переданные записи.
+
+        Записи, еще лежащие в буфере, допишутся после сжатия; повтор
+        записи о запросе при воспроизведении безопасен.
+        """
+        async with self._lock:
+            await asyncio.to_thread(self._rewrite, records)
+        self._records_since_compact = 0
+
+    def _rewrite(self, records: list[dict]):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    async def close(self):
+        """Останавливает фоновую запись, сбросив остаток буфера.
+
+        Фоновая задача не отменяется посреди записи: иначе ожидающие
+        commit() никогда не получили бы результат своей пачки.
+        """
+        self._closed = True
+        writer, self._writer = self._writer, None
+        if writer and not writer.done():
+            self._wakeup.set()
+            await writer
+        await self.flush()
@@ -1,7 +1,46 @@
 import asyncio
+import inspect
+import os
+import time
 import uuid
-from dataclasses import dataclass
-from typing import Callable, Optional
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from services.fair_scheduler import (
+    DEFAULT_CLIENT,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_WEIGHTS,
+    FairScheduler,
+    normalize_priority,
+)
+from services.metrics import COALESCED_TOTAL, QUEUE_WAIT_SECONDS, REQUESTS_TOTAL
+from services.queue_journal import QUEUE_JOURNAL_ENABLED, QueueJournal
+
+# Минимальный интервал между началом запросов одного обработчика (секунды).
+# По умолчанию пауз нет: готовность страницы проверяет BrowserClient
+REQUEST_MIN_INTERVAL = float(os.getenv("REQUEST_MIN_INTERVAL", "0"))
+# Сколько секунд хранить результаты завершенных запросов (для /jobs)
+REQUEST_RETENTION = float(os.getenv("REQUEST_RETENTION", "3600"))
+# Оценка длительности обработки, пока нет статистики (секунды)
+DEFAULT_PROCESSING_ESTIMATE = 30.0
+
+# Статусы запроса
+STATUS_QUEUED = "queued"
+STATUS_PROCESSING = "processing"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+STATUS_EXPIRED = "expired"
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED, STATUS_CANCELLED, STATUS_EXPIRED)
+
+# Результат для отмененных и просроченных запросов
+CANCELLED_RESULT = "Ошибка: запрос отменен"
+EXPIRED_RESULT = "Ошибка: истек срок выполнения запроса"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Приводит промпт к виду, в котором одинаковые вопросы совпадают"""
+    return " ".join(prompt.split())
 
 
 @dataclass
@@ -10,6 +49,64 @@ class Request:
     prompt: str
     callback: Callable[[str], None]
     created_at: float
+    # Получает фрагменты ответа по мере генерации (для потоковой выдачи)
+    on_delta: Optional[Callable[[str], None]] = None
+    status: str = STATUS_QUEUED
+    result: Optional[str] = None
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # URL, который уведомляется о завершении задачи (POST /jobs)
+    callback_url: Optional[str] = None
+    # Ключ идемпотентности: повторная постановка с тем же ключом не создает запрос
+    idempotency_key: Optional[str] = None
+    # Дополнительные получатели результата (повторы и совпадающие промпты)
+    waiters: list[Callable[[str], None]] = field(default_factory=list)
+    # Дополнительные получатели фрагментов ответа и уже выданный текст
+    delta_listeners: list[Callable[[str], None]] = field(default_factory=list)
+    partial: str = ""
+    # Класс приоритета и клиент для справедливого распределения очереди
+    priority: str = PRIORITY_INTERACTIVE
+    client_id: str = DEFAULT_CLIENT
+    # Лимит одновременных запросов клиента, запрошенный заголовком
+    max_concurrency: Optional[int] = None
+    # Момент (time.time()), после которого результат уже никому не нужен
+    deadline: Optional[float] = None
+    # Сколько клиентов ждут результат; при нуле запрос отменяется
+    subscribers: int = 1
+    # Задача, выполняющая запрос в браузере
+    task: Optional[asyncio.Task] = None
+    # Ход многошагового диалога (ConversationTurn) для продолжения в том же треде
+    conversation: Optional[Any] = None
+
+    def prompt_key(self) -> str:
+        """Ключ, по которому к запросу присоединяются совпадающие"""
+        if self.conversation is not None:
+            return self.conversation.coalesce_key
+        return normalize_prompt(self.prompt)
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        return self.deadline is not None and (now or time.time()) >= self.deadline
+
+    def to_record(self) -> dict:
+        """Запись о запросе для журнала очереди"""
+        record = {
+            "op": "enqueue",
+            "id": self.id,
+            # Тред диалога не переживает перезапуск, поэтому в журнал
+            # пишется вся история диалога одним сообщением
+            "prompt": self.conversation.full_prompt if self.conversation else self.prompt,
+            "created_at": self.created_at,
+            "callback_url": self.callback_url,
+            "idempotency_key": self.idempotency_key,
+            "priority": self.priority,
+            "client_id": self.client_id,
+            "deadline": self.deadline,
+        }
+        if self.finished_at is not None:
+            record.update(
+                status=self.status, result=self.result, finished_at=self.finished_at
+            )
+        return record
 
 
 class RequestQueue:
@@ -23,91 +120,546 @@ class RequestQueue:
 
     def __init__(self):
         if not self._initialized:
-            self.queue = asyncio.Queue()
+            self.queue = FairScheduler()
             self.processing = False
-            self.current_request: Optional[Request] = None
+            self.current_requests: dict[str, Request] = {}
+            # Все известные запросы, включая завершенные (до REQUEST_RETENTION)
+            self.requests: dict[str, Request] = {}
+            # Скользящее среднее времени обработки одного запроса
+            self.avg_processing_time: Optional[float] = None
+            self._last_cleanup = 0.0
             self.handle_request_func = None
+            self.concurrency = 1
+            self._workers: list[asyncio.Task] = []
+            # Журнал на диске, из которого очередь восстанавливается после перезапуска
+            self.journal: Optional[QueueJournal] = (
+                QueueJournal() if QUEUE_JOURNAL_ENABLED else None
+            )
+            # Ключ идемпотентности -> ID запроса
+            self._idempotency: dict[str, str] = {}
+            # Нормализованный промпт -> ID запроса в очереди или в работе
+            self._in_flight_prompts: dict[str, str] = {}
+            self.coalesce_hits = 0
+            self.coalesce_misses = 0
+            self._handler_streams = False
+            self.supports_conversations = False
+            self._handler_deadline = False
+            self._background: set[asyncio.Task] = set()
             self._initialized = True
 
-    def set_handle_request_func(self, handle_request_func):
-        """Устанавливает функцию обработки запросов"""
+    def set_handle_request_func(self, handle_request_func, concurrency: int = 1):
+        """Устанавливает функцию обработки запросов и число параллельных обработчиков"""
         self.handle_request_func = handle_request_func
+        self.concurrency = max(1, concurrency)
+        # Передавать ли обработчику on_delta для потоковой выдачи
+        try:
+            parameters = inspect.signature(handle_request_func).parameters
+            self._handler_streams = "on_delta" in parameters
+            # Умеет ли обработчик продолжать диалог в его треде
+            self.supports_conversations = "conversation" in parameters
+            # Учитывает ли обработчик срок запроса (например, при ожидании аккаунта)
+            self._handler_deadline = "deadline" in parameters
+        except (TypeError, ValueError):
+            self._handler_streams = False
+            self.supports_conversations = False
+            self._handler_deadline = False
+
+    async def add_request(
+        self,
+        prompt: str,
+        callback: Callable[[str], None],
+        on_delta: Optional[Callable[[str], None]] = None,
+        callback_url: Optional[str] = None,
+        idempotency_key: Optional[str] = None,
+        priority: Optional[str] = None,
+        client_id: Optional[str] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        conversation: Optional[Any] = None,
+    ) -> str:
+        """Добавляет запрос в очередь и возвращает его ID.
+
+        Если запрос с таким idempotency_key уже известен, новый не создается:
+        callback получит результат существующего запроса. Так же к уже
+        стоящему в очереди или выполняемому запросу присоединяются
+        совпадающие промпты (single-flight): браузер отвечает один раз,
+        результат и фрагменты ответа получают все ожидающие.
+
+        timeout - сколько секунд результат нужен клиенту: запрос, не начатый
+        до этого срока, пропускается, а выполняемый прерывается.
+
+        conversation - ход диалога (ConversationTurn): промпты объединяются
+        только в пределах одной истории диалога, а обработчик получает ход,
+        чтобы продолжить нужный тред.
+        """
+        priority = normalize_priority(priority) or PRIORITY_INTERACTIVE
+        deadline = time.time() + timeout if timeout and timeout > 0 else None
+
+        existing = self._find_idempotent(idempotency_key)
+        if existing:
+            print(f"Повторный запрос с ключом {idempotency_key} (ID: {existing.id})")
+            self._attach(existing, callback, on_delta, deadline, conversation)
+            return existing.id
+
+        prompt_key = conversation.coalesce_key if conversation else normalize_prompt(prompt)
+        existing = self._find_in_flight(prompt_key, priority)
+        if existing:
+            self.coalesce_hits += 1
+            COALESCED_TOTAL.inc("hit")
+            print(f"Промпт совпадает с запросом в работе (ID: {existing.id})")
+            self._attach(existing, callback, on_delta, deadline, conversation)
+            return existing.id
+        self.coalesce_misses += 1
+        COALESCED_TOTAL.inc("miss")
 
-    async def add_request(self, prompt: str, callback: Callable[[str], None]) -> str:
-        """Добавляет запрос в очередь и возвращает его ID"""
         request_id = str(uuid.uuid4())
         request = Request(
             id=request_id,
             prompt=prompt,
             callback=callback,
-            created_at=asyncio.get_event_loop().time(),
+            created_at=time.time(),
+            on_delta=on_delta,
+            callback_url=callback_url,
+            idempotency_key=idempotency_key,
+            priority=priority,
+            client_id=client_id or DEFAULT_CLIENT,
+            max_concurrency=max_concurrency,
+            deadline=deadline,
+            conversation=conversation,
+        )
+        self._in_flight_prompts[prompt_key] = request_id
+
+        print(
+            f"Добавлен запрос в очередь: {prompt[:50]}... "
+            f"(ID: {request_id}, {request.priority}, клиент {request.client_id})"
         )
 
-        print(f"Добавлен запрос в очередь: {prompt[:50]}... (ID: {request_id})")
+        self._forget_expired()
+        self._register(request)
+        self.queue.put(request)
+        if deadline is not None:
+            asyncio.get_running_loop().call_later(timeout, self._expire, request_id)
 
-        await self.queue.put(request)
+        # Запускаем обработчики очереди, если они еще не запущены
+        self._ensure_workers()
 
-        # Запускаем обработчик очереди, если он еще не запущен
-        if not self.processing:
-            asyncio.create_task(self._process_queue())
+        if self.journal:
+            # ID возвращается только после fsync: принятый запрос переживет падение
+            try:
+                await self.journal.commit(request.to_record())
+            except Exception as e:
+                print(f"⚠️ Запрос {request_id} не записан в журнал: {e}")
 
         return request_id
 
-    async def _process_queue(self):
-        """Обрабатывает очередь запросов строго последовательно"""
+    def _register(self, request: Request):
+        self.requests[request.id] = request
+        if request.idempotency_key:
+            self._idempotency[request.idempotency_key] = request.id
+
+    def _attach(
+        self,
+        request: Request,
+        callback: Callable[[str], None],
+        on_delta: Optional[Callable[[str], None]],
+        deadline: Optional[float] = None,
+        conversation: Optional[Any] = None,
+    ):
+        """Подключает еще одного получателя к существующему запросу"""
+        if conversation is not None and conversation is not request.conversation:
+            # Ход диалога не выполняется сам - его тред возвращается
+            conversation.release()
+        if request.finished_at is not None:
+            asyncio.get_running_loop().call_soon(
+                self._notify, request, callback, request.result
+            )
+            return
+
+        request.subscribers += 1
+        # Запрос нужен, пока не истек срок самого терпеливого из клиентов
+        if request.deadline is not None:
+            request.deadline = max(request.deadline, deadline) if deadline else None
+        request.waiters.append(callback)
+        if on_delta:
+            # Присоединившийся позже получает уже сгенерированную часть ответа
+            if request.partial:
+                self._notify(request, on_delta, request.partial)
+            request.delta_listeners.append(on_delta)
+
+    def unsubscribe(self, request_id: str):
+        """Клиент больше не ждет результат (например, разорвал соединение).
+
+        Когда не остается ни одного ожидающего, запрос отменяется. Задачи
+        с callback_url продолжают выполняться: их результат нужен webhook.
+        """
+        request = self.requests.get(request_id)
+        if not request or request.finished_at is not None:
+            return
+        request.subscribers -= 1
+        if request.subscribers <= 0 and not request.callback_url:
+            self.cancel(request_id)
+
+    def _expire(self, request_id: str):
+        """Снимает с очереди запрос, срок которого истек до начала обработки"""
+        request = self.requests.get(request_id)
+        if not request or request.status != STATUS_QUEUED:
+            return
+        if not request.is_expired():
+            # Срок продлил присоединившийся клиент
+            if request.deadline is not None:
+                asyncio.get_running_loop().call_later(
+                    request.deadline - time.time(), self._expire, request_id
+                )
+            return
+        if self.queue.remove(request_id):
+            print(f"⌛ Запрос просрочен до начала обработки: {request_id}")
+            self._finish(request, STATUS_EXPIRED, EXPIRED_RESULT)
+
+    def cancel(self, request_id: str) -> bool:
+        """Отменяет запрос: убирает из очереди или прерывает генерацию"""
+        request = self.requests.get(request_id)
+        if not request or request.finished_at is not None:
+            return False
+
+        if request.status == STATUS_QUEUED and self.queue.remove(request_id):
+            print(f"🚫 Запрос отменен до начала обработки: {request_id}")
+            self._finish(request, STATUS_CANCELLED, CANCELLED_RESULT)
+            return True
+
+        if request.task and not request.task.done():
+            # Обработчик очереди завершит запрос со статусом cancelled
+            print(f"🚫 Прерывается выполнение запроса: {request_id}")
+            request.task.cancel()
+            return True
+        return False
+
+    def _find_in_flight(self, prompt_key: str, priority: str) -> Optional[Request]:
+        """Ищет запрос с тем же промптом, который еще не завершен"""
+        request = self.requests.get(self._in_flight_prompts.get(prompt_key, ""))
+        if not request or request.finished_at is not None:
+            return None
+        # Срочный запрос не ждет в очереди менее приоритетного класса
+        if (
+            request.status == STATUS_QUEUED
+            and PRIORITY_WEIGHTS[request.priority] < PRIORITY_WEIGHTS[priority]
+        ):
+            return None
+        return request
+
+    def _broadcast_delta(self, request: Request, delta: str):
+        """Рассылает фрагмент ответа всем получателям запроса"""
+        request.partial += delta
+        for listener in [request.on_delta, *request.delta_listeners]:
+            if listener:
+                self._notify(request, listener, delta)
+
+    def _find_idempotent(self, idempotency_key: Optional[str]) -> Optional[Request]:
+        if not idempotency_key:
+            return None
+        request_id = self._idempotency.get(idempotency_key)
+        return self.requests.get(request_id) if request_id else None
+
+    async def restore(
+        self,
+        make_callback: Optional[Callable[[Request], Callable[[str], None]]] = None,
+    ) -> int:
+        """Восстанавливает очередь из журнала после перезапуска.
+
+        Незавершенные запросы (в том числе прерванные во время обработки)
+        снова ставятся в очередь, результаты завершенных доступны через
+        get_request и ключи идемпотентности. make_callback строит обработчик
+        результата для восстановленного запроса (например, отправку webhook).
+        Возвращает число запросов, поставленных в очередь повторно.
+        """
+        if not self.journal:
+            return 0
+
+        threshold = time.time() - REQUEST_RETENTION
+        requeued = 0
+        for record in self.journal.replay():
+            if record["id"] in self.requests:
+                continue
+
+            request = Request(
+                id=record["id"],
+                prompt=record.get("prompt", ""),
+                callback=lambda result: None,
+                created_at=record.get("created_at", time.time()),
+                callback_url=record.get("callback_url"),
+                idempotency_key=record.get("idempotency_key"),
+                priority=normalize_priority(record.get("priority"))
+                or PRIORITY_INTERACTIVE,
+                client_id=record.get("client_id") or DEFAULT_CLIENT,
+                deadline=record.get("deadline"),
+            )
+
+            if record.get("status") in FINISHED_STATUSES:
+                if record.get("finished_at", 0) < threshold:
+                    continue
+                request.status = record["status"]
+                request.result = record.get("result")
+                request.finished_at = record["finished_at"]
+                self._register(request)
+                continue
+
+            if make_callback:
+                request.callback = make_callback(request)
+            self._register(request)
+            self._in_flight_prompts.setdefault(normalize_prompt(request.prompt), request.id)
+            self.queue.put(request)
+            requeued += 1
+
+        # Журнал переписывается только с актуальными запросами
+        await self.journal.compact(
+            [request.to_record() for request in self.requests.values()]
+        )
+
+        if requeued:
+            print(f"♻️ Из журнала восстановлено запросов в очереди: {requeued}")
+            self._ensure_workers()
+        return requeued
+
+    def _ensure_workers(self):
+        """Поддерживает нужное количество обработчиков очереди"""
+        self._workers = [task for task in self._workers if not task.done()]
+        while len(self._workers) < self.concurrency:
+            worker_id = len(self._workers)
+            self._workers.append(asyncio.create_task(self._process_queue(worker_id)))
+
+    async def _process_queue(self, worker_id: int = 0):
+        """Обрабатывает запросы очереди; каждый обработчик выполняет один запрос за раз"""
         self.processing = True
-        print("Запущен обработчик очереди")
+        print(f"Запущен обработчик очереди #{worker_id}")
+        last_started = 0.0
 
         try:
             while True:
                 # Ждем следующий запрос из очереди
                 request = await self.queue.get()
-                self.current_request = request
-
-                print(
-                    f"Обрабатывается запрос: {request.prompt[:50]}... (ID: {request.id})"
-                )
 
                 try:
-                    # Выполняем запрос
-                    result = await self._execute_request(request.prompt)
-                    print(f"Запрос обработан успешно: {request.id}")
-                    request.callback(result)
-                except Exception as e:
-                    print(f"Ошибка при обработке запроса {request.id}: {e}")
-                    request.callback(f"Ошибка обработки запроса: {str(e)}")
-                finally:
-                    # Помечаем задачу как выполненную
-                    self.queue.task_done()
-                    self.current_request = None
+                    # Просроченный запрос никто не ждет - браузер его не получает
+                    if request.is_expired():
+                        print(f"⌛ Запрос просрочен до начала обработки: {request.id}")
+                        self._finish(request, STATUS_EXPIRED, EXPIRED_RESULT)
+                        continue
+
+                    self.current_requests[request.id] = request
 
-                    # Небольшая пауза между запросами для стабильности
-                    await asyncio.sleep(1)
+                    # Выдерживаем минимальный интервал, если он задан
+                    if REQUEST_MIN_INTERVAL > 0:
+                        loop = asyncio.get_event_loop()
+                        delay = REQUEST_MIN_INTERVAL - (loop.time() - last_started)
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                        last_started = loop.time()
+
+                    print(
+                        f"Обрабатывается запрос: {request.prompt[:50]}... (ID: {request.id})"
+                    )
+                    request.status = STATUS_PROCESSING
+                    request.started_at = time.time()
+                    QUEUE_WAIT_SECONDS.observe(
+                        request.started_at - request.created_at, request.priority
+                    )
+                    await self._run_request(request)
+                finally:
+                    # Освобождаем место в лимите клиента
+                    self.queue.release(request)
+                    self.current_requests.pop(request.id, None)
 
         except Exception as e:
             print(f"Критическая ошибка в обработчике очереди: {e}")
         finally:
-            self.processing = False
-            print("Обработчик очереди остановлен")
+            self.processing = any(
+                not task.done() and task is not asyncio.current_task()
+                for task in self._workers
+            )
+            print(f"Обработчик очереди #{worker_id} остановлен")
+
+    async def _run_request(self, request: Request):
+        """Выполняет запрос в отдельной задаче, которую можно отменить"""
+        request.task = asyncio.create_task(self._execute_request(request))
+        try:
+            while not request.task.done():
+                # Срок запроса может продлить присоединившийся клиент
+                timeout = (
+                    max(0.0, request.deadline - time.time())
+                    if request.deadline is not None
+                    else None
+                )
+                await asyncio.wait({request.task}, timeout=timeout)
+                if not request.task.done() and request.is_expired():
+                    print(f"⌛ Истек срок выполнения запроса: {request.id}")
+                    request.task.cancel()
+                    await asyncio.wait({request.task})
+                    self._finish(request, STATUS_EXPIRED, EXPIRED_RESULT)
+                    return
+        except asyncio.CancelledError:
+            # Останавливается сам обработчик очереди
+            request.task.cancel()
+            raise
+        finally:
+            task, request.task = request.task, None
+
+        if task.cancelled():
+            self._finish(request, STATUS_CANCELLED, CANCELLED_RESULT)
+        elif task.exception():
+            error = task.exception()
+            print(f"Ошибка при обработке запроса {request.id}: {error}")
+            self._finish(
+                request, STATUS_FAILED, f"Ошибка обработки запроса: {str(error)}"
+            )
+        else:
+            print(f"Запрос обработан успешно: {request.id}")
+            self._finish(request, STATUS_COMPLETED, task.result())
+
+    def _finish(self, request: Request, status: str, result: str):
+        """Сохраняет результат запроса и уведомляет ожидающего"""
+        request.status = status
+        request.result = result
+        request.finished_at = time.time()
+        REQUESTS_TOTAL.inc(status)
+
+        if status in (STATUS_COMPLETED, STATUS_FAILED) and request.started_at is not None:
+            duration = request.finished_at - request.started_at
+            if self.avg_processing_time is None:
+                self.avg_processing_time = duration
+            else:
+                self.avg_processing_time = 0.8 * self.avg_processing_time + 0.2 * duration
+
+        if self.journal:
+            self.journal.append(
+                {
+                    "op": "done",
+                    "id": request.id,
+                    "status": status,
+                    "result": result,
+                    "finished_at": request.finished_at,
+                }
+            )
 
-    async def _execute_request(self, prompt: str) -> str:
+        if request.conversation is not None:
+            # Ход, не дошедший до ответа (просрочен или отменен в очереди),
+            # возвращает тред, иначе следующий ход начнет новый тред
+            request.conversation.release()
+
+        prompt_key = request.prompt_key()
+        if self._in_flight_prompts.get(prompt_key) == request.id:
+            del self._in_flight_prompts[prompt_key]
+        request.delta_listeners = []
+        request.partial = ""
+
+        self._notify(request, request.callback, result)
+        waiters, request.waiters = request.waiters, []
+        for waiter in waiters:
+            self._notify(request, waiter, result)
+
+    @staticmethod
+    def _notify(request: Request, callback: Callable[[str], None], result: str):
+        try:
+            callback(result)
+        except Exception as e:
+            print(f"⚠️ Ошибка в обработчике результата запроса {request.id}: {e}")
+
+    def _forget_expired(self):
+        """Удаляет из реестра результаты, срок хранения которых истек"""
+        now = time.time()
+        # Реестр просматривается не чаще раза в минуту
+        if now - self._last_cleanup < 60:
+            return
+        self._last_cleanup = now
+
+        threshold = now - REQUEST_RETENTION
+        expired = [
+            request_id
+            for request_id, request in self.requests.items()
+            if request.finished_at is not None and request.finished_at < threshold
+        ]
+        for request_id in expired:
+            request = self.requests.pop(request_id)
+            if self._idempotency.get(request.idempotency_key) == request_id:
+                del self._idempotency[request.idempotency_key]
+
+        if self.journal and self.journal.needs_compaction():
+            records = [request.to_record() for request in self.requests.values()]
+            task = asyncio.create_task(self.journal.compact(records))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def close(self):
+        """Сбрасывает на диск остаток журнала"""
+        if self.journal:
+            await self.journal.close()
+
+    async def _execute_request(self, request: Request) -> str:
         """Выполняет запрос к ChatGPT через браузер"""
         if not self.handle_request_func:
             raise RuntimeError("Функция обработки запросов не установлена")
 
-        return await self.handle_request_func(prompt)
+        kwargs = {}
+        if self._handler_streams:
+            # Фрагменты нужны и тем, кто присоединится к запросу во время генерации
+            kwargs["on_delta"] = lambda delta: self._broadcast_delta(request, delta)
+        if request.conversation is not None and self.supports_conversations:
+            kwargs["conversation"] = request.conversation
+        if request.deadline is not None and self._handler_deadline:
+            kwargs["deadline"] = request.deadline
+        return await self.handle_request_func(request.prompt, **kwargs)
 
     def get_queue_size(self) -> int:
         """Возвращает текущий размер очереди"""
         return self.queue.qsize()
 
+    def get_queue_depths(self) -> dict[str, int]:
+        """Возвращает количество ожидающих запросов по классам приоритета"""
+        return self.queue.depths()
+
     def is_processing(self) -> bool:
         """Проверяет, обрабатывается ли очередь в данный момент"""
         return self.processing
 
+    def get_coalescing_stats(self) -> dict:
+        """Счетчики объединения одинаковых промптов"""
+        total = self.coalesce_hits + self.coalesce_misses
+        return {
+            "hits": self.coalesce_hits,
+            "misses": self.coalesce_misses,
+            "hit_rate": round(self.coalesce_hits / total, 3) if total else 0.0,
+        }
+
     def get_current_request(self) -> Optional[Request]:
-        """Возвращает текущий обрабатываемый запрос"""
-        return self.current_request
+        """Возвращает самый ранний из обрабатываемых запросов"""
+        return next(iter(self.current_requests.values()), None)
+
+    def get_current_requests(self) -> list[Request]:
+        """Возвращает все обрабатываемые в данный момент запросы"""
+        return list(self.current_requests.values())
+
+    def get_request(self, request_id: str) -> Optional[Request]:
+        """Возвращает запрос по ID (в очереди, в работе или завершенный)"""
+        return self.requests.get(request_id)
+
+    def get_position(self, request_id: str) -> Optional[int]:
+        """Возвращает позицию запроса в очереди (0 - следующий на обработку)"""
+        return self.queue.position(request_id)
+
+    def estimate_wait(self, request_id: str) -> Optional[float]:
+        """Оценивает, через сколько секунд запрос будет выполнен"""
+        request = self.requests.get(request_id)
+        if not request:
+            return None
+
+        average = self.avg_processing_time or DEFAULT_PROCESSING_ESTIMATE
+        if request.status == STATUS_PROCESSING:
+            elapsed = time.time() - (request.started_at or time.time())
+            return max(0.0, average - elapsed)
+        if request.status != STATUS_QUEUED:
+            return 0.0
+
+        position = self.get_position(request_id) or 0
+        # Запросы впереди делятся между параллельными обработчиками
+        return (position // self.concurrency + 1) * average
 
 
 # Синглтон экземпляр
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from services.metrics import CACHE_LOOKUPS_TOTAL
+from services.request_queue import normalize_prompt
+
+# Время жизни ответа в кэше (секунды, 0 - кэш отключен)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Максимум ответов в памяти
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+# Файл SQLite для второго уровня кэша (пусто - только память)
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")
+# Окно пакетной записи в SQLite: ответы за это время пишутся одной транзакцией
+CACHE_FLUSH_INTERVAL = 0.5
+
+# Ответы сервиса, которые означают ошибку и не должны кэшироваться
+ERROR_ANSWER_PREFIXES = (
+    "Ошибка",
+    "❌",
+    "Таймаут ожидания ответа",
+    "Page object is not initialized",
+)
+
+
+def is_error_answer(answer: Optional[str]) -> bool:
+    """Проверяет, является ли ответ сообщением об ошибке сервиса"""
+    return not answer or not answer.strip() or answer.startswith(ERROR_ANSWER_PREFIXES)
+
+
+class ResponseCache:
+    """Кэш ответов ChatGPT: LRU в памяти с TTL и необязательный уровень в SQLite.
+
+    Ключ - хэш системного промпта и нормализованного промпта пользователя.
+    При промахе в памяти ответ ищется в SQLite и поднимается в память.
+    SQLite вызывается в потоках asyncio.to_thread, а новые ответы
+    пишутся пачками раз в CACHE_FLUSH_INTERVAL: запись в кэш не
+    останавливает event loop и не делает commit на каждый ответ.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_size: int = RESPONSE_CACHE_SIZE,
+        path: str = RESPONSE_CACHE_PATH,
+    ):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.path = path
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        # Соединение используется из потоков, вызовы сериализуются
+        self._lock = threading.Lock()
+        # Ключ -> (срок, ответ) для записи или None для удаления
+        self._pending: dict[str, Optional[tuple[float, str]]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    @staticmethod
+    def key(prompt: str, system_prompt: str = "") -> str:
+        """Ключ кэша для промпта и системного промпта"""
+        material = f"{normalize_prompt(system_prompt)}\x00{normalize_prompt(prompt)}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный ответ или None"""
+        if not self.enabled:
+            return None
+
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry:
+            expires_at, answer = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                CACHE_LOOKUPS_TOTAL.inc("hit")
+                return answer
+            del self._entries[key]
+
+        answer = await self._disk_get(key, now)
+        if answer is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            CACHE_LOOKUPS_TOTAL.inc("hit")
+            return answer
+
+        self.misses += 1
+        CACHE_LOOKUPS_TOTAL.inc("miss")
+        return None
+
+    def set(self, key: str, answer: str):
+        """Сохраняет ответ, если это не сообщение об ошибке"""
+        if not self.enabled or is_error_answer(answer):
+            return
+
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, answer)
+        self._schedule_write(key, (expires_at, answer))
+
+    def _remember(self, key: str, expires_at: float, answer: str):
+        self._entries[key] = (expires_at, answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _disk_get(self, key: str, now: float) -> Optional[str]:
+        if not self.path:
+            return None
+        if key in self._pending:
+            # Ответ еще не записан на диск (или ждет удаления)
+            row = self._pending[key]
+        else:
+            row = await asyncio.to_thread(self._read, key)
+        if not row:
+            return None
+        expires_at, answer = row
+        if expires_at <= now:
+            self._schedule_write(key, None)
+            return None
+
+        self._remember(key, expires_at, answer)
+        return answer
+
+    def _read(self, key: str) -> Optional[tuple[float, str]]:
+        with self._lock:
+            db = self._connect()
+            if not db:
+                return None
+            try:
+                row = db.execute(
+                    "SELECT expires_at, answer FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка чтения кэша ответов: {e}")
+                return None
+        return tuple(row) if row else None
+
+    def _schedule_write(self, key: str, entry: Optional[tuple[float, str]]):
+        """Ставит запись (или удаление, entry=None) в очередь пакетной записи"""
+        if not self.path:
+            return
+        self._pending[key] = entry
+        if self._writer is None or self._writer.done():
+            self._wakeup = asyncio.Event()
+            self._writer = asyncio.create_task(self._write_loop())
+        self._wakeup.set()
+
+    async def _write_loop(self):
+        """Сбрасывает накопленные ответы в SQLite пачками"""
+        while True:
+            await self._wakeup.wait()
+            # Даем накопиться ответам из одновременных запросов
+            await asyncio.sleep(CACHE_FLUSH_INTERVAL)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные ответы одной транзакцией"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch: dict[str, Optional[tuple[float, str]]]):
+        with self._lock:
+            db = self._connect()
+            if not db:
+                return
+            try:
+                with db:
+                    for key, entry in batch.items():
+                        if entry is None:
+                            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        else:
+                            db.execute(
+                                "INSERT OR REPLACE INTO responses (key, answer, expires_at) "
+                                "VALUES (?, ?, ?)",
+                                (key, entry[1], entry[0]),
+                            )
+            except sqlite3.Error as e:
+                print(f"⚠️ Ошибка записи кэша ответов: {e}")
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Открывает SQLite при первом обращении, если задан путь"""
+        if not self.path or self._db:
+            return self._db
+        try:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, answer TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            # Просроченные ответы удаляются при открытии
+            self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+        except sqlite3.Error as e:
+            print(f"❌ Не удалось открыть кэш ответов {self.path}: {e}")
+            self.path = ""
+            self._db = None
+        return self._db
+
+    def get_stats(self) -> dict:
+        """Статистика попаданий в кэш"""
+        total = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    async def close(self):
+        """Останавливает фоновую запись, сбросив накопленные ответы"""
+        if self._writer:
+            self._writer.cancel()
+            self._writer = None
+        await self.flush()
+        await asyncio.to_thread(self._close_db)
+
+    def _close_db(self):
+        with self._lock:
+            if self._db:
+                self._db.close()
+                self._db = None
+
+
+# Синглтон экземпляр
+response_cache = ResponseCache()
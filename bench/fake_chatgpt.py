@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+Локальная замена страницы ChatGPT для нагрузочных тестов моста.
+
+Страница повторяет то, на что опирается BrowserClient: поле ввода
+(textarea), кнопку остановки генерации, сообщения с атрибутом
+data-message-author-role и SSE-поток /backend-api/conversation в формате
+delta encoding v1. Скорость генерации и доля сбоев настраиваются.
+
+Запуск:
+    python bench/fake_chatgpt.py --port 9000 --token-rate 30 --write-accounts bench_state/accounts.json
+    CHATGPT_URL=http://127.0.0.1:9000/ ACCOUNTS_FILE=bench_state/accounts.json python app/main.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import uuid
+from dataclasses import dataclass, field
+from itertools import cycle, islice
+from typing import Optional
+
+from aiohttp import web
+
+FAILURE_MODES = ("error", "rate_limit", "disconnect")
+
+ERROR_TEXT = "Something went wrong while generating the response."
+RATE_LIMIT_TEXT = "You've reached our limit of messages per hour. Please try again later."
+
+
+@dataclass
+class FakeChatGPTConfig:
+    # Скорость генерации (токенов в секунду) и длина ответа в токенах
+    token_rate: float = 20.0
+    answer_tokens: int = 60
+    # Пауза перед первым токеном (секунды)
+    first_token_delay: float = 0.5
+    # Доля запросов со сбоем и вид сбоя: error (HTTP 500), rate_limit
+    # (баннер лимита) или disconnect (обрыв потока на середине ответа)
+    failure_rate: float = 0.0
+    failure_mode: str = "error"
+    # Показывать окно cookie при загрузке страницы
+    cookie_banner: bool = False
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeChatGPTStats:
+    requests: int = 0
+    completed: int = 0
+    aborted: int = 0
+    active: int = 0
+    failures: dict[str, int] = field(default_factory=dict)
+
+
+STATS_KEY = web.AppKey("stats", FakeChatGPTStats)
+
+
+PAGE_HTML = """<!doctype html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>ChatGPT</title>
+<style>
+body { font-family: sans-serif; margin: 0; }
+main { max-width: 800px; margin: 0 auto; padding: 16px 16px 140px; }
+article { margin: 12px 0; }
+[data-message-author-role="user"] { font-weight: bold; }
+.text-token-text-error { color: #c00; }
+form { position: fixed; bottom: 0; left: 0; right: 0; padding: 12px; background: #fff;
+       display: flex; gap: 8px; justify-content: center; }
+textarea { width: 600px; height: 60px; }
+#cookie-banner { position: fixed; top: 0; left: 0; right: 0; padding: 12px; background: #eee; }
+</style>
+</head>
+<body>
+<main id="thread"></main>
+<form id="composer">
+  <textarea id="prompt-textarea" placeholder="Message ChatGPT"></textarea>
+  <button id="send" type="submit" data-testid="send-button">Send</button>
+  <button id="stop" type="button" data-testid="stop-button" aria-label="Stop streaming" hidden>Stop</button>
+</form>
+__COOKIE_BANNER__
+<script>
+const thread = document.getElementById("thread");
+const textarea = document.getElementById("prompt-textarea");
+const send = document.getElementById("send");
+const stop = document.getElementById("stop");
+let conversationId = location.pathname.startsWith("/c/") ? location.pathname.slice(3) : null;
+let controller = null;
+
+const addTurn = (role, text) => {
+    const turn = document.createElement("article");
+    turn.dataset.testid = `conversation-turn-${thread.children.length + 1}`;
+    const message = document.createElement("div");
+    message.dataset.messageAuthorRole = role;
+    if (role === "assistant") {
+        message.className = "markdown prose";
+    }
+    message.textContent = text;
+    turn.appendChild(message);
+    thread.appendChild(turn);
+    return message;
+};
+
+const showError = (text) => {
+    const error = document.createElement("div");
+    error.className = "text-token-text-error";
+    error.textContent = text;
+    thread.appendChild(error);
+};
+
+const setGenerating = (generating) => {
+    stop.hidden = !generating;
+    send.hidden = generating;
+};
+
+const submit = async () => {
+    const prompt = textarea.value.trim();
+    if (!prompt || controller) {
+        return;
+    }
+    textarea.value = "";
+    addTurn("user", prompt);
+    setGenerating(true);
+    controller = new AbortController();
+
+    try {
+        const response = await fetch("/backend-api/conversation", {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ prompt, conversation_id: conversationId }),
+            signal: controller.signal,
+        });
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            showError(data.detail || `Error ${response.status}`);
+            return;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let path = null;
+        let answer = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) {
+                break;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            let index;
+            while ((index = buffer.indexOf("\\n\\n")) !== -1) {
+                const event = buffer.slice(0, index);
+                buffer = buffer.slice(index + 2);
+                const data = event
+                    .split("\\n")
+                    .filter((line) => line.startsWith("data:"))
+                    .map((line) => line.slice(5).trim())
+                    .join("\\n");
+                if (!data || data === "[DONE]") {
+                    continue;
+                }
+                const payload = JSON.parse(data);
+                if (payload.p !== undefined) {
+                    path = payload.p;
+                }
+                if (path === "" && payload.o === "add") {
+                    conversationId = payload.v.conversation_id;
+                    answer = addTurn("assistant", "");
+                } else if (path === "/message/content/parts/0" && typeof payload.v === "string") {
+                    answer.textContent += payload.v;
+                }
+            }
+        }
+    } catch (error) {
+        // Остановка генерации или обрыв потока: остается полученная часть ответа
+    } finally {
+        controller = null;
+        setGenerating(false);
+        if (conversationId && location.pathname !== `/c/${conversationId}`) {
+            history.pushState(null, "", `/c/${conversationId}`);
+        }
+    }
+};
+
+textarea.addEventListener("keydown", (event) => {
+    if (event.key === "Enter" && !event.shiftKey) {
+        event.preventDefault();
+        submit();
+    }
+});
+document.getElementById("composer").addEventListener("submit", (event) => {
+    event.preventDefault();
+    submit();
+});
+stop.addEventListener("click", () => controller && controller.abort());
+</script>
+</body>
+</html>
+"""
+
+COOKIE_BANNER_HTML = """<div id="cookie-banner" role="dialog">
+  We use cookies to improve your experience.
+  <button type="button" onclick="this.parentElement.remove()">Accept all</button>
+</div>"""
+
+
+def answer_tokens(prompt: str, count: int) -> list[str]:
+    """Токены ответа: слова промпта по кругу, чтобы ответ зависел от запроса"""
+    words = prompt.split() or ["ok"]
+    tokens = list(islice(cycle(words), max(1, count)))
+    return [tokens[0]] + [f" {token}" for token in tokens[1:]]
+
+
+def sse_event(payload) -> bytes:
+    data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+    return f"data: {data}\n\n".encode("utf-8")
+
+
+def create_app(config: FakeChatGPTConfig) -> web.Application:
+    """aiohttp-приложение заглушки ChatGPT"""
+    app = web.Application()
+    stats = FakeChatGPTStats()
+    rng = random.Random(config.seed)
+    page = PAGE_HTML.replace(
+        "__COOKIE_BANNER__", COOKIE_BANNER_HTML if config.cookie_banner else ""
+    )
+
+    async def index(request: web.Request) -> web.Response:
+        return web.Response(text=page, content_type="text/html")
+
+    async def conversation(request: web.Request) -> web.StreamResponse:
+        data = await request.json()
+        prompt = str(data.get("prompt", ""))
+        conversation_id = data.get("conversation_id") or str(uuid.uuid4())
+        stats.requests += 1
+
+        failure = None
+        if config.failure_rate and rng.random() < config.failure_rate:
+            failure = config.failure_mode
+            stats.failures[failure] = stats.failures.get(failure, 0) + 1
+        if failure == "error":
+            return web.json_response({"detail": ERROR_TEXT}, status=500)
+        if failure == "rate_limit":
+            return web.json_response({"detail": RATE_LIMIT_TEXT}, status=429)
+
+        tokens = answer_tokens(prompt, config.answer_tokens)
+        cut = len(tokens) // 2 if failure == "disconnect" else None
+        interval = 1 / config.token_rate if config.token_rate > 0 else 0
+
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        )
+        await response.prepare(request)
+        stats.active += 1
+        try:
+            message = {
+                "id": str(uuid.uuid4()),
+                "author": {"role": "assistant"},
+                "content": {"content_type": "text", "parts": [""]},
+                "status": "in_progress",
+            }
+            await response.write(
+                sse_event(
+                    {"p": "", "o": "add", "v": {"message": message, "conversation_id": conversation_id}}
+                )
+            )
+            await asyncio.sleep(config.first_token_delay)
+
+            for index, token in enumerate(tokens):
+                if index == cut:
+                    # Обрыв соединения посреди ответа
+                    request.transport.close()
+                    return response
+                if index == 0:
+                    event = {"p": "/message/content/parts/0", "o": "append", "v": token}
+                else:
+                    event = {"v": token}
+                await response.write(sse_event(event))
+                await asyncio.sleep(interval)
+
+            await response.write(
+                sse_event(
+                    {
+                        "p": "",
+                        "o": "patch",
+                        "v": [
+                            {"p": "/message/status", "o": "replace", "v": "finished_successfully"},
+                            {"p": "/message/end_turn", "o": "replace", "v": True},
+                        ],
+                    }
+                )
+            )
+            await response.write(sse_event("[DONE]"))
+            stats.completed += 1
+        except (ConnectionResetError, asyncio.CancelledError):
+            # Страница нажала кнопку остановки генерации
+            stats.aborted += 1
+            raise
+        finally:
+            stats.active -= 1
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response(vars(stats))
+
+    app.router.add_get("/", index)
+    app.router.add_get("/c/{conversation_id}", index)
+    app.router.add_post("/backend-api/conversation", conversation)
+    app.router.add_get("/stats", get_stats)
+    app[STATS_KEY] = stats
+    return app
+
+
+def write_accounts(path: str, base_url: str, count: int = 1):
+    """Создает ACCOUNTS_FILE и авторизованные файлы сессий для заглушки"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    accounts = []
+    for index in range(1, count + 1):
+        name = f"fake{index}"
+        cookies_path = os.path.join(directory, f"{name}.json")
+        session = {
+            "cookies": [{"name": "fake_session", "value": name, "url": base_url}],
+            "page_state": {"url": base_url, "title": "ChatGPT"},
+            "auth_status": {"status": "completed"},
+            "timestamp": 0,
+        }
+        with open(cookies_path, "w", encoding="utf-8") as f:
+            json.dump(session, f, indent=2)
+        accounts.append(
+            {
+                "name": name,
+                "email": f"{name}@example.com",
+                "password": "fake",
+                "cookies_path": cookies_path,
+            }
+        )
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(accounts, f, indent=2)
+    print(f"✅ Аккаунты заглушки записаны в {path} ({count} шт.)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка страницы ChatGPT для нагрузочных тестов")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--token-rate", type=float, default=20.0, help="токенов в секунду")
+    parser.add_argument("--answer-tokens", type=int, default=60, help="длина ответа в токенах")
+    parser.add_argument("--first-token-delay", type=float, default=0.5, help="пауза до первого токена (сек)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="доля запросов со сбоем (0..1)")
+    parser.add_argument("--failure-mode", choices=FAILURE_MODES, default="error")
+    parser.add_argument("--cookie-banner", action="store_true", help="показывать окно cookie")
+    parser.add_argument("--seed", type=int, default=None, help="seed для воспроизводимых сбоев")
+    parser.add_argument(
+        "--write-accounts",
+        metavar="PATH",
+        help="записать ACCOUNTS_FILE с авторизованными сессиями для этой заглушки",
+    )
+    parser.add_argument("--accounts", type=int, default=1, help="сколько аккаунтов записать")
+    args = parser.parse_args()
+
+    config = FakeChatGPTConfig(
+        token_rate=args.token_rate,
+        answer_tokens=args.answer_tokens,
+        first_token_delay=args.first_token_delay,
+        failure_rate=args.failure_rate,
+        failure_mode=args.failure_mode,
+        cookie_banner=args.cookie_banner,
+        seed=args.seed,
+    )
+    base_url = f"http://{args.host}:{args.port}/"
+    if args.write_accounts:
+        write_accounts(args.write_accounts, base_url, args.accounts)
+
+    print(f"🤖 Заглушка ChatGPT: {base_url} (CHATGPT_URL={base_url})")
+    web.run_app(create_app(config), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
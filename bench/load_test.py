@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест моста: воспроизводит промпты из requests.jsonl через
+/ask и /v1/chat/completions с заданной параллельностью и выводит
+p50/p95/p99 задержки, пропускную способность и время ожидания в очереди
+(по гистограмме bridge_queue_wait_seconds из /metrics).
+
+Запуск (мост смотрит на bench/fake_chatgpt.py через CHATGPT_URL):
+    python bench/load_test.py --concurrency 8 --count 100 --endpoint both --stream
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import aiohttp
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Добавляем путь к приложению для импорта
+sys.path.append(os.path.join(PROJECT_ROOT, "app"))
+
+from services.response_cache import is_error_answer  # noqa: E402
+
+QUEUE_WAIT_METRIC = "bridge_queue_wait_seconds"
+ENDPOINTS = ("ask", "v1")
+
+
+@dataclass
+class Result:
+    endpoint: str
+    ok: bool
+    latency: float
+    # Время до первого фрагмента ответа (только потоковый /v1)
+    ttft: Optional[float] = None
+    error: str = ""
+
+
+def load_prompts(path: str) -> list[str]:
+    """Промпты из JSONL: поле prompt или заголовок и текст запроса"""
+    prompts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            prompt = item.get("prompt") or "\n\n".join(
+                part for part in (item.get("title"), item.get("body")) if part
+            )
+            if prompt:
+                prompts.append(prompt)
+    if not prompts:
+        raise ValueError(f"В {path} нет промптов")
+    return prompts
+
+
+def percentile(values: list[float], q: float) -> Optional[float]:
+    """Перцентиль с линейной интерполяцией между соседними значениями"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def parse_histogram(text: str, name: str) -> dict:
+    """Суммирует гистограмму Prometheus по всем меткам: корзины, sum и count"""
+    buckets: dict[float, float] = {}
+    total = count = 0.0
+    for line in text.splitlines():
+        if not line.startswith(name):
+            continue
+        series, _, value = line.rpartition(" ")
+        if series.startswith(f"{name}_bucket"):
+            le = series.split('le="', 1)[1].split('"', 1)[0]
+            bound = float("inf") if le == "+Inf" else float(le)
+            buckets[bound] = buckets.get(bound, 0.0) + float(value)
+        elif series.startswith(f"{name}_sum"):
+            total += float(value)
+        elif series.startswith(f"{name}_count"):
+            count += float(value)
+    return {"buckets": buckets, "sum": total, "count": count}
+
+
+def histogram_delta(before: dict, after: dict) -> dict:
+    return {
+        "buckets": {
+            bound: value - before["buckets"].get(bound, 0.0)
+            for bound, value in after["buckets"].items()
+        },
+        "sum": after["sum"] - before["sum"],
+        "count": after["count"] - before["count"],
+    }
+
+
+def histogram_quantile(q: float, histogram: dict) -> Optional[float]:
+    """Оценка квантиля по корзинам (как histogram_quantile в Prometheus)"""
+    count = histogram["count"]
+    if count <= 0:
+        return None
+    rank = q * count
+    previous_bound = previous_count = 0.0
+    for bound in sorted(histogram["buckets"]):
+        cumulative = histogram["buckets"][bound]
+        if cumulative >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            if cumulative == previous_count:
+                return bound
+            fraction = (rank - previous_count) / (cumulative - previous_count)
+            return previous_bound + (bound - previous_bound) * fraction
+        previous_bound, previous_count = bound, cumulative
+    return previous_bound
+
+
+async def fetch_queue_wait(session: aiohttp.ClientSession, base_url: str) -> Optional[dict]:
+    try:
+        async with session.get(f"{base_url}/metrics") as response:
+            if response.status != 200:
+                return None
+            return parse_histogram(await response.text(), QUEUE_WAIT_METRIC)
+    except aiohttp.ClientError:
+        return None
+
+
+async def ask(session: aiohttp.ClientSession, base_url: str, prompt: str, headers: dict) -> Result:
+    started = time.perf_counter()
+    async with session.post(f"{base_url}/ask", json={"prompt": prompt}, headers=headers) as response:
+        data = await response.json(content_type=None)
+    latency = time.perf_counter() - started
+    answer = data.get("answer") if isinstance(data, dict) else None
+    if response.status != 200 or is_error_answer(answer):
+        error = (data.get("error") if isinstance(data, dict) else None) or answer or ""
+        return Result("ask", False, latency, error=f"{response.status}: {error}"[:200])
+    return Result("ask", True, latency)
+
+
+async def chat_completion(
+    session: aiohttp.ClientSession, base_url: str, prompt: str, headers: dict, stream: bool
+) -> Result:
+    payload = {"messages": [{"role": "user", "content": prompt}], "stream": stream}
+    started = time.perf_counter()
+    ttft = None
+    answer = ""
+    async with session.post(
+        f"{base_url}/v1/chat/completions", json=payload, headers=headers
+    ) as response:
+        if response.status != 200:
+            body = await response.text()
+            return Result(
+                "v1", False, time.perf_counter() - started, error=f"{response.status}: {body}"[:200]
+            )
+        if stream:
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:") or line == "data: [DONE]":
+                    continue
+                chunk = json.loads(line[5:])
+                if "error" in chunk:
+                    return Result(
+                        "v1", False, time.perf_counter() - started, ttft,
+                        error=str(chunk["error"].get("message"))[:200],
+                    )
+                delta = chunk["choices"][0]["delta"].get("content")
+                if delta:
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+                    answer += delta
+        else:
+            data = await response.json()
+            answer = data["choices"][0]["message"]["content"]
+    latency = time.perf_counter() - started
+    if is_error_answer(answer):
+        return Result("v1", False, latency, ttft, error=answer[:200])
+    return Result("v1", True, latency, ttft)
+
+
+async def run_load(
+    base_url: str,
+    prompts: list[str],
+    count: int,
+    concurrency: int,
+    endpoint: str = "both",
+    stream: bool = False,
+    unique: bool = True,
+    timeout: float = 600,
+) -> dict:
+    """Отправляет count запросов с параллельностью concurrency и возвращает сводку"""
+    base_url = base_url.rstrip("/")
+    endpoints = ENDPOINTS if endpoint == "both" else (endpoint,)
+    jobs: asyncio.Queue = asyncio.Queue()
+    for index in range(count):
+        prompt = prompts[index % len(prompts)]
+        if unique:
+            # Уникальный суффикс обходит кэш ответов и объединение одинаковых промптов
+            prompt = f"{prompt}\n\n[bench #{index}]"
+        jobs.put_nowait((endpoints[index % len(endpoints)], prompt))
+
+    results: list[Result] = []
+    headers = {"X-Client-Id": "bench", "X-Priority": "interactive"}
+
+    async with aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=concurrency + 1),
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as session:
+        queue_wait_before = await fetch_queue_wait(session, base_url)
+
+        async def worker():
+            while not jobs.empty():
+                kind, prompt = jobs.get_nowait()
+                started = time.perf_counter()
+                try:
+                    if kind == "ask":
+                        result = await ask(session, base_url, prompt, headers)
+                    else:
+                        result = await chat_completion(session, base_url, prompt, headers, stream)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                    result = Result(
+                        kind, False, time.perf_counter() - started, error=repr(e)[:200]
+                    )
+                results.append(result)
+                if not result.ok:
+                    print(f"⚠️ {kind}: {result.error}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+        queue_wait_after = await fetch_queue_wait(session, base_url)
+
+    queue_wait = None
+    if queue_wait_before and queue_wait_after:
+        queue_wait = histogram_delta(queue_wait_before, queue_wait_after)
+    return summarize(results, wall, concurrency, queue_wait)
+
+
+def latency_stats(values: list[float]) -> dict:
+    return {
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+def summarize(
+    results: list[Result], wall: float, concurrency: int, queue_wait: Optional[dict]
+) -> dict:
+    groups = {"all": results}
+    for endpoint in ENDPOINTS:
+        selected = [result for result in results if result.endpoint == endpoint]
+        if selected:
+            groups[endpoint] = selected
+
+    summary = {"concurrency": concurrency, "wall_seconds": wall, "endpoints": {}}
+    for name, items in groups.items():
+        ok = [result for result in items if result.ok]
+        ttfts = [result.ttft for result in ok if result.ttft is not None]
+        summary["endpoints"][name] = {
+            "requests": len(items),
+            "ok": len(ok),
+            "errors": len(items) - len(ok),
+            "throughput_rps": len(ok) / wall if wall else 0.0,
+            "latency": latency_stats([result.latency for result in ok]),
+            "ttft": latency_stats(ttfts) if ttfts else None,
+        }
+
+    if queue_wait and queue_wait["count"] > 0:
+        summary["queue_wait"] = {
+            "requests": int(queue_wait["count"]),
+            "mean": queue_wait["sum"] / queue_wait["count"],
+            "p50": histogram_quantile(0.50, queue_wait),
+            "p95": histogram_quantile(0.95, queue_wait),
+            "p99": histogram_quantile(0.99, queue_wait),
+        }
+    summary["errors"] = [asdict(result) for result in results if not result.ok][:20]
+    return summary
+
+
+def format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def print_report(summary: dict):
+    print(
+        f"\n📊 Параллельность {summary['concurrency']}, "
+        f"длительность {summary['wall_seconds']:.1f} с"
+    )
+    print(
+        f"{'endpoint':<8} {'req':>5} {'ok':>5} {'err':>4} {'rps':>7} "
+        f"{'p50':>8} {'p95':>8} {'p99':>8} {'ttft p50':>9} {'ttft p95':>9}"
+    )
+    for name, stats in summary["endpoints"].items():
+        latency, ttft = stats["latency"], stats["ttft"] or {}
+        print(
+            f"{name:<8} {stats['requests']:>5} {stats['ok']:>5} {stats['errors']:>4} "
+            f"{stats['throughput_rps']:>7.2f} {format_seconds(latency['p50']):>8} "
+            f"{format_seconds(latency['p95']):>8} {format_seconds(latency['p99']):>8} "
+            f"{format_seconds(ttft.get('p50')):>9} {format_seconds(ttft.get('p95')):>9}"
+        )
+
+    queue_wait = summary.get("queue_wait")
+    if queue_wait:
+        print(
+            f"⏳ Ожидание в очереди ({queue_wait['requests']} запросов): "
+            f"среднее {format_seconds(queue_wait['mean'])}, "
+            f"p50 {format_seconds(queue_wait['p50'])}, "
+            f"p95 {format_seconds(queue_wait['p95'])}, "
+            f"p99 {format_seconds(queue_wait['p99'])}"
+        )
+    else:
+        print("⏳ Ожидание в очереди: /metrics недоступен")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест GPT Bridge API")
+    parser.add_argument("--url", default="http://127.0.0.1:8010", help="адрес API моста")
+    parser.add_argument(
+        "--requests-file",
+        default=os.path.join(PROJECT_ROOT, "requests.jsonl"),
+        help="JSONL с промптами (поле prompt или title/body)",
+    )
+    parser.add_argument("--count", type=int, default=None, help="сколько запросов отправить (по умолчанию - по одному на строку)")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--endpoint", choices=ENDPOINTS + ("both",), default="both")
+    parser.add_argument("--stream", action="store_true", help="потоковый /v1 (измеряет время до первого фрагмента)")
+    parser.add_argument(
+        "--unique",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="делать промпты уникальными, чтобы обойти кэш и объединение запросов",
+    )
+    parser.add_argument("--timeout", type=float, default=600, help="таймаут одного запроса (сек)")
+    parser.add_argument("--json", metavar="PATH", help="сохранить сводку в JSON")
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.requests_file)
+    summary = asyncio.run(
+        run_load(
+            args.url,
+            prompts,
+            count=args.count or len(prompts),
+            concurrency=max(1, args.concurrency),
+            endpoint=args.endpoint,
+            stream=args.stream,
+            unique=args.unique,
+            timeout=args.timeout,
+        )
+    )
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"💾 Сводка сохранена в {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,24 @@
 import asyncio
+import json
 import logging
 import os
+import random
+import socket
 import time
-from typing import Optional
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Awaitable, Optional
 
-import requests
+import aiohttp
+import uvicorn
 from dotenv import load_dotenv
-from telegram import Update
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from telegram import Message, Update
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
@@ -16,6 +26,8 @@ from telegram.ext import (
     filters,
 )
 
+from telegram_bot_state import SQLitePersistence, UpdateInbox
+
 # Загружаем переменные окружения из .env файла
 load_dotenv()
 
@@ -27,6 +39,8 @@ logger = logging.getLogger(__name__)
 
 # Состояния для ConversationHandler
 CODE, READY = range(2)
+# Имя ConversationHandler в хранилище состояний
+CONVERSATION_NAME = "auth"
 
 # Базовый URL API сервиса
 API_BASE_URL = "http://localhost:8010"
@@ -37,45 +51,317 @@ TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TELEGRAM_BOT_TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN не установлен в переменных окружения")
 
+# Режим получения обновлений: polling (один процесс) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+# Адрес Bot API (можно указать локальную заглушку Telegram)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+# Публичный адрес webhook, который регистрируется в Telegram (пусто - не регистрировать)
+TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL", "")
+# Секрет, который Telegram передает в заголовке X-Telegram-Bot-Api-Secret-Token
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+WEBHOOK_PATH = "/telegram/webhook"
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8020"))
+# Число процессов бота, разбирающих общий журнал обновлений
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+# Как часто (сек) процесс проверяет обновления, принятые другими процессами
+WEBHOOK_POLL_INTERVAL = 0.5
+
 # Конфигурация
 MAX_RETRIES = 3
+# Задержка перед повтором растет вдвое с каждой попыткой, но не выше RETRY_MAX_DELAY
 RETRY_DELAY = 2
+RETRY_MAX_DELAY = 10
 REQUEST_TIMEOUT = 30
+# Ответ ChatGPT может занимать минуты, поэтому /ask ждет дольше остальных запросов
+ASK_TIMEOUT = 300
+# Соединений с API сервиса в пуле (keep-alive)
+API_POOL_SIZE = 100
+# Сколько обновлений (из разных чатов) обрабатывается одновременно
+CONCURRENT_UPDATES = 64
+# Сколько секунд статус авторизации считается свежим; устаревший статус
+# отдается сразу, а обновляется в фоне
+AUTH_STATUS_TTL = 15
+# Максимальная длина сообщения Telegram (в UTF-16 code units, как считает Telegram)
+MESSAGE_LIMIT = 4096
+# Минимальный интервал (сек) между правками сообщения с потоковым ответом
+STREAM_EDIT_INTERVAL = 1.5
+# Сколько раз повторять показ итогового ответа после сетевой ошибки Telegram
+FINAL_FLUSH_RETRIES = 2
+ANSWER_PREFIX = "🤖 "
+
+
+def utf16_len(text: str) -> int:
+    """Длина текста в UTF-16 code units: символы вне BMP (эмодзи) занимают две"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fit_utf16(text: str, limit: int) -> int:
+    """Сколько первых символов текста умещается в limit UTF-16 code units"""
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Делит текст на части не длиннее limit, по возможности по переносу строки.
+
+    Длина считается в UTF-16 code units, как у лимита Telegram. Граница
+    части зависит только от ее начала, поэтому при дописывании текста уже
+    заполненные части не меняются.
+    """
+    parts = []
+    while True:
+        end = _fit_utf16(text, limit)
+        if end == len(text):
+            break
+        cut = text.rfind("\n", end // 2, end)
+        if cut == -1:
+            cut = max(end, 1)
+        else:
+            cut += 1
+        parts.append(text[:cut])
+        text = text[cut:]
+    parts.append(text)
+    return parts
+
+
+class StreamingReply:
+    """Ответ, который дописывается в сообщения Telegram по мере генерации.
+
+    Первая часть ответа заменяет текст сообщения-заглушки, при превышении
+    MESSAGE_LIMIT ответ продолжается новыми сообщениями. Правки идут не
+    чаще STREAM_EDIT_INTERVAL, при RetryAfter - после указанной паузы.
+    """
+
+    def __init__(self, placeholder: Message, prefix: str = ANSWER_PREFIX):
+        self.prefix = prefix
+        self.text = ""
+        self.messages = [placeholder]
+        self._shown = [placeholder.text or ""]
+        self._next_edit = 0.0
+
+    async def append(self, delta: str):
+        self.text += delta
+        if time.monotonic() >= self._next_edit:
+            await self.flush()
+
+    async def finish(self, text: Optional[str] = None):
+        """Показывает итоговый текст ответа целиком"""
+        if text is not None:
+            self.text = text
+        await self.flush(final=True)
+
+    async def flush(self, final: bool = False, retries: int = FINAL_FLUSH_RETRIES):
+        parts = [
+            f"{self.prefix}{part}"
+            for part in split_message(self.text, MESSAGE_LIMIT - utf16_len(self.prefix))
+        ]
+        try:
+            for index, part in enumerate(parts):
+                if index < len(self.messages):
+                    if self._shown[index] != part:
+                        await self.messages[index].edit_text(part)
+                        self._shown[index] = part
+                else:
+                    self.messages.append(await self.messages[-1].reply_text(part))
+                    self._shown.append(part)
+        except RetryAfter as e:
+            delay = e.retry_after
+            delay = delay.total_seconds() if hasattr(delay, "total_seconds") else delay
+            self._next_edit = time.monotonic() + delay
+            if final:
+                await asyncio.sleep(delay)
+                await self.flush(final=True)
+            return
+        except TelegramError as e:
+            # Сетевая ошибка или отказ Telegram не прерывают генерацию ответа:
+            # текст покажет следующая правка, итоговый показ повторяется
+            logger.warning(f"Не удалось обновить сообщение с ответом: {e}")
+            if final and retries > 0 and not isinstance(e, BadRequest):
+                await asyncio.sleep(STREAM_EDIT_INTERVAL)
+                await self.flush(final=True, retries=retries - 1)
+                return
+        self._next_edit = time.monotonic() + STREAM_EDIT_INTERVAL
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Обрабатывает обновления разных чатов параллельно, одного чата - по порядку.
+
+    ConversationHandler рассчитывает на последовательную обработку
+    обновлений, поэтому сообщения одного чата ждут друг друга, а долгий
+    ответ ChatGPT в одном чате не задерживает остальные.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._pending: dict[int, int] = defaultdict(int)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if not chat:
+            await coroutine
+            return
+
+        self._pending[chat.id] += 1
+        try:
+            async with self._locks[chat.id]:
+                await coroutine
+        finally:
+            self._pending[chat.id] -= 1
+            if not self._pending[chat.id]:
+                del self._pending[chat.id]
+                del self._locks[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
 
 
 class TelegramBotEnhanced:
     def __init__(self):
         self.application = None
-
-    def _make_api_request(self, method: str, endpoint: str, **kwargs) -> Optional[dict]:
-        """Выполняет API запрос с повторными попытками"""
+        self.conversation_handler: Optional[ConversationHandler] = None
+        # Режим webhook: журнал обновлений и аренда чатов этим процессом
+        self.inbox: Optional[UpdateInbox] = None
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = asyncio.Event()
+        self._drain_task: Optional[asyncio.Task] = None
+        self._chat_tasks: set[asyncio.Task] = set()
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Кэш статуса авторизации, чтобы не запрашивать его перед каждым /ask
+        self._auth_status: Optional[dict] = None
+        self._auth_checked_at = 0.0
+        self._auth_refresh: Optional[asyncio.Task] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом keep-alive соединений к API сервиса"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                base_url=API_BASE_URL,
+                connector=aiohttp.TCPConnector(limit=API_POOL_SIZE),
+                timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT),
+            )
+        return self._session
+
+    async def close(self, application: Optional[Application] = None):
+        """Закрывает сессию HTTP-клиента"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _make_api_request(
+        self, method: str, endpoint: str, timeout: float = REQUEST_TIMEOUT, **kwargs
+    ) -> Optional[dict]:
+        """Выполняет API запрос с повторными попытками, не блокируя цикл событий"""
+        session = self._get_session()
         for attempt in range(MAX_RETRIES):
             try:
-                url = f"{API_BASE_URL}{endpoint}"
-                response = requests.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
-                
-                if response.status_code == 200:
-                    return response.json()
-                elif response.status_code >= 500:
-                    logger.warning(f"Серверная ошибка {response.status_code}, попытка {attempt + 1}/{MAX_RETRIES}")
-                else:
-                    logger.error(f"Ошибка API {response.status_code}: {response.text}")
-                    return None
-                    
-            except requests.exceptions.ConnectionError:
-                logger.warning(f"Ошибка подключения, попытка {attempt + 1}/{MAX_RETRIES}")
-            except requests.exceptions.Timeout:
+                async with session.request(
+                    method,
+                    endpoint,
+                    timeout=aiohttp.ClientTimeout(total=timeout),
+                    **kwargs,
+                ) as response:
+                    if response.status == 200:
+                        return await response.json()
+                    elif response.status >= 500:
+                        logger.warning(f"Серверная ошибка {response.status}, попытка {attempt + 1}/{MAX_RETRIES}")
+                    else:
+                        logger.error(f"Ошибка API {response.status}: {await response.text()}")
+                        return None
+
+            except asyncio.TimeoutError:
                 logger.warning(f"Таймаут запроса, попытка {attempt + 1}/{MAX_RETRIES}")
+            except aiohttp.ClientConnectionError:
+                logger.warning(f"Ошибка подключения, попытка {attempt + 1}/{MAX_RETRIES}")
             except Exception as e:
                 logger.error(f"Неожиданная ошибка при запросе: {e}")
                 return None
-                
+
             if attempt < MAX_RETRIES - 1:
-                time.sleep(RETRY_DELAY)
-                
+                delay = min(RETRY_DELAY * 2**attempt, RETRY_MAX_DELAY)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
         logger.error(f"Не удалось выполнить запрос после {MAX_RETRIES} попыток")
         return None
 
+    async def _stream_completion(
+        self, prompt: str, headers: dict, reply: StreamingReply
+    ) -> Optional[str]:
+        """Читает потоковый ответ /v1/chat/completions и дописывает его в reply.
+
+        Возвращает полный ответ или None, если поток не удалось получить
+        до конца.
+        """
+        payload = {"messages": [{"role": "user", "content": prompt}], "stream": True}
+        answer = ""
+        try:
+            async with self._get_session().post(
+                "/v1/chat/completions",
+                json=payload,
+                headers=headers,
+                timeout=aiohttp.ClientTimeout(total=ASK_TIMEOUT),
+            ) as response:
+                if response.status != 200:
+                    logger.warning(f"Потоковый ответ недоступен: {response.status}")
+                    return None
+                async for line in response.content:
+                    line = line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        return answer
+                    chunk = json.loads(data)
+                    if "error" in chunk:
+                        # Ответ оборвался ошибкой - дожидаемся его через /ask
+                        logger.warning(f"Потоковый ответ завершился ошибкой: {chunk['error']}")
+                        return None
+                    delta = chunk["choices"][0]["delta"].get("content")
+                    if delta:
+                        answer += delta
+                        await reply.append(delta)
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError) as e:
+            logger.warning(f"Потоковый ответ прерван: {e}")
+        return None
+
+    async def _fetch_auth_status(self) -> Optional[dict]:
+        auth_status = await self._make_api_request("GET", "/auth/status")
+        if auth_status:
+            self._auth_status = auth_status
+            self._auth_checked_at = time.monotonic()
+        return auth_status
+
+    def _refresh_auth_status(self) -> asyncio.Task:
+        """Запускает обновление статуса авторизации, если оно еще не идет"""
+        if self._auth_refresh is None or self._auth_refresh.done():
+            self._auth_refresh = asyncio.create_task(self._fetch_auth_status())
+        return self._auth_refresh
+
+    async def _get_auth_status(self, fresh: bool = False) -> Optional[dict]:
+        """Статус авторизации из кэша.
+
+        Устаревший статус возвращается сразу, а обновление идет в фоне;
+        fresh=True или пустой кэш - ждем ответа сервиса. Одновременные
+        запросы статуса объединяются в один вызов API.
+        """
+        if fresh or self._auth_status is None:
+            return await asyncio.shield(self._refresh_auth_status())
+        if time.monotonic() - self._auth_checked_at > AUTH_STATUS_TTL:
+            self._refresh_auth_status()
+        return self._auth_status
+
+    def _invalidate_auth_status(self):
+        """Помечает статус устаревшим, следующее сообщение обновит его"""
+        self._auth_checked_at = 0.0
+
     async def _send_typing_action(self, update: Update):
         """Отправляет индикатор набора текста"""
 
@@ -93,7 +379,7 @@ class TelegramBotEnhanced:
         if not update.message:
             return ConversationHandler.END
             
-        auth_status = self._make_api_request("GET", "/auth/status")
+        auth_status = await self._get_auth_status(fresh=True)
         
         if not auth_status:
             await update.message.reply_text(
@@ -139,7 +425,7 @@ class TelegramBotEnhanced:
         code = update.message.text
 
         # Отправляем код подтверждения в сервис
-        result = self._make_api_request("POST", "/auth/code", json={"code": code})
+        result = await self._make_api_request("POST", "/auth/code", json={"code": code})
 
         await update.message.reply_text(
             "✅ Код подтверждения отправлен!\n\n"
@@ -151,7 +437,7 @@ class TelegramBotEnhanced:
         await asyncio.sleep(3)
 
         # Проверяем фактический статус авторизации
-        auth_status = self._make_api_request("GET", "/auth/status")
+        auth_status = await self._get_auth_status(fresh=True)
         
         if not auth_status:
             await update.message.reply_text(
@@ -183,8 +469,11 @@ class TelegramBotEnhanced:
             
         message_text = update.message.text
 
-        # Проверяем статус аутентификации
-        auth_status = self._make_api_request("GET", "/auth/status")
+        # Проверяем статус аутентификации по кэшу; отрицательный статус
+        # перепроверяется, чтобы не отказывать после завершения авторизации
+        auth_status = await self._get_auth_status()
+        if auth_status and auth_status["status"] != "completed":
+            auth_status = await self._get_auth_status(fresh=True)
         
         if not auth_status:
             await update.message.reply_text("❌ Ошибка подключения к сервису.")
@@ -200,23 +489,45 @@ class TelegramBotEnhanced:
         # Отправляем индикатор набора текста
         await self._send_typing_action(update)
         
-        # Отправляем запрос в сервис
-        await update.message.reply_text("⏳ Обрабатываю ваш запрос...")
+        # Сообщение-заглушка заменяется ответом по мере генерации
+        placeholder = await update.message.reply_text("⏳ Обрабатываю ваш запрос...")
+        reply = StreamingReply(placeholder)
+
+        # Каждый пользователь Telegram - отдельный клиент в справедливой очереди
+        user_id = update.effective_user.id if update.effective_user else "unknown"
+        headers = {
+            "X-Client-Id": f"telegram:{user_id}",
+            "X-Priority": "interactive",
+            # Повтор присоединяется к уже поставленному запросу, а не создает новый
+            "Idempotency-Key": f"telegram:{update.message.chat_id}:{update.message.message_id}",
+        }
+
+        answer = await self._stream_completion(message_text, headers, reply)
+        if answer is not None:
+            await reply.finish(answer)
+            return
+
+        # Поток прервался - дожидаемся полного ответа обычным запросом. Запрос
+        # оборванного потока мог быть отменен, поэтому ключ идемпотентности свой;
+        # еще не завершенный запрос он догонит через объединение промптов
+        result = await self._make_api_request(
+            "POST",
+            "/ask",
+            timeout=ASK_TIMEOUT,
+            json={"prompt": message_text},
+            headers={**headers, "Idempotency-Key": f"{headers['Idempotency-Key']}:ask"},
+        )
+
+        if not result or "answer" not in result:
+            # Ошибка могла быть вызвана потерей авторизации
+            self._invalidate_auth_status()
 
-        result = self._make_api_request("POST", "/ask", json={"prompt": message_text})
-        
         if not result:
             await update.message.reply_text("❌ Ошибка при обработке запроса.")
             return
 
         if "answer" in result:
-            answer = result["answer"]
-            # Разбиваем длинные ответы на части
-            if len(answer) > 4000:
-                for i in range(0, len(answer), 4000):
-                    await update.message.reply_text(f"🤖 {answer[i : i + 4000]}")
-            else:
-                await update.message.reply_text(f"🤖 {answer}")
+            await reply.finish(result["answer"])
         else:
             error_msg = result.get("error", "Неизвестная ошибка")
             await update.message.reply_text(f"❌ Ошибка: {error_msg}")
@@ -226,8 +537,10 @@ class TelegramBotEnhanced:
         if not update.message:
             return
             
-        health_status = self._make_api_request("GET", "/health")
-        auth_status = self._make_api_request("GET", "/auth/status")
+        health_status, auth_status = await asyncio.gather(
+            self._make_api_request("GET", "/health"),
+            self._get_auth_status(fresh=True),
+        )
         
         if not health_status or not auth_status:
             await update.message.reply_text("❌ Ошибка при получении статуса системы.")
@@ -267,7 +580,11 @@ class TelegramBotEnhanced:
                 ],
             },
             fallbacks=[CommandHandler("cancel", self.cancel)],
+            # Состояние диалога хранится в SQLite и доступно всем процессам бота
+            name=CONVERSATION_NAME,
+            persistent=True,
         )
+        self.conversation_handler = conv_handler
 
         if not self.application:
             print("Application не инициализирован")
@@ -282,22 +599,212 @@ class TelegramBotEnhanced:
             MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message)
         )
 
+    def build_application(self):
+        """Создает Application с хранилищем состояний и настраивает обработчики"""
+        self.application = (
+            Application.builder()
+            .token(TELEGRAM_BOT_TOKEN)
+            .base_url(TELEGRAM_API_URL)
+            .persistence(SQLitePersistence())
+            .concurrent_updates(PerChatUpdateProcessor(CONCURRENT_UPDATES))
+            .post_shutdown(self.close)
+            .build()
+        )
+        self.setup_handlers()
+
+    async def start_webhook(self):
+        """Запускает обработку обновлений, принятых через webhook"""
+        self.build_application()
+        self.inbox = UpdateInbox()
+        await self.application.initialize()
+        self.check_conversation_internals()
+        await self.application.start()
+        if TELEGRAM_WEBHOOK_URL:
+            await self.application.bot.set_webhook(
+                TELEGRAM_WEBHOOK_URL, secret_token=TELEGRAM_WEBHOOK_SECRET or None
+            )
+            logger.info(f"Webhook зарегистрирован: {TELEGRAM_WEBHOOK_URL}")
+        self._drain_task = asyncio.create_task(self._drain_inbox())
+        logger.info(f"Процесс бота {self.owner} разбирает журнал обновлений")
+
+    async def stop_webhook(self):
+        if self._drain_task:
+            self._drain_task.cancel()
+            await asyncio.gather(self._drain_task, return_exceptions=True)
+        # Начатые чаты дорабатываются, чтобы не оставлять полуотправленных ответов
+        await asyncio.gather(*self._chat_tasks, return_exceptions=True)
+        await self.application.stop()
+        await self.application.shutdown()
+        await self.close()
+        self.inbox.close()
+
+    async def accept_update(self, data: dict) -> bool:
+        """Записывает обновление из webhook в журнал; False - повторная доставка"""
+        update = Update.de_json(data, self.application.bot)
+        if not update.effective_chat:
+            # Порядок важен только внутри чата, такие обновления обрабатываются сразу
+            self.application.create_task(
+                self.application.process_update(update), update=update
+            )
+            return True
+        accepted = await asyncio.to_thread(
+            self.inbox.put, update.update_id, update.effective_chat.id, data
+        )
+        self._wakeup.set()
+        return accepted
+
+    async def _drain_inbox(self):
+        """Арендует чаты с новыми обновлениями, пока есть свободные слоты"""
+        while True:
+            while len(self._chat_tasks) < CONCURRENT_UPDATES:
+                # SQLite может ждать блокировку файла - не на event loop
+                chat_id = await asyncio.to_thread(self.inbox.claim_chat, self.owner)
+                if chat_id is None:
+                    break
+                task = asyncio.create_task(self._process_chat(chat_id))
+                self._chat_tasks.add(task)
+                task.add_done_callback(self._chat_task_done)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), WEBHOOK_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _chat_task_done(self, task: asyncio.Task):
+        self._chat_tasks.discard(task)
+        self._wakeup.set()
+
+    async def _process_chat(self, chat_id: int):
+        """Обрабатывает обновления арендованного чата строго по порядку"""
+        # Ответ на одно обновление может идти дольше аренды (поток и
+        # повторы /ask), поэтому аренда продлевается и во время обработки
+        heartbeat = asyncio.create_task(self._keep_lease(chat_id))
+        try:
+            while await asyncio.to_thread(self.inbox.renew, chat_id, self.owner):
+                item = await asyncio.to_thread(self.inbox.next_update, chat_id)
+                if not item:
+                    break
+                update_id, data = item
+                await self._load_conversation_state(chat_id)
+                try:
+                    await self.application.process_update(
+                        Update.de_json(data, self.application.bot)
+                    )
+                except Exception as e:
+                    logger.error(f"Ошибка обработки обновления {update_id}: {e}")
+                # Новое состояние диалога должно попасть в SQLite до того,
+                # как чат сможет арендовать другой процесс
+                await self.application.update_persistence()
+                await asyncio.to_thread(self.inbox.done, update_id)
+        finally:
+            heartbeat.cancel()
+            await asyncio.to_thread(self.inbox.release, chat_id, self.owner)
+
+    async def _keep_lease(self, chat_id: int):
+        """Продлевает аренду чата каждую треть ее срока"""
+        while True:
+            await asyncio.sleep(self.inbox.lease_seconds / 3)
+            if not await asyncio.to_thread(self.inbox.renew, chat_id, self.owner):
+                logger.warning(f"Аренда чата {chat_id} потеряна во время обработки")
+                return
+
+    def check_conversation_internals(self):
+        """Проверяет, что словарь состояний ConversationHandler устроен как ожидается.
+
+        Без этого при обновлении PTB процессы молча теряли бы общее состояние диалогов.
+        """
+        conversations = getattr(self.conversation_handler, "_conversations", None)
+        if not hasattr(conversations, "update_no_track") or not hasattr(conversations, "data"):
+            raise RuntimeError(
+                "Несовместимая версия python-telegram-bot: ConversationHandler "
+                "не хранит состояния в TrackingDict, общий журнал обновлений недоступен"
+            )
+
+    async def _load_conversation_state(self, chat_id: int):
+        """Подгружает состояние диалога чата, которое мог изменить другой процесс.
+
+        ConversationHandler читает хранилище только при запуске и дальше
+        держит состояния в памяти, поэтому перед обработкой чата его
+        состояние берется из SQLite. Публичного API для этого в PTB нет:
+        используется словарь состояний ConversationHandler (TrackingDict),
+        поэтому версия python-telegram-bot ограничена в pyproject.toml,
+        а check_conversation_internals проверяет его при запуске.
+        """
+        states = await self.application.persistence.load_chat_conversations(
+            CONVERSATION_NAME, chat_id
+        )
+        conversations = self.conversation_handler._conversations
+        for key in [key for key in conversations if key[0] == chat_id]:
+            del conversations.data[key]
+        # update_no_track: загруженное состояние не нужно записывать обратно
+        conversations.update_no_track(states)
+
+    def create_webhook_app(self) -> FastAPI:
+        """ASGI-приложение, принимающее обновления Telegram через webhook"""
+
+        @asynccontextmanager
+        async def lifespan(app: FastAPI):
+            await self.start_webhook()
+            yield
+            await self.stop_webhook()
+
+        app = FastAPI(title="GPT Bridge Telegram Bot", lifespan=lifespan)
+
+        @app.post(WEBHOOK_PATH)
+        async def telegram_webhook(request: Request):
+            secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            if TELEGRAM_WEBHOOK_SECRET and secret != TELEGRAM_WEBHOOK_SECRET:
+                return JSONResponse(status_code=403, content={"error": "Invalid secret"})
+            try:
+                data = await request.json()
+            except Exception:
+                return JSONResponse(status_code=400, content={"error": "Invalid JSON"})
+            # Telegram ждет быстрого ответа: обновление только записывается в журнал
+            await self.accept_update(data)
+            return {"ok": True}
+
+        @app.get("/health")
+        async def health():
+            return {
+                "status": "healthy",
+                "worker": self.owner,
+                "active_chats": len(self._chat_tasks),
+                **(await asyncio.to_thread(self.inbox.get_stats)),
+            }
+
+        return app
+
     def run(self):
         """Запускает бота"""
         if not TELEGRAM_BOT_TOKEN:
             logger.error("TELEGRAM_BOT_TOKEN не установлен")
             return
-            
-        self.application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
 
-        # Настраиваем обработчики
-        self.setup_handlers()
+        if BOT_MODE == "webhook":
+            # Каждый процесс uvicorn создает свое приложение и разбирает общий журнал
+            logger.info(f"Запуск Telegram бота в режиме webhook ({WEBHOOK_WORKERS} процессов)...")
+            uvicorn.run(
+                "telegram_bot_enhanced:create_webhook_app",
+                factory=True,
+                host=WEBHOOK_HOST,
+                port=WEBHOOK_PORT,
+                workers=WEBHOOK_WORKERS,
+            )
+            return
+
+        self.build_application()
 
         # Запускаем бота
         logger.info("Запуск Telegram бота...")
         self.application.run_polling()
 
 
+def create_webhook_app() -> FastAPI:
+    """Фабрика ASGI-приложения для uvicorn (режим webhook)"""
+    return TelegramBotEnhanced().create_webhook_app()
+
+
 def main():
     """Основная функция для запуска бота"""
     bot = TelegramBotEnhanced()
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+# Файл SQLite с состоянием диалогов и входящими обновлениями бота; общий
+# для всех процессов бота, поэтому переживает перезапуск и масштабирование
+BOT_STATE_PATH = os.getenv(
+    "BOT_STATE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "telegram_bot_state.sqlite3"),
+)
+# На сколько секунд процесс бота закрепляет за собой чат; если процесс
+# упал, необработанные обновления чата заберет другой после истечения срока
+CHAT_LEASE_SECONDS = 900
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Открывает SQLite для совместной работы нескольких процессов.
+
+    Соединение используется из потоков asyncio.to_thread, поэтому вызовы
+    сериализуются блокировкой владельца соединения, а ожидание чужой
+    блокировки файла не останавливает event loop.
+    """
+    db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class SQLitePersistence(BasePersistence):
+    """Хранит состояния ConversationHandler в SQLite.
+
+    Данные пользователей, чатов и бота не сохраняются - боту они не
+    нужны. Состояние читается по чату перед обработкой его обновлений
+    (load_chat_conversations), поэтому процессы бота видят изменения
+    друг друга.
+    """
+
+    def __init__(self, path: str = BOT_STATE_PATH, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=False, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self._db = connect(path)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS conversations "
+            "(name TEXT NOT NULL, chat_id INTEGER, key TEXT NOT NULL, state TEXT NOT NULL, "
+            "PRIMARY KEY (name, key))"
+        )
+
+    def _load(self, name: str, chat_id: Optional[int] = None) -> dict:
+        query = "SELECT key, state FROM conversations WHERE name = ?"
+        params: tuple = (name,)
+        if chat_id is not None:
+            query += " AND chat_id = ?"
+            params += (chat_id,)
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+
+    async def get_conversations(self, name: str) -> dict:
+        return await asyncio.to_thread(self._load, name)
+
+    async def load_chat_conversations(self, name: str, chat_id: int) -> dict:
+        """Состояния диалогов одного чата"""
+        return await asyncio.to_thread(self._load, name, chat_id)
+
+    def _update(self, name: str, key: tuple, new_state: Optional[object]):
+        with self._lock:
+            if new_state is None:
+                self._db.execute(
+                    "DELETE FROM conversations WHERE name = ? AND key = ?",
+                    (name, json.dumps(list(key))),
+                )
+                return
+            # Ключ ConversationHandler начинается с ID чата (per_chat=True)
+            self._db.execute(
+                "INSERT OR REPLACE INTO conversations (name, chat_id, key, state) "
+                "VALUES (?, ?, ?, ?)",
+                (name, key[0], json.dumps(list(key)), json.dumps(new_state)),
+            )
+
+    async def update_conversation(self, name: str, key: tuple, new_state: Optional[object]):
+        await asyncio.to_thread(self._update, name, key, new_state)
+
+    async def get_user_data(self) -> dict:
+        return {}
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def drop_user_data(self, user_id: int) -> None:
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
+
+    async def flush(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class UpdateInbox:
+    """Очередь входящих обновлений Telegram с арендой чатов.
+
+    Webhook любого процесса записывает обновление и сразу отвечает
+    Telegram. Обрабатывает чат тот процесс, который арендовал его:
+    обновления одного чата идут строго по update_id, разные чаты
+    распределяются между процессами.
+
+    Методы блокирующие (ждут блокировку файла до 30 с): из event loop их
+    вызывают через asyncio.to_thread.
+    """
+
+    def __init__(
+        self, path: str = BOT_STATE_PATH, lease_seconds: float = CHAT_LEASE_SECONDS
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._db = connect(path)
+        self._lock = threading.Lock()
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS updates "
+            "(update_id INTEGER PRIMARY KEY, chat_id INTEGER NOT NULL, "
+            "payload TEXT NOT NULL, received_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS updates_chat ON updates (chat_id, update_id)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases "
+            "(chat_id INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._db.execute(sql, params)
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    def put(self, update_id: int, chat_id: int, payload: dict) -> bool:
+        """Записывает обновление; повторная доставка того же update_id игнорируется"""
+        cursor = self._execute(
+            "INSERT OR IGNORE INTO updates (update_id, chat_id, payload, received_at) "
+            "VALUES (?, ?, ?, ?)",
+            (update_id, chat_id, json.dumps(payload, ensure_ascii=False), time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def claim_chat(self, owner: str) -> Optional[int]:
+        """Арендует чат с самым старым необработанным обновлением"""
+        with self._lock:
+            now = time.time()
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT chat_id FROM updates WHERE chat_id NOT IN "
+                    "(SELECT chat_id FROM leases WHERE expires_at > ?) "
+                    "ORDER BY update_id LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO leases (chat_id, owner, expires_at) "
+                        "VALUES (?, ?, ?)",
+                        (row[0], owner, now + self.lease_seconds),
+                    )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return row[0] if row else None
+
+    def next_update(self, chat_id: int) -> Optional[tuple[int, dict]]:
+        """Самое раннее необработанное обновление чата"""
+        row = self._fetchone(
+            "SELECT update_id, payload FROM updates WHERE chat_id = ? "
+            "ORDER BY update_id LIMIT 1",
+            (chat_id,),
+        )
+        return (row[0], json.loads(row[1])) if row else None
+
+    def renew(self, chat_id: int, owner: str) -> bool:
+        """Продлевает аренду; False - чат уже забрал другой процесс"""
+        cursor = self._execute(
+            "UPDATE leases SET expires_at = ? WHERE chat_id = ? AND owner = ?",
+            (time.time() + self.lease_seconds, chat_id, owner),
+        )
+        return cursor.rowcount > 0
+
+    def done(self, update_id: int):
+        self._execute("DELETE FROM updates WHERE update_id = ?", (update_id,))
+
+    def release(self, chat_id: int, owner: str):
+        self._execute(
+            "DELETE FROM leases WHERE chat_id = ? AND owner = ?", (chat_id, owner)
+        )
+
+    def get_stats(self) -> dict:
+        pending, chats = self._fetchone(
+            "SELECT COUNT(*), COUNT(DISTINCT chat_id) FROM updates"
+        )
+        (leased,) = self._fetchone(
+            "SELECT COUNT(*) FROM leases WHERE expires_at > ?", (time.time(),)
+        )
+        return {"pending_updates": pending, "pending_chats": chats, "leased_chats": leased}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Тесты пула аккаунтов: выбор наименее загруженного и пауза после лимита
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from client.browser_client import BrowserClient
+from services import chatgpt_bridge
+from services.account_pool import Account, AccountConfig, AccountPool
+from services.chatgpt_bridge import ChatGPTBridgeService
+
+
+class FakeBrowser:
+    def __init__(self, status: str = "completed"):
+        self.auth_status = {"status": status}
+
+
+class FakePool:
+    def __init__(self, size: int = 1):
+        self.size = size
+
+
+def _account(name: str, status: str = "completed", tabs: int = 1) -> Account:
+    config = AccountConfig(name=name, email=f"{name}@example.com", password="", cookies_path="")
+    return Account(config=config, browser=FakeBrowser(status), pool=FakePool(tabs))
+
+
+def test_requests_spread_across_accounts():
+    """Одинаково загруженные аккаунты выбираются по кругу, занятый - последним"""
+
+    async def scenario():
+        pool = AccountPool([_account("a"), _account("b"), _account("c", status="waiting_code")])
+        first = await pool.acquire()
+        second = await pool.acquire()
+        pool.release(first)
+        third = await pool.acquire()
+        return first.name, second.name, third.name
+
+    assert asyncio.run(scenario()) == ("a", "b", "a")
+
+
+def test_rate_limited_account_is_skipped_until_cooldown_ends():
+    """Аккаунт с баннером лимита не выбирается, пока идет пауза"""
+
+    async def scenario():
+        pool = AccountPool([_account("a"), _account("b")], cooldown=0.05)
+        limited = await pool.acquire()
+        pool.release(limited)
+        pool.cool_down(limited, "too many requests")
+
+        names = []
+        for _ in range(3):
+            account = await pool.acquire()
+            names.append(account.name)
+            pool.release(account)
+
+        # Повтор того же запроса: другой аккаунт уже пробовали - ждем конца паузы
+        started = time.monotonic()
+        retry = await pool.acquire(exclude={"b"})
+        waited = time.monotonic() - started
+        pool.release(retry)
+
+        recovered = {(await pool.acquire()).name, (await pool.acquire()).name}
+        return limited.name, names, retry.name, waited, recovered
+
+    limited, names, retry, waited, recovered = asyncio.run(scenario())
+
+    assert limited == "a"
+    assert names == ["b", "b", "b"]
+    assert retry == "a"
+    assert waited >= 0.04
+    assert recovered == {"a", "b"}
+
+
+def test_retry_gives_up_when_cooldown_outlasts_deadline():
+    """Пауза оставшихся аккаунтов дольше срока запроса - ждать бессмысленно"""
+
+    async def scenario():
+        pool = AccountPool([_account("a"), _account("b")], cooldown=10)
+        pool.cool_down(pool.get("a"), "too many requests")
+        started = time.monotonic()
+        retry = await pool.acquire(exclude={"b"}, deadline=time.time() + 1)
+        everything_tried = await pool.acquire(exclude={"a", "b"})
+        return retry, everything_tried, time.monotonic() - started
+
+    retry, everything_tried, elapsed = asyncio.run(scenario())
+
+    assert retry is None
+    assert everything_tried is None
+    assert elapsed < 0.5
+
+
+class FakePage:
+    """Страница без баннера лимита: скрипт проверки ничего не находит"""
+
+    url = "https://chatgpt.com/"
+
+    def is_closed(self) -> bool:
+        return False
+
+    async def evaluate(self, script, arg=None):
+        return None
+
+
+class AnsweringClient:
+    """Клиент браузера, отвечающий заданным текстом"""
+
+    answer = ""
+    detect_rate_limit = BrowserClient.detect_rate_limit
+
+    def __init__(self, **kwargs):
+        self.page = FakePage()
+        self.thread_url = None
+        self.restart_browser_on_failure = True
+        self.auth_status = {"status": "completed"}
+
+    def is_browser_alive(self) -> bool:
+        return True
+
+    async def send_and_get_answer_with_reconnect(self, prompt, on_delta=None):
+        return self.answer
+
+
+def test_answer_mentioning_rate_limit_does_not_cool_down(monkeypatch):
+    """Обычный ответ про "rate limit" не принимается за баннер лимита"""
+    monkeypatch.setattr(chatgpt_bridge, "BrowserClient", AnsweringClient)
+    monkeypatch.setattr(AnsweringClient, "answer", "HTTP 429 means Too Many Requests.")
+
+    async def scenario():
+        service = ChatGPTBridgeService()
+        service._initialized = True
+        result = await service.handle_request("What is HTTP 429?")
+        return result, service.accounts.primary
+
+    result, account = asyncio.run(scenario())
+
+    assert result == "HTTP 429 means Too Many Requests."
+    assert not account.is_cooling_down()
+    assert account.rate_limits == 0
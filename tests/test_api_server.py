@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Тесты HTTP API моста в одном процессе (httpx.ASGITransport) с фиктивным обработчиком
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import httpx
+from aiohttp import web
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from server import api_server
+from services.request_queue import CANCELLED_RESULT, DEFAULT_PROCESSING_ESTIMATE, RequestQueue
+
+
+def make_app(monkeypatch, handle):
+    """Приложение API с собственной очередью без журнала на диске"""
+    RequestQueue._instance = None
+    queue = RequestQueue()
+    queue.journal = None
+    monkeypatch.setattr(api_server, "request_queue", queue)
+    return api_server.create_app(handle)
+
+
+def make_client(monkeypatch, handle) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=make_app(monkeypatch, handle)),
+        base_url="http://bridge",
+    )
+
+
+def sse_events(body: str) -> list:
+    """Данные событий SSE: JSON или строка [DONE]"""
+    events = []
+    for line in body.splitlines():
+        if line.startswith("data: "):
+            data = line[len("data: "):]
+            events.append(data if data == "[DONE]" else json.loads(data))
+    return events
+
+
+def stream_request(content: str) -> dict:
+    return {"messages": [{"role": "user", "content": content}], "stream": True}
+
+
+def test_stream_sends_role_deltas_and_stop(monkeypatch):
+    """Поток: чанк с ролью, фрагменты по мере генерации, остаток ответа, stop и [DONE]"""
+
+    async def handle(prompt, on_delta=None):
+        on_delta("Hel")
+        await asyncio.sleep(0)
+        on_delta("lo")
+        await asyncio.sleep(0)
+        return "Hello world"
+
+    async def scenario():
+        async with make_client(monkeypatch, handle) as client:
+            response = await client.post(
+                "/v1/chat/completions",
+                json=stream_request("happy stream"),
+                headers={"Cache-Control": "no-store"},
+            )
+        return response, sse_events(response.text)
+
+    response, events = asyncio.run(scenario())
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    deltas = [event["choices"][0]["delta"] for event in events[:-1]]
+    assert deltas == [
+        {"role": "assistant", "content": ""},
+        {"content": "Hel"},
+        {"content": "lo"},
+        {"content": " world"},
+        {},
+    ]
+    assert [event["choices"][0]["finish_reason"] for event in events[:-1]] == [
+        None, None, None, None, "stop"
+    ]
+    assert events[-1] == "[DONE]"
+
+
+def test_stream_disconnect_unsubscribes_and_cancels_request(monkeypatch):
+    """Клиент отключился посреди потока - запрос отменяется и браузер освобождается"""
+    cancelled = []
+
+    async def handle(prompt, on_delta=None):
+        on_delta("Hel")
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(prompt)
+            raise
+
+    async def scenario():
+        app = make_app(monkeypatch, handle)
+        body = json.dumps(stream_request("disconnect")).encode()
+        sent = []
+        got_delta = asyncio.Event()
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # Клиент уходит, получив первый фрагмент ответа
+            await got_delta.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+            if b'"Hel"' in message.get("body", b""):
+                got_delta.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/v1/chat/completions",
+            "raw_path": b"/v1/chat/completions",
+            "query_string": b"",
+            "root_path": "",
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"cache-control", b"no-store"),
+            ],
+            "server": ("bridge", 80),
+            "client": ("127.0.0.1", 1234),
+        }
+        await asyncio.wait_for(app(scope, receive, send), timeout=5)
+        for _ in range(100):
+            if cancelled:
+                break
+            await asyncio.sleep(0.01)
+        return sent, list(api_server.request_queue.requests.values())
+
+    sent, requests = asyncio.run(scenario())
+
+    body = b"".join(message.get("body", b"") for message in sent).decode()
+    assert "[DONE]" not in body
+    assert cancelled == ["disconnect"]
+    assert [request.status for request in requests] == ["cancelled"]
+
+
+def test_stream_accepts_final_text_from_another_source(monkeypatch):
+    """Итог, отличающийся от фрагментов только пробелами, - успешный ответ, а не ошибка"""
+
+    async def handle(prompt, on_delta=None):
+        # Фрагменты - текст страницы, итог - markdown из сетевого потока
+        on_delta("Hello world")
+        await asyncio.sleep(0)
+        return "Hello  world\n"
+
+    async def scenario():
+        async with make_client(monkeypatch, handle) as client:
+            response = await client.post(
+                "/v1/chat/completions",
+                json=stream_request("different sources"),
+                headers={"Cache-Control": "no-store"},
+            )
+        return sse_events(response.text)
+
+    events = asyncio.run(scenario())
+
+    assert not any("error" in event for event in events if event != "[DONE]")
+    deltas = [event["choices"][0]["delta"] for event in events[:-1]]
+    assert deltas == [{"role": "assistant", "content": ""}, {"content": "Hello world"}, {}]
+    assert events[-2]["choices"][0]["finish_reason"] == "stop"
+    assert events[-1] == "[DONE]"
+
+
+def test_stream_reports_error_after_partial_answer(monkeypatch):
+    """Ошибка после части ответа не выдается за полный ответ с finish_reason stop"""
+
+    async def handle(prompt, on_delta=None):
+        on_delta("Hal")
+        await asyncio.sleep(0)
+        return "❌ Не удалось выполнить запрос после всех попыток"
+
+    async def scenario():
+        async with make_client(monkeypatch, handle) as client:
+            response = await client.post(
+                "/v1/chat/completions",
+                json=stream_request("error after partial"),
+                headers={"Cache-Control": "no-store"},
+            )
+        return sse_events(response.text)
+
+    events = asyncio.run(scenario())
+
+    assert events[1]["choices"][0]["delta"] == {"content": "Hal"}
+    assert events[2]["error"]["message"].startswith("❌ Не удалось")
+    assert events[3] == "[DONE]"
+    finish_reasons = [
+        event["choices"][0]["finish_reason"] for event in events if "choices" in event
+    ]
+    assert "stop" not in finish_reasons
+
+
+async def start_webhook_receiver(received: asyncio.Queue) -> tuple[web.AppRunner, str]:
+    """Локальный HTTP-сервер, принимающий webhook о завершении задач"""
+
+    async def callback(request):
+        await received.put(await request.json())
+        return web.json_response({"ok": True})
+
+    app = web.Application()
+    app.router.add_post("/callback", callback)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/callback"
+
+
+def test_jobs_lifecycle_and_webhook(monkeypatch):
+    """POST /jobs отвечает 202 сразу, задачу можно опросить, отменить и получить webhook"""
+    release = asyncio.Event()
+
+    async def handle(prompt, on_delta=None):
+        await release.wait()
+        return f"answer: {prompt}"
+
+    async def scenario():
+        received = asyncio.Queue()
+        runner, callback_url = await start_webhook_receiver(received)
+        try:
+            async with make_client(monkeypatch, handle) as client:
+                created = await client.post(
+                    "/jobs", json={"prompt": "first", "callback_url": callback_url}
+                )
+                first = created.json()
+                # Обработчик забирает первую задачу, вторая ждет в очереди
+                await asyncio.sleep(0.05)
+                second = (await client.post("/jobs", json={"prompt": "second"})).json()
+                polled = (await client.get(f"/jobs/{second['id']}")).json()
+
+                cancelled = await client.delete(f"/jobs/{second['id']}")
+                cancelled_again = await client.delete(f"/jobs/{second['id']}")
+                missing = await client.get("/jobs/unknown")
+
+                release.set()
+                webhook = await asyncio.wait_for(received.get(), timeout=5)
+                done = (await client.get(f"/jobs/{first['id']}")).json()
+        finally:
+            await runner.cleanup()
+        return created, first, second, polled, cancelled, cancelled_again, missing, webhook, done
+
+    created, first, second, polled, cancelled, cancelled_again, missing, webhook, done = (
+        asyncio.run(scenario())
+    )
+
+    assert created.status_code == 202
+    assert first["status"] in ("queued", "processing")
+    assert first["priority"] == "batch"
+    assert first["result"] is None
+
+    assert polled["status"] == "queued"
+    assert polled["position"] == 0
+    # Впереди одна задача в работе: ожидание - одна оценка длительности
+    assert polled["eta_seconds"] == DEFAULT_PROCESSING_ESTIMATE
+
+    assert cancelled.status_code == 200
+    assert cancelled.json()["status"] == "cancelled"
+    assert cancelled.json()["result"] == CANCELLED_RESULT
+    assert cancelled_again.status_code == 409
+    assert missing.status_code == 404
+
+    assert done["status"] == "completed"
+    assert done["result"] == "answer: first"
+    assert done["eta_seconds"] == 0.0
+    assert webhook["id"] == first["id"]
+    assert webhook["status"] == "completed"
+    assert webhook["result"] == "answer: first"
+
+
+def test_jobs_and_ask_reject_non_object_body(monkeypatch):
+    """JSON-тело не объектом - ошибка клиента 400, а не 500"""
+
+    async def handle(prompt, on_delta=None):
+        return "unused"
+
+    async def scenario():
+        async with make_client(monkeypatch, handle) as client:
+            return [
+                await client.post("/jobs", json=["prompt"]),
+                await client.post("/jobs", json="prompt"),
+                await client.post("/ask", json=["prompt"]),
+                await client.post("/jobs", content=b"{not json"),
+            ]
+
+    responses = asyncio.run(scenario())
+
+    assert [response.status_code for response in responses] == [400, 400, 400, 400]
+    assert responses[0].json() == {"error": "JSON body must be an object"}
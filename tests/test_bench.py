@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Тесты заглушки ChatGPT и нагрузочного теста из bench/
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import aiohttp
+from aiohttp import web
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Добавляем пути к приложению и bench/ для импорта
+sys.path.append(os.path.join(PROJECT_ROOT, "app"))
+sys.path.append(os.path.join(PROJECT_ROOT, "bench"))
+
+from client.stream_parser import ConversationStreamParser  # noqa: E402
+from fake_chatgpt import (  # noqa: E402
+    STATS_KEY,
+    FakeChatGPTConfig,
+    answer_tokens,
+    create_app,
+    write_accounts,
+)
+from load_test import (  # noqa: E402
+    histogram_delta,
+    histogram_quantile,
+    load_prompts,
+    parse_histogram,
+    percentile,
+    run_load,
+)
+
+
+async def start(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def post_conversation(base_url: str, prompt: str) -> tuple[int, ConversationStreamParser]:
+    """Читает поток заглушки тем же парсером, что и браузерный клиент"""
+    parser = ConversationStreamParser()
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{base_url}/backend-api/conversation", json={"prompt": prompt}
+        ) as response:
+            try:
+                async for chunk in response.content.iter_any():
+                    parser.feed(chunk.decode("utf-8"))
+            except aiohttp.ClientPayloadError:
+                pass
+            parser.finish()
+            return response.status, parser
+
+
+def test_fake_chatgpt_streams_parsable_answer():
+    """Поток заглушки разбирается парсером клиента в ожидаемый ответ"""
+    config = FakeChatGPTConfig(token_rate=0, answer_tokens=5, first_token_delay=0)
+
+    async def scenario():
+        runner, base_url = await start(create_app(config))
+        try:
+            status, parser = await post_conversation(base_url, "привет мир")
+        finally:
+            await runner.cleanup()
+        return status, parser
+
+    status, parser = asyncio.run(scenario())
+
+    assert status == 200
+    assert parser.text == "".join(answer_tokens("привет мир", 5)) == "привет мир привет мир привет"
+    assert parser.conversation_id
+
+
+def test_fake_chatgpt_injects_failures():
+    """Сбой error отдает HTTP 500, disconnect обрывает ответ на середине"""
+
+    async def scenario():
+        results = {}
+        for mode in ("error", "disconnect"):
+            config = FakeChatGPTConfig(
+                token_rate=0, answer_tokens=10, first_token_delay=0,
+                failure_rate=1.0, failure_mode=mode,
+            )
+            app = create_app(config)
+            runner, base_url = await start(app)
+            try:
+                status, parser = await post_conversation(base_url, "a b c d e f g h i j")
+            finally:
+                await runner.cleanup()
+            results[mode] = (status, parser.text, app[STATS_KEY])
+        return results
+
+    results = asyncio.run(scenario())
+
+    status, _, stats = results["error"]
+    assert status == 500
+    assert stats.failures == {"error": 1}
+
+    status, text, stats = results["disconnect"]
+    assert status == 200
+    assert text == "a b c d e"
+    assert stats.completed == 0
+
+
+def test_write_accounts_creates_authorized_sessions(tmp_path):
+    path = tmp_path / "accounts.json"
+    write_accounts(str(path), "http://127.0.0.1:9000/", count=2)
+
+    accounts = json.loads(path.read_text())
+    assert [account["name"] for account in accounts] == ["fake1", "fake2"]
+    session = json.loads(open(accounts[0]["cookies_path"]).read())
+    assert session["cookies"]
+    assert session["auth_status"]["status"] == "completed"
+
+
+def test_percentile_and_histogram_quantile():
+    assert percentile([], 0.5) is None
+    assert percentile([4, 1, 3, 2], 0.5) == 2.5
+    assert percentile([1, 2, 3, 4, 5], 0.99) == 4.96
+
+    before = parse_histogram(
+        'bridge_queue_wait_seconds_bucket{priority="batch",le="1"} 2\n'
+        'bridge_queue_wait_seconds_bucket{priority="batch",le="+Inf"} 2\n'
+        'bridge_queue_wait_seconds_sum{priority="batch"} 1\n'
+        'bridge_queue_wait_seconds_count{priority="batch"} 2\n',
+        "bridge_queue_wait_seconds",
+    )
+    after = parse_histogram(
+        'bridge_queue_wait_seconds_bucket{priority="batch",le="1"} 4\n'
+        'bridge_queue_wait_seconds_bucket{priority="batch",le="+Inf"} 4\n'
+        'bridge_queue_wait_seconds_sum{priority="batch"} 2\n'
+        'bridge_queue_wait_seconds_count{priority="batch"} 4\n'
+        'bridge_queue_wait_seconds_bucket{priority="interactive",le="1"} 2\n'
+        'bridge_queue_wait_seconds_bucket{priority="interactive",le="+Inf"} 4\n'
+        'bridge_queue_wait_seconds_sum{priority="interactive"} 6\n'
+        'bridge_queue_wait_seconds_count{priority="interactive"} 4\n',
+        "bridge_queue_wait_seconds",
+    )
+    delta = histogram_delta(before, after)
+
+    # Две новые batch и две interactive в корзине до 1 с, две interactive выше
+    assert delta["count"] == 6
+    assert delta["sum"] == 7
+    assert histogram_quantile(0.5, delta) == 0.75
+    # Квантиль в корзине +Inf оценивается ее нижней границей
+    assert histogram_quantile(0.95, delta) == 1.0
+    assert histogram_quantile(0.5, {"buckets": {}, "sum": 0, "count": 0}) is None
+
+
+def test_load_prompts_uses_prompt_or_title_and_body(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    path.write_text(
+        json.dumps({"prompt": "first"}) + "\n\n"
+        + json.dumps({"request_id": "x", "title": "Title", "body": "Body"}) + "\n"
+    )
+    assert load_prompts(str(path)) == ["first", "Title\n\nBody"]
+
+
+def test_run_load_reports_latency_errors_and_queue_wait():
+    """Прогон против заглушки моста: оба эндпоинта, ошибки и ожидание в очереди"""
+    prompts_seen = []
+    queue_waits = []
+
+    def metrics_text() -> str:
+        below = sum(1 for wait in queue_waits if wait <= 0.1)
+        return "\n".join(
+            [
+                "# TYPE bridge_queue_wait_seconds histogram",
+                f'bridge_queue_wait_seconds_bucket{{priority="interactive",le="0.1"}} {below}',
+                f'bridge_queue_wait_seconds_bucket{{priority="interactive",le="+Inf"}} {len(queue_waits)}',
+                f'bridge_queue_wait_seconds_sum{{priority="interactive"}} {sum(queue_waits)}',
+                f'bridge_queue_wait_seconds_count{{priority="interactive"}} {len(queue_waits)}',
+            ]
+        )
+
+    async def ask(request):
+        prompt = (await request.json())["prompt"]
+        prompts_seen.append(prompt)
+        queue_waits.append(0.05)
+        if prompt.startswith("fail"):
+            return web.json_response({"answer": "❌ Ошибка"}, status=500)
+        return web.json_response({"answer": "ok"})
+
+    async def completions(request):
+        prompts_seen.append((await request.json())["messages"][-1]["content"])
+        queue_waits.append(0.05)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for delta in [{"role": "assistant"}, {"content": "o"}, {"content": "k"}]:
+            chunk = {"choices": [{"index": 0, "delta": delta}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def metrics(request):
+        return web.Response(text=metrics_text())
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_post("/ask", ask)
+        app.router.add_post("/v1/chat/completions", completions)
+        app.router.add_get("/metrics", metrics)
+        runner, base_url = await start(app)
+        try:
+            return await run_load(
+                base_url, ["hello", "hello", "fail", "fail"], count=8, concurrency=3, endpoint="both", stream=True
+            )
+        finally:
+            await runner.cleanup()
+
+    summary = asyncio.run(scenario())
+
+    endpoints = summary["endpoints"]
+    assert endpoints["all"]["requests"] == 8
+    # Четные запросы идут в /ask, нечетные в /v1; половина /ask - с ошибкой
+    assert endpoints["ask"]["requests"] == 4
+    assert endpoints["ask"]["errors"] == 2
+    assert endpoints["v1"]["ok"] == 4
+    assert endpoints["v1"]["ttft"]["p50"] is not None
+    assert endpoints["ask"]["ttft"] is None
+    assert endpoints["all"]["latency"]["p99"] is not None
+    assert summary["queue_wait"]["requests"] == 8
+    assert abs(summary["queue_wait"]["mean"] - 0.05) < 1e-9
+    # Уникальные суффиксы обходят кэш ответов моста
+    assert len(set(prompts_seen)) == 8
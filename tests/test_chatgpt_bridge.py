@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Тесты повторов запроса в сервисе моста на фиктивных вкладках
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services import chatgpt_bridge
+from services.chatgpt_bridge import ChatGPTBridgeService
+
+
+class FakePage:
+    url = "https://chatgpt.com/"
+
+    def is_closed(self) -> bool:
+        return False
+
+
+class ScriptedClient:
+    """Клиент браузера, который по очереди выдает заготовленные попытки ответа"""
+
+    attempts: list[tuple[list[str], str]] = []
+
+    def __init__(self, **kwargs):
+        self.page = FakePage()
+        self.thread_url = None
+        self.restart_browser_on_failure = True
+        self.auth_status = {"status": "completed"}
+
+    def is_browser_alive(self) -> bool:
+        return True
+
+    async def detect_rate_limit(self):
+        return None
+
+    async def send_and_get_answer_with_reconnect(self, prompt, on_delta=None):
+        deltas, result = ScriptedClient.attempts.pop(0)
+        for delta in deltas:
+            on_delta(delta)
+            await asyncio.sleep(0)
+        return result
+
+
+def test_retry_does_not_stream_answer_again(monkeypatch):
+    """Повтор после ошибки не пересылает уже отданные фрагменты ответа"""
+    monkeypatch.setattr(chatgpt_bridge, "BrowserClient", ScriptedClient)
+    ScriptedClient.attempts = [
+        (["Hel"], "Таймаут ожидания ответа"),
+        (["Hel", "lo"], "Hello"),
+    ]
+
+    async def scenario():
+        service = ChatGPTBridgeService()
+        service._initialized = True
+        deltas = []
+        result = await service.handle_request("hi", on_delta=deltas.append)
+        return result, deltas
+
+    result, deltas = asyncio.run(scenario())
+
+    assert result == "Hello"
+    assert deltas == ["Hel", "lo"]
+    assert ScriptedClient.attempts == []
+
+
+class HangingClient(ScriptedClient):
+    """Клиент, чей ответ генерируется, пока запрос не отменят"""
+
+    recycled = 0
+
+    async def send_and_get_answer_with_reconnect(self, prompt, on_delta=None):
+        await asyncio.Event().wait()
+
+    async def recycle_context(self):
+        HangingClient.recycled += 1
+
+
+def test_cancelled_requests_do_not_recycle_tab(monkeypatch):
+    """Отмена запроса клиентом не считается ошибкой вкладки"""
+    monkeypatch.setattr(chatgpt_bridge, "BrowserClient", HangingClient)
+    HangingClient.recycled = 0
+
+    async def scenario():
+        service = ChatGPTBridgeService()
+        service._initialized = True
+        for _ in range(3):
+            task = asyncio.create_task(service.handle_request("hi"))
+            await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        return service.pool.workers[0], service.accounts.primary
+
+    worker, account = asyncio.run(scenario())
+
+    assert HangingClient.recycled == 0
+    assert worker.failures == 0
+    assert not worker.busy
+    assert account.in_flight == 0
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Тесты продолжения диалогов: история диалога -> тред ChatGPT
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services.conversation_store import ConversationStore
+from services.request_queue import RequestQueue
+
+THREAD_URL = "https://chatgpt.com/c/abc"
+
+
+def test_follow_up_turn_sends_only_new_message():
+    """Следующий ход диалога уходит в известный тред одним новым сообщением"""
+    store = ConversationStore()
+    first = [("system", "Be brief"), ("user", "Hi")]
+    # Первый ход не создает тред
+    assert store.prepare(first) is None
+
+    second = first + [("assistant", "Hello!"), ("user", "What is 2+2?")]
+    turn = store.prepare(second)
+    assert turn.thread is None
+    assert "User: Hi" in turn.prompt and "Assistant: Hello!" in turn.prompt
+    assert turn.prompt.startswith("Be brief")
+    store.commit(turn, "4", THREAD_URL, "default", 0)
+
+    third = second + [("assistant", " 4 "), ("user", "And 3+3?")]
+    follow_up = store.prepare(third)
+    assert follow_up.thread.url == THREAD_URL
+    assert follow_up.prompt == "And 3+3?"
+
+    # Тред забран ходом: параллельное ответвление начнет новый тред
+    assert store.prepare(third).thread is None
+
+
+def test_unanswered_turn_returns_thread_and_lru_evicts():
+    """Тред хода без ответа возвращается, лишние треды вытесняются"""
+    store = ConversationStore(max_threads=1)
+    dialog = [("user", "a"), ("assistant", "b"), ("user", "c")]
+    turn = store.prepare(dialog)
+    store.commit(turn, "d", THREAD_URL, "default", 0)
+
+    follow_up = dialog + [("assistant", "d"), ("user", "e")]
+    claimed = store.prepare(follow_up)
+    store.release(claimed)
+    assert store.prepare(follow_up).thread is not None
+
+    other = [("user", "x"), ("assistant", "y"), ("user", "z")]
+    other_turn = store.prepare(other)
+    store.commit(other_turn, "w", "https://chatgpt.com/c/other", "default", 1)
+    store.commit(claimed, "f", THREAD_URL, "default", 0)
+    assert store.get_stats()["threads"] == 1
+
+
+def test_same_message_in_different_dialogs_is_not_coalesced():
+    """Одинаковое сообщение в разных диалогах не объединяется в один запрос"""
+
+    async def scenario():
+        RequestQueue._instance = None
+        queue = RequestQueue()
+        queue.journal = None
+        store = ConversationStore()
+        release = asyncio.Event()
+        calls = []
+
+        async def handle(prompt, on_delta=None, conversation=None):
+            calls.append(conversation.key)
+            await release.wait()
+            return "ok"
+
+        queue.set_handle_request_func(handle)
+        first = store.prepare([("user", "a"), ("assistant", "b"), ("user", "yes")])
+        second = store.prepare([("user", "c"), ("assistant", "d"), ("user", "yes")])
+        done = [asyncio.Future(), asyncio.Future()]
+        first_id = await queue.add_request("yes", done[0].set_result, conversation=first)
+        second_id = await queue.add_request("yes", done[1].set_result, conversation=second)
+        release.set()
+        await asyncio.gather(*done)
+        return first_id, second_id, calls, [first.key, second.key]
+
+    first_id, second_id, calls, keys = asyncio.run(scenario())
+
+    assert first_id != second_id
+    assert calls == keys
+
+
+def _store_with_thread() -> tuple[ConversationStore, list]:
+    """Хранилище с тредом для диалога и историей следующего хода"""
+    store = ConversationStore()
+    dialog = [("user", "a"), ("assistant", "b"), ("user", "c")]
+    store.commit(store.prepare(dialog), "d", THREAD_URL, "default", 0)
+    return store, dialog + [("assistant", "d"), ("user", "e")]
+
+
+def test_turns_that_never_reach_handler_return_thread():
+    """Ход, просроченный в очереди или присоединенный к другому запросу, не теряет тред"""
+
+    async def scenario():
+        RequestQueue._instance = None
+        queue = RequestQueue()
+        queue.journal = None
+        release = asyncio.Event()
+
+        async def handle(prompt, on_delta=None, conversation=None):
+            await release.wait()
+            return "ok"
+
+        queue.set_handle_request_func(handle)
+        # Обработчик занят посторонним запросом
+        busy = asyncio.Future()
+        await queue.add_request("busy", busy.set_result)
+
+        store, follow_up = _store_with_thread()
+        expired = asyncio.Future()
+        turn = store.prepare(follow_up)
+        await queue.add_request(
+            "e", expired.set_result, idempotency_key="k", conversation=turn, timeout=0.01
+        )
+        await expired
+
+        # Повтор с тем же ключом идемпотентности получает результат первого
+        # запроса и в браузер не уходит, но тред забрал
+        retry = store.prepare(follow_up)
+        retried = asyncio.Future()
+        await queue.add_request("e", retried.set_result, idempotency_key="k", conversation=retry)
+        await retried
+        after_retry = store.prepare(follow_up)
+
+        release.set()
+        await busy
+        return turn, retry, after_retry
+
+    turn, retry, after_retry = asyncio.run(scenario())
+
+    assert turn.thread is not None
+    assert retry.thread is turn.thread
+    assert after_retry.thread is turn.thread
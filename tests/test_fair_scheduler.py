@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Тесты справедливого планировщика очереди запросов
+"""
+
+import asyncio
+import os
+import sys
+from dataclasses import dataclass
+from typing import Optional
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services.fair_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    FairScheduler,
+)
+
+
+@dataclass
+class _Request:
+    id: str
+    priority: str
+    client_id: str
+    max_concurrency: Optional[int] = None
+
+
+def _drain(scheduler: FairScheduler, count: int) -> list[str]:
+    """Забирает count запросов, сразу отмечая каждый завершенным"""
+    order = []
+    for _ in range(count):
+        request = scheduler._pop()
+        order.append(request.id)
+        scheduler.release(request)
+    return order
+
+
+def test_interactive_request_overtakes_batch_backlog():
+    """Интерактивный запрос не ждет сотни пакетных промптов"""
+    scheduler = FairScheduler()
+    for i in range(500):
+        scheduler.put(_Request(f"batch-{i}", PRIORITY_BATCH, "importer"))
+    _drain(scheduler, 3)
+
+    scheduler.put(_Request("chat", PRIORITY_INTERACTIVE, "telegram:1"))
+
+    assert scheduler.position("chat") == 0
+    assert scheduler.depths()[PRIORITY_BATCH] == 497
+    assert _drain(scheduler, 1) == ["chat"]
+
+
+def test_clients_in_same_class_are_interleaved():
+    """Клиенты одного класса обслуживаются по очереди, а не по порядку постановки"""
+    scheduler = FairScheduler()
+    for i in range(3):
+        scheduler.put(_Request(f"a{i}", PRIORITY_BATCH, "a"))
+    for i in range(3):
+        scheduler.put(_Request(f"b{i}", PRIORITY_BATCH, "b"))
+
+    assert _drain(scheduler, 6) == ["a0", "b0", "a1", "b1", "a2", "b2"]
+
+
+def test_client_concurrency_cap():
+    """Клиент с лимитом 1 не занимает второй обработчик"""
+
+    async def scenario():
+        scheduler = FairScheduler()
+        scheduler.put(_Request("a0", PRIORITY_INTERACTIVE, "a", max_concurrency=1))
+        scheduler.put(_Request("a1", PRIORITY_INTERACTIVE, "a", max_concurrency=1))
+        scheduler.put(_Request("b0", PRIORITY_BATCH, "b"))
+
+        first = await scheduler.get()
+        second = await scheduler.get()
+        blocked = asyncio.create_task(scheduler.get())
+        await asyncio.sleep(0)
+        assert not blocked.done()
+
+        scheduler.release(first)
+        third = await asyncio.wait_for(blocked, 1)
+        return [first.id, second.id, third.id]
+
+    assert asyncio.run(scenario()) == ["a0", "b0", "a1"]
+
+
+def test_higher_header_limit_does_not_lift_cap_of_queued_requests():
+    """Запрос с большим лимитом не снимает лимит уже ожидающих запросов клиента"""
+    scheduler = FairScheduler()
+    scheduler.put(_Request("a0", PRIORITY_INTERACTIVE, "a", max_concurrency=1))
+    scheduler.put(_Request("a1", PRIORITY_INTERACTIVE, "a", max_concurrency=1))
+    scheduler.put(_Request("a2", PRIORITY_INTERACTIVE, "a", max_concurrency=10))
+
+    first = scheduler._pop()
+    assert first.id == "a0"
+    assert scheduler._pop() is None
+
+    scheduler.release(first)
+    assert scheduler._pop().id == "a1"
+    cancelled = scheduler.remove("a2")
+
+    # Запросы клиента покинули планировщик - его лимит больше не действует
+    scheduler.release(_Request("a1", PRIORITY_INTERACTIVE, "a", max_concurrency=1))
+    assert cancelled
+    assert scheduler._limits == {}
+
+    scheduler.put(_Request("a3", PRIORITY_INTERACTIVE, "a"))
+    scheduler.put(_Request("a4", PRIORITY_INTERACTIVE, "a"))
+    assert [scheduler._pop().id, scheduler._pop().id] == ["a3", "a4"]
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Тесты метрик в формате Prometheus
+"""
+
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    """Значение попадает во все корзины с границей не меньше его"""
+    histogram = metrics.Histogram("test_latency_seconds", "Test", ("phase",), (0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "input")
+
+    lines = set(metrics.render().splitlines())
+
+    assert 'test_latency_seconds_bucket{phase="input",le="0.1"} 2' in lines
+    assert 'test_latency_seconds_bucket{phase="input",le="1"} 3' in lines
+    assert 'test_latency_seconds_bucket{phase="input",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{phase="input"} 4' in lines
+    assert 'test_latency_seconds_sum{phase="input"} 3.65' in lines
+
+
+def test_unlabeled_counter_is_exported_from_start():
+    """Счетчик без меток виден со значением 0 до первого события"""
+    counter = metrics.Counter("test_events_total", "Test")
+    assert "test_events_total 0" in metrics.render().splitlines()
+
+    counter.inc()
+    counter.inc(amount=2)
+    assert "test_events_total 3" in metrics.render().splitlines()
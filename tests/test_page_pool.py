@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Тесты пула вкладок: выбор вкладки, учет ошибок, пересоздание и смена браузера
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from client import page_pool
+from client.page_pool import PagePool
+
+
+class FakePage:
+    def __init__(self):
+        self.closed = False
+
+    def is_closed(self) -> bool:
+        return self.closed
+
+
+class FakeClient:
+    """Клиент браузера, который только отмечает вызовы"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.page = FakePage()
+        self.alive = True
+        self.closed = False
+        self.recycled = 0
+        self.spawned = []
+        self.auth_status = {"status": "completed"}
+
+    def is_browser_alive(self) -> bool:
+        return self.alive
+
+    async def spawn_worker(self) -> "FakeClient":
+        client = FakeClient(f"{self.name}-{len(self.spawned) + 1}")
+        self.spawned.append(client)
+        return client
+
+    async def recycle_context(self):
+        self.recycled += 1
+        self.page = FakePage()
+
+    async def close(self):
+        self.closed = True
+
+
+def test_acquire_spawns_tabs_prefers_requested_and_waits_for_release():
+    primary = FakeClient("main")
+
+    async def scenario():
+        pool = PagePool(primary, size=3)
+        first = await pool.acquire()
+        preferred = await pool.acquire(prefer=2)
+        other = await pool.acquire()
+
+        # Свободных вкладок нет - следующий запрос ждет возврата
+        waiting = asyncio.create_task(pool.acquire())
+        await asyncio.sleep(0.01)
+        blocked = not waiting.done()
+        await pool.release(other, True)
+        returned = await asyncio.wait_for(waiting, timeout=1)
+        return pool, first, preferred, other, blocked, returned
+
+    pool, first, preferred, other, blocked, returned = asyncio.run(scenario())
+
+    assert [worker.id for worker in pool.workers] == [0, 1, 2]
+    assert len(primary.spawned) == 2
+    assert first.client is primary
+    assert preferred.id == 2
+    assert other.id == 1
+    assert blocked
+    assert returned is other and returned.busy
+
+
+def test_tabs_are_not_spawned_before_authorization():
+    primary = FakeClient("main")
+    primary.auth_status = {"status": "waiting_code"}
+
+    async def scenario():
+        pool = PagePool(primary, size=3)
+        await pool.acquire()
+        return pool
+
+    pool = asyncio.run(scenario())
+
+    assert len(pool.workers) == 1
+    assert primary.spawned == []
+
+
+def test_release_counts_failures_and_recycles_tab():
+    primary = FakeClient("main")
+
+    async def scenario():
+        pool = PagePool(primary, size=2)
+        await pool.acquire()
+        worker = await pool.acquire()
+        old_client = worker.client
+
+        await pool.release(worker, False, "timeout")
+        after_failure = (worker.failures, worker.total_failures, worker.last_error)
+        # Прерванный запрос ничего не говорит о здоровье вкладки
+        await pool.acquire(prefer=worker.id)
+        await pool.release(worker, None)
+        after_cancel = worker.failures
+        await pool.acquire(prefer=worker.id)
+        await pool.release(worker, True)
+        after_success = worker.failures
+
+        for _ in range(page_pool.PAGE_MAX_FAILURES):
+            await pool.acquire(prefer=worker.id)
+            await pool.release(worker, False, "selector not found")
+        return worker, old_client, after_failure, after_cancel, after_success
+
+    worker, old_client, after_failure, after_cancel, after_success = asyncio.run(scenario())
+
+    assert after_failure == (1, 1, "timeout")
+    assert after_cancel == 1
+    assert after_success == 0
+    # Вкладка пересоздана: старый контекст закрыт, новый взят у основного клиента
+    assert old_client.closed
+    assert worker.client is primary.spawned[-1] and worker.client is not old_client
+    assert worker.recycles == 1
+    assert worker.failures == 0
+    assert worker.total_failures == 1 + page_pool.PAGE_MAX_FAILURES
+    assert worker.total_requests == 3 + page_pool.PAGE_MAX_FAILURES
+    assert primary.recycled == 0
+
+
+def test_primary_tab_recycles_context_when_closed():
+    primary = FakeClient("main")
+
+    async def scenario():
+        pool = PagePool(primary, size=1)
+        primary.page.closed = True
+        worker = await pool.acquire()
+        return pool, worker
+
+    pool, worker = asyncio.run(scenario())
+
+    assert primary.recycled == 1
+    assert worker.client is primary
+    assert worker.recycles == 1
+    assert pool.get_status()[0]["healthy"]
+
+
+def test_reset_drops_tabs_of_old_browser():
+    old_primary = FakeClient("old")
+    new_primary = FakeClient("new")
+
+    async def scenario():
+        pool = PagePool(old_primary, size=3)
+        await pool.acquire()
+        busy = await pool.acquire(prefer=1)
+        idle_spawned = old_primary.spawned[1]
+
+        await pool.reset(new_primary)
+        closed_on_reset = (idle_spawned.closed, busy.client.closed, old_primary.closed)
+
+        # Занятая вкладка старого браузера закрывается при возврате и в пул не попадает
+        await pool.release(busy, True)
+        workers = []
+        for _ in range(3):
+            workers.append(await pool.acquire())
+        return pool, busy, closed_on_reset, workers
+
+    pool, busy, closed_on_reset, workers = asyncio.run(scenario())
+
+    assert closed_on_reset == (True, False, False)
+    assert busy.client.closed
+    assert busy not in workers
+    assert workers[0].client is new_primary
+    assert [worker.client for worker in workers[1:]] == new_primary.spawned
+    assert all(worker.generation == 1 for worker in pool.workers)
+    assert [worker.id for worker in pool.workers] == [0, 1, 2]
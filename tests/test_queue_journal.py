@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Тесты журнала очереди запросов
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services.queue_journal import QueueJournal
+from services.request_queue import STATUS_COMPLETED, RequestQueue
+
+
+def _fresh_queue(path) -> RequestQueue:
+    """Новый экземпляр очереди (синглтон сбрасывается) с журналом в path"""
+    RequestQueue._instance = None
+    queue = RequestQueue()
+    queue.journal = QueueJournal(str(path))
+    return queue
+
+
+def test_replay_merges_records_and_skips_torn_lines(tmp_path):
+    """Записи о завершении дополняют запись о постановке, оборванная строка игнорируется"""
+    path = tmp_path / "journal.jsonl"
+
+    async def scenario():
+        journal = QueueJournal(str(path))
+        journal.append({"op": "enqueue", "id": "a", "prompt": "one", "created_at": 1})
+        journal.append({"op": "enqueue", "id": "b", "prompt": "two", "created_at": 2})
+        journal.append({"op": "done", "id": "a", "status": "completed", "result": "ok"})
+        await journal.close()
+
+    asyncio.run(scenario())
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "enqueue", "id": "c", "pro')
+
+    records = QueueJournal(str(path)).replay()
+
+    assert [record["id"] for record in records] == ["a", "b"]
+    assert records[0]["result"] == "ok"
+    assert "status" not in records[1]
+
+
+def test_restart_redelivers_pending_and_keeps_idempotency(tmp_path):
+    """После перезапуска незавершенный запрос выполняется снова, завершенный - нет"""
+    path = tmp_path / "journal.jsonl"
+
+    async def before_crash():
+        queue = _fresh_queue(path)
+        queue.set_handle_request_func(lambda prompt: asyncio.sleep(0, f"answer: {prompt}"))
+        done = asyncio.Future()
+        await queue.add_request("first", done.set_result, idempotency_key="k1")
+        await done
+        # Второй запрос попадает в журнал, но процесс "падает" до обработки
+        queue.set_handle_request_func(lambda prompt: asyncio.Future())
+        await queue.add_request("second", lambda result: None, idempotency_key="k2")
+        await asyncio.sleep(0.05)
+        for task in queue._workers:
+            task.cancel()
+
+    async def after_restart():
+        queue = _fresh_queue(path)
+        handled = []
+
+        async def handle(prompt):
+            handled.append(prompt)
+            return f"answer: {prompt}"
+
+        queue.set_handle_request_func(handle)
+        finished = asyncio.Future()
+        requeued = await queue.restore(lambda request: finished.set_result)
+        result = await asyncio.wait_for(finished, 1)
+
+        repeated = asyncio.Future()
+        first_id = await queue.add_request("first", repeated.set_result, idempotency_key="k1")
+        await queue.close()
+        return requeued, result, handled, await repeated, queue.get_request(first_id)
+
+    asyncio.run(before_crash())
+    requeued, result, handled, repeated, first = asyncio.run(after_restart())
+
+    assert requeued == 1
+    assert result == "answer: second"
+    assert handled == ["second"]
+    assert repeated == "answer: first"
+    assert first.status == STATUS_COMPLETED
+
+
+def test_add_request_returns_after_record_is_on_disk(tmp_path):
+    """ID запроса отдается только после fsync: падение сразу после ответа его не теряет"""
+    path = tmp_path / "journal.jsonl"
+
+    async def scenario():
+        queue = _fresh_queue(path)
+        queue.set_handle_request_func(lambda prompt: asyncio.Future())
+        request_ids = await asyncio.gather(
+            queue.add_request("one", lambda result: None),
+            queue.add_request("two", lambda result: None),
+        )
+        # Файл читается сразу, до следующего окна группового коммита
+        on_disk = [record["id"] for record in QueueJournal(str(path)).replay()]
+        for task in queue._workers:
+            task.cancel()
+        return request_ids, on_disk
+
+    request_ids, on_disk = asyncio.run(scenario())
+
+    assert on_disk == request_ids
+
+
+def test_add_request_survives_journal_write_error(tmp_path):
+    """Ошибка записи журнала не мешает принять запрос"""
+    path = tmp_path / "missing" / "journal.jsonl"
+
+    async def scenario():
+        queue = _fresh_queue(path)
+        queue.set_handle_request_func(lambda prompt: asyncio.sleep(0, f"answer: {prompt}"))
+        done = asyncio.Future()
+        request_id = await queue.add_request("one", done.set_result)
+        return request_id, await asyncio.wait_for(done, 1)
+
+    request_id, result = asyncio.run(scenario())
+
+    assert request_id
+    assert result == "answer: one"
+
+
+def test_close_waits_for_batch_in_flight(tmp_path, monkeypatch):
+    """Закрытие журнала во время записи пачки не оставляет commit() висеть"""
+    path = tmp_path / "journal.jsonl"
+    journal = QueueJournal(str(path))
+    write_lines = journal._write_lines
+    writing = []
+
+    def slow_write(lines):
+        writing.append(lines)
+        time.sleep(0.1)
+        write_lines(lines)
+
+    monkeypatch.setattr(journal, "_write_lines", slow_write)
+
+    async def scenario():
+        committed = asyncio.create_task(journal.commit({"op": "enqueue", "id": "a"}))
+        while not writing:
+            await asyncio.sleep(0.001)
+        journal.append({"op": "done", "id": "a", "status": "completed"})
+        await journal.close()
+        await asyncio.wait_for(committed, 1)
+        journal.append({"op": "enqueue", "id": "late"})
+        try:
+            await journal.commit({"op": "enqueue", "id": "late"})
+        except RuntimeError:
+            return True
+        return False
+
+    rejected_after_close = asyncio.run(scenario())
+
+    records = QueueJournal(str(path)).replay()
+    assert [(record["id"], record.get("status")) for record in records] == [("a", "completed")]
+    assert rejected_after_close
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Тесты очереди запросов: объединение одинаковых промптов, сроки и отмена
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services.request_queue import STATUS_CANCELLED, STATUS_EXPIRED, RequestQueue
+
+
+def _fresh_queue() -> RequestQueue:
+    """Новый экземпляр очереди без журнала на диске"""
+    RequestQueue._instance = None
+    queue = RequestQueue()
+    queue.journal = None
+    return queue
+
+
+def test_identical_prompts_share_one_browser_call():
+    """Совпадающие промпты выполняются один раз, результат получают все"""
+
+    async def scenario():
+        queue = _fresh_queue()
+        calls = []
+        release = asyncio.Event()
+
+        async def handle(prompt, on_delta=None):
+            calls.append(prompt)
+            on_delta("Hel")
+            await release.wait()
+            on_delta("lo")
+            return "Hello"
+
+        queue.set_handle_request_func(handle)
+        first, second = asyncio.Future(), asyncio.Future()
+        first_deltas, late_deltas = [], []
+
+        first_id = await queue.add_request(
+            "What is  2+2?", first.set_result, on_delta=first_deltas.append
+        )
+        await asyncio.sleep(0.01)
+        # Второй клиент приходит во время генерации
+        second_id = await queue.add_request(
+            " What is 2+2? ", second.set_result, on_delta=late_deltas.append
+        )
+        release.set()
+
+        results = await asyncio.gather(first, second)
+        return queue, calls, first_id, second_id, results, first_deltas, late_deltas
+
+    queue, calls, first_id, second_id, results, first_deltas, late_deltas = asyncio.run(
+        scenario()
+    )
+
+    assert calls == ["What is  2+2?"]
+    assert first_id == second_id
+    assert results == ["Hello", "Hello"]
+    assert "".join(first_deltas) == "Hello"
+    assert "".join(late_deltas) == "Hello"
+    assert queue.get_coalescing_stats()["hits"] == 1
+
+
+def test_finished_prompt_is_asked_again():
+    """После завершения запроса тот же промпт снова идет в браузер"""
+
+    async def scenario():
+        queue = _fresh_queue()
+        calls = []
+
+        async def handle(prompt):
+            calls.append(prompt)
+            return f"answer {len(calls)}"
+
+        queue.set_handle_request_func(handle)
+        results = []
+        for _ in range(2):
+            done = asyncio.Future()
+            await queue.add_request("ping", done.set_result)
+            results.append(await done)
+        return calls, results
+
+    calls, results = asyncio.run(scenario())
+
+    assert calls == ["ping", "ping"]
+    assert results == ["answer 1", "answer 2"]
+
+
+def test_expired_request_never_reaches_browser():
+    """Запрос, срок которого истек в очереди, снимается без обращения к браузеру"""
+
+    async def scenario():
+        queue = _fresh_queue()
+        calls = []
+        release = asyncio.Event()
+
+        async def handle(prompt):
+            calls.append(prompt)
+            await release.wait()
+            return "done"
+
+        queue.set_handle_request_func(handle)
+        first, second = asyncio.Future(), asyncio.Future()
+        await queue.add_request("long", first.set_result)
+        second_id = await queue.add_request("short", second.set_result, timeout=0.05)
+
+        expired = await asyncio.wait_for(second, 1)
+        release.set()
+        await first
+        return calls, expired, queue.get_request(second_id).status
+
+    calls, expired, status = asyncio.run(scenario())
+
+    assert calls == ["long"]
+    assert expired.startswith("Ошибка")
+    assert status == STATUS_EXPIRED
+
+
+def test_handler_receives_request_deadline():
+    """Обработчик, принимающий deadline, получает срок запроса"""
+
+    async def scenario():
+        queue = _fresh_queue()
+        received = []
+
+        async def handle(prompt, deadline=None):
+            received.append(deadline)
+            return "done"
+
+        queue.set_handle_request_func(handle)
+        timed, untimed = asyncio.Future(), asyncio.Future()
+        timed_id = await queue.add_request("timed", timed.set_result, timeout=30)
+        await timed
+        await queue.add_request("untimed", untimed.set_result)
+        await untimed
+        return received, queue.get_request(timed_id).deadline
+
+    received, deadline = asyncio.run(scenario())
+
+    assert received == [deadline, None]
+
+
+def test_last_subscriber_leaving_cancels_generation():
+    """Генерация прерывается, только когда ответ не ждет ни один клиент"""
+
+    async def scenario():
+        queue = _fresh_queue()
+        cancelled = asyncio.Event()
+
+        async def handle(prompt):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        queue.set_handle_request_func(handle)
+        first, second = asyncio.Future(), asyncio.Future()
+        request_id = await queue.add_request("same", first.set_result)
+        await queue.add_request("same", second.set_result)
+        await asyncio.sleep(0.01)
+
+        queue.unsubscribe(request_id)
+        await asyncio.sleep(0.01)
+        still_running = not cancelled.is_set()
+
+        queue.unsubscribe(request_id)
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await first
+        return still_running, queue.get_request(request_id).status
+
+    still_running, status = asyncio.run(scenario())
+
+    assert still_running
+    assert status == STATUS_CANCELLED
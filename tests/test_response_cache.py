@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Тесты кэша ответов
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services.response_cache import ResponseCache
+
+
+def test_key_depends_on_system_prompt_and_ignores_spacing():
+    """Ключ учитывает системный промпт и не зависит от лишних пробелов"""
+    assert ResponseCache.key("What is  2+2? ") == ResponseCache.key("What is 2+2?")
+    assert ResponseCache.key("hi", "Be brief") != ResponseCache.key("hi")
+
+
+def test_lru_eviction_ttl_and_errors(monkeypatch):
+    """Вытесняется самый старый ответ, просроченные и ошибочные не отдаются"""
+    now = [1000.0]
+    monkeypatch.setattr("services.response_cache.time.time", lambda: now[0])
+    cache = ResponseCache(ttl=60, max_size=2, path="")
+
+    async def scenario():
+        cache.set("a", "answer a")
+        cache.set("b", "answer b")
+        assert await cache.get("a") == "answer a"
+        cache.set("c", "answer c")  # вытесняет "b" - к нему дольше не обращались
+        cache.set("d", "Ошибка: не найдено поле ввода")
+
+        assert await cache.get("b") is None
+        assert await cache.get("d") is None
+        assert await cache.get("a") == "answer a"
+
+        now[0] += 61
+        assert await cache.get("c") is None
+
+    asyncio.run(scenario())
+    assert cache.get_stats()["hits"] == 2
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    """Ответ из SQLite доступен новому экземпляру кэша"""
+    path = str(tmp_path / "cache.sqlite")
+
+    async def scenario():
+        cache = ResponseCache(ttl=60, max_size=10, path=path)
+        cache.set("k", "persisted")
+        await cache.close()
+
+        restarted = ResponseCache(ttl=60, max_size=10, path=path)
+        answer = await restarted.get("k")
+        stats = restarted.get_stats()
+        await restarted.close()
+        return answer, stats
+
+    answer, stats = asyncio.run(scenario())
+    assert answer == "persisted"
+    assert stats["disk_hits"] == 1
+
+
+def test_sqlite_writes_are_batched_off_the_event_loop(tmp_path, monkeypatch):
+    """Ответы пишутся в SQLite одной транзакцией после окна, а не на каждый set"""
+    monkeypatch.setattr("services.response_cache.CACHE_FLUSH_INTERVAL", 0.05)
+    path = str(tmp_path / "cache.sqlite")
+
+    def rows() -> int:
+        db = sqlite3.connect(path)
+        try:
+            return db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        except sqlite3.OperationalError:
+            return 0
+        finally:
+            db.close()
+
+    async def scenario():
+        # В памяти помещается один ответ: второй берется из буфера записи
+        cache = ResponseCache(ttl=60, max_size=1, path=path)
+        for index in range(5):
+            cache.set(f"k{index}", f"answer {index}")
+        before_flush = rows()
+        buffered = await cache.get("k0")
+        await asyncio.sleep(0.2)
+        after_flush = rows()
+        await cache.close()
+        return before_flush, buffered, after_flush
+
+    before_flush, buffered, after_flush = asyncio.run(scenario())
+
+    assert before_flush == 0
+    assert buffered == "answer 0"
+    assert after_flush == 5
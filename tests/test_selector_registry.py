@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Тесты реестра селекторов: запомненный победитель и параллельная перепроверка
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from client.browser_client import BrowserClient
+from client.selector_registry import SelectorRegistry
+
+
+class FakePage:
+    """Страница, на которой видимы только заданные селекторы"""
+
+    def __init__(self, visible: dict[str, float]):
+        # селектор -> через сколько секунд он появляется
+        self.visible = visible
+        self.queries = []
+        self.waits = []
+
+    async def query_selector(self, selector: str):
+        self.queries.append(selector)
+        selector = selector.replace(" >> visible=true", "")
+        return f"<{selector}>" if self.visible.get(selector) == 0 else None
+
+    async def wait_for_selector(self, selector: str, timeout: float):
+        self.waits.append(selector)
+        delay = self.visible.get(selector)
+        if delay is None:
+            await asyncio.sleep(timeout / 1000)
+            raise TimeoutError(selector)
+        await asyncio.sleep(delay)
+        return f"<{selector}>"
+
+
+def test_winner_is_tried_first_and_healed_on_miss():
+    """Сработавший селектор проверяется одним запросом, при промахе находится новый"""
+
+    async def scenario():
+        registry = SelectorRegistry({"composer": ["textarea", "[contenteditable='true']"]})
+
+        page = FakePage({"[contenteditable='true']": 0})
+        first = await registry.resolve(page, "composer", timeout=1000)
+
+        steady = FakePage({"[contenteditable='true']": 0})
+        second = await registry.resolve(steady, "composer", timeout=1000)
+
+        changed = FakePage({"textarea": 0.01})
+        third = await registry.resolve(changed, "composer", timeout=1000)
+        return registry, first, second, steady, third
+
+    registry, first, second, steady, third = asyncio.run(scenario())
+
+    assert first[0] == "[contenteditable='true']"
+    assert second[0] == "[contenteditable='true']"
+    assert steady.queries == ["[contenteditable='true'] >> visible=true"]
+    assert steady.waits == []
+    assert third[0] == "textarea"
+    assert registry.winner("composer") == "textarea"
+    assert registry.get_stats()["composer"]["misses"] == 1
+
+
+def test_probe_runs_candidates_in_parallel():
+    """Неработающие селекторы не задерживают поиск рабочего"""
+
+    async def scenario():
+        registry = SelectorRegistry({"composer": ["textarea", "input", "[role='textbox']"]})
+        page = FakePage({"[role='textbox']": 0.01})
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        selector, _ = await registry.resolve(page, "composer", timeout=5000)
+        return selector, loop.time() - started
+
+    selector, elapsed = asyncio.run(scenario())
+
+    assert selector == "[role='textbox']"
+    assert elapsed < 1
+
+
+class FakeElement:
+    def __init__(self, log: list, name: str):
+        self.log = log
+        self.name = name
+
+    async def press(self, key: str):
+        self.log.append((self.name, key))
+
+    async def click(self, timeout=None):
+        self.log.append((self.name, "click"))
+
+
+class ComposerPage:
+    """Страница, где запрос появляется в ленте только после заданного действия"""
+
+    def __init__(self, log: list, submits_on: tuple):
+        self.log = log
+        self.submits_on = submits_on
+
+    async def wait_for_function(self, script, arg=None, timeout=None):
+        if self.submits_on not in self.log:
+            raise TimeoutError("user turn")
+
+    async def query_selector(self, selector: str):
+        if selector.startswith('[data-testid="send-button"]'):
+            return FakeElement(self.log, "send")
+        return None
+
+
+def test_send_button_is_clicked_when_enter_does_not_submit():
+    """Enter не отправил запрос - используется кнопка отправки из реестра"""
+
+    async def submit(submits_on: tuple) -> list:
+        log = []
+        client = BrowserClient()
+        client.page = ComposerPage(log, submits_on)
+        await client._submit_prompt(FakeElement(log, "composer"), user_baseline=0)
+        return log
+
+    assert asyncio.run(submit(("composer", "Enter"))) == [("composer", "Enter")]
+    assert asyncio.run(submit(("send", "click"))) == [
+        ("composer", "Enter"),
+        ("send", "click"),
+    ]
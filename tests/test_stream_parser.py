@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Тесты разбора SSE-потока ответа ChatGPT
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from client import browser_client
+from client.browser_client import BrowserClient
+from client.stream_parser import ConversationStreamParser, DeltaRelay
+
+
+def _event(payload, event=None) -> str:
+    data = payload if isinstance(payload, str) else json.dumps(payload)
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data}\n\n"
+
+
+def test_snapshot_format():
+    """Полные снимки сообщения превращаются в приращения текста"""
+    parser = ConversationStreamParser()
+    message = {
+        "id": "m1",
+        "author": {"role": "assistant"},
+        "content": {"content_type": "text", "parts": ["Hel"]},
+        "status": "in_progress",
+    }
+
+    assert parser.feed(_event({"message": message, "conversation_id": "c1"})) == "Hel"
+
+    message["content"]["parts"] = ["Hello\n\n```py\nx = 1\n```"]
+    assert parser.feed(_event({"message": message})) == "lo\n\n```py\nx = 1\n```"
+    assert not parser.done
+
+    assert parser.feed(_event("[DONE]")) == ""
+    assert parser.done
+    assert parser.conversation_id == "c1"
+    assert parser.text == "Hello\n\n```py\nx = 1\n```"
+
+
+def test_delta_encoding_split_chunks():
+    """Delta encoding v1 разбирается даже при разрезанных событиях"""
+    parser = ConversationStreamParser()
+    stream = (
+        _event('"v1"', "delta_encoding")
+        + _event(
+            {
+                "p": "",
+                "o": "add",
+                "v": {
+                    "message": {
+                        "id": "m1",
+                        "author": {"role": "assistant"},
+                        "content": {"content_type": "text", "parts": [""]},
+                    },
+                    "conversation_id": "c2",
+                },
+            },
+            "delta",
+        )
+        + _event({"p": "/message/content/parts/0", "o": "append", "v": "Hi"}, "delta")
+        + _event({"v": " there"}, "delta")
+        + _event(
+            {
+                "p": "",
+                "o": "patch",
+                "v": [
+                    {"p": "/message/content/parts/0", "o": "append", "v": "!"},
+                    {"p": "/message/end_turn", "o": "replace", "v": True},
+                ],
+            },
+            "delta",
+        )
+    )
+
+    deltas = [parser.feed(stream[i : i + 7]) for i in range(0, len(stream), 7)]
+
+    assert "".join(deltas) == "Hi there!"
+    assert parser.text == "Hi there!"
+    assert parser.conversation_id == "c2"
+    assert parser.done
+
+
+def test_non_answer_messages_are_ignored():
+    """Сообщения инструментов и скрытые сообщения не попадают в ответ"""
+    parser = ConversationStreamParser()
+    parser.feed(
+        _event(
+            {
+                "p": "",
+                "o": "add",
+                "v": {
+                    "message": {
+                        "id": "t1",
+                        "author": {"role": "tool"},
+                        "content": {"content_type": "text", "parts": ["search..."]},
+                    }
+                },
+            }
+        )
+    )
+    parser.feed(_event({"p": "/message/content/parts/0", "o": "append", "v": "more"}))
+
+    assert parser.text == ""
+    assert parser.finish() == ""
+    assert parser.done
+
+
+def test_delta_relay_skips_text_already_sent():
+    """Повторная попытка досылает только продолжение отправленного текста"""
+    sent = []
+    relay = DeltaRelay(sent.append)
+
+    first = relay.attempt()
+    first("Hel")
+    second = relay.attempt()
+    second("He")
+    second("llo")
+    # Другой ответ не пересылается поверх уже отправленного
+    third = relay.attempt()
+    third("Limit reached")
+
+    assert sent == ["Hel", "lo"]
+
+
+def _snapshot(text: str) -> str:
+    message = {
+        "id": "m1",
+        "author": {"role": "assistant"},
+        "content": {"content_type": "text", "parts": [text]},
+    }
+    return _event({"message": message})
+
+
+async def _observer_answer(events: list, late_events: list, delay: float) -> str:
+    """Ответ клиента по событиям страницы; late_events приходят через delay секунд"""
+    client = BrowserClient()
+    client.page = object()
+    client._events = asyncio.Queue()
+    for event in events:
+        client._events.put_nowait(event)
+
+    async def deliver_late():
+        await asyncio.sleep(delay)
+        for event in late_events:
+            client._events.put_nowait(event)
+
+    late = asyncio.create_task(deliver_late())
+    try:
+        return await client._wait_for_observer_events()
+    finally:
+        late.cancel()
+
+
+def test_dom_done_waits_for_network_stream_end(monkeypatch):
+    """DOM закончил раньше перехваченного потока - ответ берется из дочитанного потока"""
+    monkeypatch.setattr(browser_client, "STREAM_END_GRACE", 1.0)
+    events = [
+        {"type": "sse_start", "stream": 1},
+        {"type": "sse", "stream": 1, "chunk": _snapshot("**Hello**")},
+        {"type": "done", "text": "Hello world"},
+    ]
+    late = [
+        {"type": "sse", "stream": 1, "chunk": _snapshot("**Hello** world")},
+        {"type": "sse_end", "stream": 1},
+    ]
+
+    assert asyncio.run(_observer_answer(events, late, 0.05)) == "**Hello** world"
+
+
+def test_dom_done_falls_back_to_page_text_without_stream_end(monkeypatch):
+    """Конец потока так и не пришел - после короткого ожидания берется текст страницы"""
+    monkeypatch.setattr(browser_client, "STREAM_END_GRACE", 0.1)
+    events = [
+        {"type": "sse_start", "stream": 1},
+        {"type": "sse", "stream": 1, "chunk": _snapshot("Hel")},
+        {"type": "done", "text": "Hello world"},
+    ]
+
+    assert asyncio.run(_observer_answer(events, [], 5)) == "Hello world"
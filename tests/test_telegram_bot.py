@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Тесты HTTP-клиента и обработки обновлений Telegram бота без обращения к Telegram
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+from aiohttp import web
+
+# Добавляем путь к корню проекта для импорта бота
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+import telegram_bot_enhanced  # noqa: E402
+from telegram import Chat, Message, Update  # noqa: E402
+from telegram.error import NetworkError, TimedOut  # noqa: E402
+from telegram_bot_enhanced import (  # noqa: E402
+    PerChatUpdateProcessor,
+    StreamingReply,
+    TelegramBotEnhanced,
+    split_message,
+    utf16_len,
+)
+
+
+class FakeMessage:
+    """Сообщение Telegram, которое запоминает правки и ответы"""
+
+    def __init__(self, text: str, sent: list):
+        self.text = text
+        self.edits = []
+        self.sent = sent
+        sent.append(self)
+
+    async def edit_text(self, text: str):
+        self.edits.append(text)
+        self.text = text
+
+    async def reply_text(self, text: str):
+        return FakeMessage(text, self.sent)
+
+
+async def start_server(monkeypatch, *routes):
+    """Поднимает локальный aiohttp-сервер вместо API сервиса"""
+    app = web.Application()
+    app.router.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(telegram_bot_enhanced, "API_BASE_URL", f"http://127.0.0.1:{port}")
+    return runner
+
+
+def make_update(update_id: int, chat_id: int) -> Update:
+    chat = Chat(id=chat_id, type="private")
+    message = Message(message_id=update_id, date=None, chat=chat, text="hi")
+    return Update(update_id=update_id, message=message)
+
+
+def test_updates_run_in_parallel_across_chats_and_in_order_within_chat():
+    """Разные чаты не ждут друг друга, сообщения одного чата не переставляются"""
+
+    async def scenario():
+        processor = PerChatUpdateProcessor(16)
+        events = []
+
+        async def handle(name: str, delay: float):
+            events.append(f"start {name}")
+            await asyncio.sleep(delay)
+            events.append(f"end {name}")
+
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), handle("a1", 0.05)),
+            processor.process_update(make_update(2, 1), handle("a2", 0.0)),
+            processor.process_update(make_update(3, 2), handle("b1", 0.0)),
+        )
+        return events, processor
+
+    events, processor = asyncio.run(scenario())
+
+    # b1 из другого чата завершается, пока a1 еще выполняется
+    assert events.index("end b1") < events.index("end a1")
+    # a2 начинается только после завершения a1
+    assert events.index("end a1") < events.index("start a2")
+    assert not processor._locks
+
+
+def test_api_request_retries_server_errors_without_blocking(monkeypatch):
+    """Ошибка 5xx повторяется с задержкой через asyncio.sleep, а не time.sleep"""
+    monkeypatch.setattr(telegram_bot_enhanced, "RETRY_DELAY", 0.01)
+    calls = []
+
+    async def health(request):
+        calls.append(request.path)
+        if len(calls) == 1:
+            return web.json_response({"error": "busy"}, status=503)
+        return web.json_response({"status": "healthy"})
+
+    async def scenario():
+        runner = await start_server(monkeypatch, web.get("/health", health))
+        bot = TelegramBotEnhanced()
+        try:
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0)
+
+            ticking = asyncio.create_task(ticker())
+            result = await bot._make_api_request("GET", "/health")
+            ticking.cancel()
+            session = bot._session
+        finally:
+            await bot.close()
+            await runner.cleanup()
+        return result, ticks, session
+
+    result, ticks, session = asyncio.run(scenario())
+
+    assert result == {"status": "healthy"}
+    assert len(calls) == 2
+    # Цикл событий продолжал работать во время ожидания повтора
+    assert ticks > 1
+    assert session.closed
+
+
+def test_auth_status_is_cached_and_refreshed_in_background(monkeypatch):
+    """Свежий статус берется из кэша, устаревший отдается сразу и обновляется в фоне"""
+    monkeypatch.setattr(telegram_bot_enhanced, "AUTH_STATUS_TTL", 60)
+    calls = []
+
+    async def fake_request(method, endpoint, **kwargs):
+        calls.append(endpoint)
+        await asyncio.sleep(0.01)
+        return {"status": "completed", "version": len(calls)}
+
+    async def scenario():
+        bot = TelegramBotEnhanced()
+        monkeypatch.setattr(bot, "_make_api_request", fake_request)
+
+        # Одновременные запросы при пустом кэше объединяются в один вызов
+        first, second = await asyncio.gather(
+            bot._get_auth_status(), bot._get_auth_status()
+        )
+        cached = await bot._get_auth_status()
+        calls_while_fresh = len(calls)
+
+        bot._invalidate_auth_status()
+        stale = await bot._get_auth_status()
+        await bot._auth_refresh
+        refreshed = await bot._get_auth_status()
+        return first, second, cached, calls_while_fresh, stale, refreshed
+
+    first, second, cached, calls_while_fresh, stale, refreshed = asyncio.run(scenario())
+
+    assert first == second == cached == {"status": "completed", "version": 1}
+    assert calls_while_fresh == 1
+    assert stale["version"] == 1
+    assert refreshed["version"] == 2
+    assert calls == ["/auth/status", "/auth/status"]
+
+
+def test_split_message_keeps_filled_parts_stable():
+    """Заполненные части не меняются при дописывании текста"""
+    text = "a" * 6 + "\n" + "b" * 5
+    assert split_message(text, 10) == ["aaaaaa\n", "bbbbb"]
+    assert split_message(text + "ccc", 10)[0] == "aaaaaa\n"
+    assert split_message("x" * 25, 10) == ["x" * 10, "x" * 10, "x" * 5]
+    assert split_message("", 10) == [""]
+
+
+def test_split_message_counts_utf16_units():
+    """Эмодзи занимают две единицы лимита Telegram"""
+    text = "😀" * 6
+    parts = split_message(text, 10)
+    assert parts == ["😀" * 5, "😀"]
+    assert all(utf16_len(part) <= 10 for part in parts)
+    assert utf16_len("🤖 ") == 3
+
+
+def test_streaming_reply_throttles_edits_and_rolls_over(monkeypatch):
+    """Правки не чаще интервала, длинный ответ продолжается новыми сообщениями"""
+    monkeypatch.setattr(telegram_bot_enhanced, "MESSAGE_LIMIT", 12)
+    monkeypatch.setattr(telegram_bot_enhanced, "STREAM_EDIT_INTERVAL", 60)
+
+    async def scenario():
+        sent = []
+        placeholder = FakeMessage("⏳", sent)
+        reply = StreamingReply(placeholder, prefix="> ")
+        for delta in ["hello ", "world ", "and ", "more"]:
+            await reply.append(delta)
+        edits_while_streaming = list(placeholder.edits)
+        await reply.finish()
+        return sent, edits_while_streaming
+
+    sent, edits_while_streaming = asyncio.run(scenario())
+
+    # Первая дельта показана сразу, следующие ждут интервала
+    assert edits_while_streaming == ["> hello "]
+    assert [message.text for message in sent] == ["> hello worl", "> d and more"]
+
+
+def test_stream_completion_reads_sse_deltas(monkeypatch):
+    """Фрагменты SSE из /v1/chat/completions дописываются в ответ"""
+    monkeypatch.setattr(telegram_bot_enhanced, "STREAM_EDIT_INTERVAL", 0)
+    bodies = []
+
+    async def completions(request):
+        bodies.append(await request.json())
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for delta in [{"role": "assistant", "content": ""}, {"content": "При"}, {"content": "вет"}, {}]:
+            chunk = {"choices": [{"index": 0, "delta": delta}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def scenario():
+        runner = await start_server(monkeypatch, web.post("/v1/chat/completions", completions))
+        bot = TelegramBotEnhanced()
+        try:
+            placeholder = FakeMessage("⏳", [])
+            reply = StreamingReply(placeholder)
+            answer = await bot._stream_completion("hi", {}, reply)
+        finally:
+            await bot.close()
+            await runner.cleanup()
+        return answer, placeholder
+
+    answer, placeholder = asyncio.run(scenario())
+
+    assert answer == "Привет"
+    assert bodies[0]["stream"] is True
+    assert placeholder.edits == ["🤖 При", "🤖 Привет"]
+
+
+def test_stream_completion_falls_back_on_error_event(monkeypatch):
+    """Событие error после части ответа означает, что поток не дошел до конца"""
+    monkeypatch.setattr(telegram_bot_enhanced, "STREAM_EDIT_INTERVAL", 0)
+
+    async def completions(request):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk = {"choices": [{"index": 0, "delta": {"content": "При"}}]}
+        await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        error = {"error": {"message": "❌ Ошибка", "type": "bridge_error"}}
+        await response.write(f"data: {json.dumps(error)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def scenario():
+        runner = await start_server(monkeypatch, web.post("/v1/chat/completions", completions))
+        bot = TelegramBotEnhanced()
+        try:
+            reply = StreamingReply(FakeMessage("⏳", []))
+            return await bot._stream_completion("hi", {}, reply)
+        finally:
+            await bot.close()
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) is None
+
+
+class FlakyMessage(FakeMessage):
+    """Сообщение, правка которого несколько раз подряд падает с сетевой ошибкой"""
+
+    def __init__(self, text: str, sent: list, failures: int):
+        super().__init__(text, sent)
+        self.failures = failures
+
+    async def edit_text(self, text: str):
+        if self.failures:
+            self.failures -= 1
+            raise TimedOut() if self.failures % 2 else NetworkError("connection reset")
+        await super().edit_text(text)
+
+
+def test_streaming_reply_survives_network_errors(monkeypatch):
+    """Сетевые ошибки Telegram не прерывают поток, итоговый ответ показывается"""
+    monkeypatch.setattr(telegram_bot_enhanced, "STREAM_EDIT_INTERVAL", 0)
+
+    async def scenario():
+        placeholder = FlakyMessage("⏳", [], failures=3)
+        reply = StreamingReply(placeholder, prefix="")
+        await reply.append("Hel")
+        await reply.append("lo")
+        await reply.finish()
+        return placeholder
+
+    placeholder = asyncio.run(scenario())
+
+    assert placeholder.text == "Hello"
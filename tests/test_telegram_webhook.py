@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Тесты режима webhook: общий журнал обновлений и состояние диалогов для
+нескольких процессов бота, с заглушками Telegram Bot API и API сервиса
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+from aiohttp import web
+
+# Добавляем путь к корню проекта для импорта бота
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+
+import telegram_bot_enhanced  # noqa: E402
+from telegram_bot_enhanced import (  # noqa: E402
+    CODE,
+    CONVERSATION_NAME,
+    WEBHOOK_PATH,
+    TelegramBotEnhanced,
+)
+from telegram_bot_state import SQLitePersistence, UpdateInbox, connect  # noqa: E402
+
+
+def test_inbox_leases_chats_and_keeps_update_order(tmp_path):
+    """Чат обрабатывает один процесс, обновления чата идут по update_id"""
+    path = str(tmp_path / "state.sqlite3")
+    first, second = UpdateInbox(path), UpdateInbox(path, lease_seconds=0.05)
+
+    assert first.put(2, 10, {"n": 2})
+    assert first.put(1, 10, {"n": 1})
+    assert not second.put(1, 10, {"n": 1})
+    first.put(3, 20, {"n": 3})
+
+    assert first.claim_chat("a") == 10
+    # Арендованный чат другому процессу не достается
+    assert second.claim_chat("b") == 20
+    assert second.claim_chat("b") is None
+
+    assert first.next_update(10) == (1, {"n": 1})
+    first.done(1)
+    assert first.next_update(10) == (2, {"n": 2})
+
+    # Отпущенный чат с необработанными обновлениями снова доступен
+    second.release(20, "b")
+    assert second.claim_chat("b") == 20
+    assert second.claim_chat("c") is None
+    assert not second.renew(10, "b")
+
+    # Аренда упавшего процесса истекает, и чат забирает другой
+    time.sleep(0.06)
+    assert second.claim_chat("c") == 20
+    assert second.get_stats()["pending_updates"] == 2
+
+
+def test_claim_waiting_for_sqlite_lock_does_not_block_event_loop(tmp_path):
+    """Пока другой процесс держит блокировку файла, event loop продолжает работать"""
+    path = str(tmp_path / "state.sqlite3")
+    inbox = UpdateInbox(path)
+    inbox.put(1, 10, {"update_id": 1})
+    other = connect(path)
+
+    async def scenario():
+        other.execute("BEGIN IMMEDIATE")
+        claim = asyncio.create_task(asyncio.to_thread(inbox.claim_chat, "a"))
+        ticks = 0
+        while ticks < 10:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not claim.done()
+        other.execute("COMMIT")
+        return ticks, await claim
+
+    assert asyncio.run(scenario()) == (10, 10)
+    other.close()
+
+
+class SlowApplication:
+    """Application, обработка обновления в котором дольше аренды чата"""
+
+    bot = None
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.processed = []
+
+    async def process_update(self, update):
+        self.processed.append(update.update_id)
+        await asyncio.sleep(self.delay)
+
+    async def update_persistence(self):
+        pass
+
+
+def test_lease_is_renewed_while_update_outlives_it(tmp_path):
+    """Долгий ответ не отдает чат другому процессу и не обрабатывается дважды"""
+    path = str(tmp_path / "state.sqlite3")
+    lease = 0.3
+
+    async def scenario():
+        bot = TelegramBotEnhanced()
+        bot.owner = "worker-a"
+        bot.inbox = UpdateInbox(path, lease_seconds=lease)
+        bot.application = SlowApplication(delay=lease * 3)
+        bot._load_conversation_state = lambda chat_id: asyncio.sleep(0)
+        other = UpdateInbox(path, lease_seconds=lease)
+        bot.inbox.put(1, 10, message_update(1, "long question"))
+
+        assert bot.inbox.claim_chat(bot.owner) == 10
+        processing = asyncio.create_task(bot._process_chat(10))
+        claims = []
+        while not processing.done():
+            await asyncio.sleep(lease / 2)
+            claims.append(await asyncio.to_thread(other.claim_chat, "worker-b"))
+        await processing
+        return bot.application.processed, claims, other.get_stats()["pending_updates"]
+
+    processed, claims, pending = asyncio.run(scenario())
+
+    assert processed == [1]
+    # Пока идет обработка, чат занят; после нее обновлений не осталось
+    assert len(claims) >= 5
+    assert set(claims) == {None}
+    assert pending == 0
+
+
+def test_persistence_stores_conversation_state_per_chat(tmp_path):
+    async def scenario():
+        persistence = SQLitePersistence(str(tmp_path / "state.sqlite3"))
+        await persistence.update_conversation("auth", (10, 1), CODE)
+        await persistence.update_conversation("auth", (20, 2), CODE)
+        await persistence.update_conversation("auth", (20, 2), None)
+        return (
+            await persistence.get_conversations("auth"),
+            await persistence.load_chat_conversations("auth", 10),
+        )
+
+    conversations, chat = asyncio.run(scenario())
+    assert conversations == {(10, 1): CODE}
+    assert chat == {(10, 1): CODE}
+
+
+async def start_server(*routes) -> tuple[web.AppRunner, str]:
+    app = web.Application()
+    app.router.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def message_update(update_id: int, text: str, chat_id: int = 10) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "text": text,
+            **(
+                {"entities": [{"type": "bot_command", "offset": 0, "length": len(text)}]}
+                if text.startswith("/")
+                else {}
+            ),
+        },
+    }
+
+
+def test_conversation_continues_on_another_worker(tmp_path, monkeypatch):
+    """/start на одном процессе, код подтверждения - на другом"""
+    path = str(tmp_path / "state.sqlite3")
+    monkeypatch.setattr(telegram_bot_enhanced, "SQLitePersistence", lambda: SQLitePersistence(path))
+    monkeypatch.setattr(telegram_bot_enhanced, "UpdateInbox", lambda: UpdateInbox(path))
+    monkeypatch.setattr(telegram_bot_enhanced, "TELEGRAM_WEBHOOK_URL", "")
+
+    sent = []
+    codes = []
+
+    async def telegram_method(request):
+        method = request.match_info["method"]
+        if method == "getMe":
+            return web.json_response(
+                {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Bot", "username": "bot"}}
+            )
+        if method == "sendMessage":
+            data = await request.post() if request.content_type != "application/json" else await request.json()
+            sent.append(data["text"])
+            message = {
+                "message_id": 1000 + len(sent),
+                "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data["text"],
+            }
+            return web.json_response({"ok": True, "result": message})
+        return web.json_response({"ok": True, "result": True})
+
+    async def auth_status(request):
+        return web.json_response({"status": "waiting_code"})
+
+    async def auth_code(request):
+        codes.append((await request.json())["code"])
+        return web.json_response({"status": "ok"})
+
+    async def scenario():
+        telegram, telegram_url = await start_server(
+            web.post("/bot{token}/{method}", telegram_method)
+        )
+        bridge, bridge_url = await start_server(
+            web.get("/auth/status", auth_status), web.post("/auth/code", auth_code)
+        )
+        monkeypatch.setattr(telegram_bot_enhanced, "TELEGRAM_API_URL", f"{telegram_url}/bot")
+        monkeypatch.setattr(telegram_bot_enhanced, "API_BASE_URL", bridge_url)
+
+        workers = [TelegramBotEnhanced(), TelegramBotEnhanced()]
+        workers[0].owner, workers[1].owner = "worker-a", "worker-b"
+        apps = [worker.create_webhook_app() for worker in workers]
+        clients = [
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bot")
+            for app in apps
+        ]
+        for worker in workers:
+            await worker.start_webhook()
+        # Второй процесс пока не разбирает журнал
+        workers[1]._drain_task.cancel()
+        try:
+            response = await clients[0].post(WEBHOOK_PATH, json=message_update(1, "/start"))
+            assert response.json() == {"ok": True}
+            while workers[0].inbox.get_stats()["pending_updates"]:
+                await asyncio.sleep(0.05)
+            state_after_start = await workers[1].application.persistence.load_chat_conversations(
+                CONVERSATION_NAME, 10
+            )
+
+            workers[0]._drain_task.cancel()
+            workers[1]._drain_task = asyncio.create_task(workers[1]._drain_inbox())
+            await clients[1].post(WEBHOOK_PATH, json=message_update(2, "123456"))
+            while workers[1].inbox.get_stats()["pending_updates"]:
+                await asyncio.sleep(0.05)
+        finally:
+            for worker in workers:
+                await worker.stop_webhook()
+            for client in clients:
+                await client.aclose()
+            await telegram.cleanup()
+            await bridge.cleanup()
+        return state_after_start
+
+    state_after_start = asyncio.run(scenario())
+
+    assert state_after_start == {(10, 10): CODE}
+    assert codes == ["123456"]
+    assert any("введите код" in text for text in sent)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Тесты переключения на запасной браузер без перезапуска Chromium на пути запроса
+"""
+
+import asyncio
+import os
+import sys
+
+# Добавляем путь к приложению для импорта
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+)
+
+from services import chatgpt_bridge
+from services.chatgpt_bridge import ChatGPTBridgeService
+
+
+class FakeClient:
+    """Клиент браузера, который только отмечает вызовы"""
+
+    created = []
+
+    def __init__(self, **kwargs):
+        self.alive = True
+        self.closed = False
+        self.page = None
+        self.restart_browser_on_failure = True
+        self.auth_status = {"status": "completed"}
+        FakeClient.created.append(self)
+
+    async def initialize_with_session(self) -> bool:
+        return True
+
+    async def load_session_cookies(self) -> bool:
+        return True
+
+    async def get_auth_status(self):
+        return self.auth_status
+
+    def is_browser_alive(self) -> bool:
+        return self.alive and not self.closed
+
+    async def close(self):
+        await asyncio.sleep(0.01)
+        self.closed = True
+
+
+def test_restart_swaps_to_prepared_standby(monkeypatch):
+    """Перезапуск подменяет браузер запасным, а старый закрывается в фоне"""
+    monkeypatch.setattr(chatgpt_bridge, "WARM_STANDBY", True)
+    monkeypatch.setattr(chatgpt_bridge, "BrowserClient", FakeClient)
+    FakeClient.created = []
+
+    async def scenario():
+        service = ChatGPTBridgeService()
+        service._initialized = True
+        account = service.accounts.primary
+        failed = service.browser
+
+        service._schedule_standby(account)
+        await account.standby_task
+        standby = account.standby
+
+        await service._restart_service("тест", account)
+        swapped = service.browser
+        closed_before_teardown = failed.closed
+
+        # Старый браузер закрыт, новый запасной подготовлен вне пути запроса
+        await asyncio.sleep(0.05)
+        return failed, standby, swapped, closed_before_teardown, service
+
+    failed, standby, swapped, closed_before_teardown, service = asyncio.run(scenario())
+    account = service.accounts.primary
+
+    assert swapped is standby
+    assert service.pool.primary is standby
+    assert not closed_before_teardown
+    assert failed.closed
+    assert account.standby is not None and account.standby is not standby
+    assert not standby.restart_browser_on_failure